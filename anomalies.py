@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+# Ways of measuring how far the latest hour of a series is from the hours before it (see kpi_store.window_stats)
+METHODS = ('zscore', 'mad')
+
+
+def anomaly_scores(baselines, min_periods):
+    """
+    Score the latest bucket of each series against its baseline.
+
+    Args:
+        baselines (pd.DataFrame): Output of a store's `baselines`.
+        min_periods (int): Fewest non-empty buckets a baseline needs to be trusted.
+
+    Returns:
+        pd.DataFrame: The baselines with a 'score' column: the distance of 'value' from
+        'baseline' in units of 'scale'. Series with too short a baseline, or one that
+        did not vary, have no score.
+
+    """
+    usable = (baselines['periods'] >= min_periods) & (baselines['scale'] > 0)
+    scores = baselines.assign(cell_id=baselines['cell_id'].astype(object), pi=baselines['pi'].astype(object))
+    scores['score'] = ((scores['value'] - scores['baseline']) / scores['scale']).where(usable)
+    return scores
+
+
+class AnomalyScan:
+    """
+    Anomaly scores of the latest hour of every (cell_id, pi) series of a store.
+
+    The mean of each series' latest hour is compared with the `window` hours
+    before it, either in standard deviations from their mean ('zscore') or in
+    scaled median absolute deviations from their median ('mad'), which a few
+    outliers in the window do not inflate. The store's `baselines` computes the
+    statistics of every series in one vectorized pass. When rows are added,
+    only the series they belong to are scanned again. Like the stores, a scan
+    is not modified once built; `update` returns a new one.
+
+    Only the series that reported within `max_age` of the newest data are
+    scanned: the others no longer tell how their cell is doing now.
+
+    Args:
+        scores (pd.DataFrame): Output of `anomaly_scores`, one row per series.
+        window (int): Hours before the latest one that form its baseline.
+        method (str): One of METHODS.
+        min_periods (int): Fewest non-empty hours a baseline needs to be trusted.
+        max_age (pd.Timedelta): Age, relative to the newest data, beyond which a series is left out.
+
+    """
+
+    def __init__(self, scores, window, method, min_periods, max_age):
+        self.scores = scores
+        self.window = window
+        self.method = method
+        self.min_periods = min_periods
+        self.max_age = max_age
+
+    @classmethod
+    def scan(cls, store, window=168, method='zscore', min_periods=24, max_age=pd.Timedelta(days=1)):
+        """
+        Score the latest hour of every series of a store.
+
+        Args:
+            store (KPIStore or DuckDBStore): Store to scan.
+            window (int): Hours before the latest one that form its baseline.
+            method (str): One of METHODS.
+            min_periods (int): Fewest non-empty hours a baseline needs to be trusted.
+            max_age (pd.Timedelta): Age, relative to the newest data, beyond which a series is left out.
+
+        Returns:
+            AnomalyScan: The scores of the store's series.
+
+        """
+        if method not in METHODS:
+            raise ValueError(f'Unknown anomaly scoring method {method!r}; expected one of {METHODS}')
+        baselines = store.baselines(window, method, since=store.max_date - max_age) if len(store) else None
+        scores = anomaly_scores(baselines, min_periods) if baselines is not None else pd.DataFrame(
+            columns=['cell_id', 'pi', 'date_time', 'value', 'baseline', 'scale', 'periods', 'score'])
+        return cls(scores, window, method, min_periods, max_age)
+
+    def update(self, store, rows=None):
+        """
+        Return the scan of a store that rows were added to.
+
+        Args:
+            store (KPIStore or DuckDBStore): Store holding the added rows.
+            rows (pd.DataFrame, optional): The added rows, with 'cell_id' and 'pi'
+                columns. When omitted, every series is scanned again.
+
+        Returns:
+            AnomalyScan: The updated scan.
+
+        """
+        if rows is None:
+            return AnomalyScan.scan(store, self.window, self.method, self.min_periods, self.max_age)
+        if not len(rows):
+            return self
+        keys = list(rows[['cell_id', 'pi']].drop_duplicates().itertuples(index=False, name=None))
+        since = store.max_date - self.max_age
+        fresh = anomaly_scores(store.baselines(self.window, self.method, keys=keys, since=since), self.min_periods)
+        # The rescanned series replace their old scores, and the series that went quiet are dropped
+        scores = self.scores[self.scores['date_time'] >= since]
+        replaced = pd.MultiIndex.from_arrays([scores['cell_id'], scores['pi']]).isin(keys)
+        scores = pd.concat([scores[~replaced], fresh], ignore_index=True)
+        return AnomalyScan(scores, self.window, self.method, self.min_periods, self.max_age)
+
+    def worst_cells(self, limit=10):
+        """
+        Rank the cells by the most anomalous of their PIs.
+
+        Args:
+            limit (int): Number of cells to return.
+
+        Returns:
+            pd.DataFrame: The series with the largest absolute score of each of the
+            `limit` worst cells, worst first, with the columns of `anomaly_scores`.
+
+        """
+        scored = self.scores.dropna(subset=['score'])
+        order = np.argsort(-scored['score'].abs().to_numpy(), kind='stable')
+        return scored.iloc[order].drop_duplicates('cell_id').head(limit).reset_index(drop=True)
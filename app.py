@@ -1,249 +1,735 @@
 import pandas as pd
-from dash import Dash, dcc, html, Input, Output, State
+from dash import Dash, dcc, html, Input, Output, State, MATCH, ALL, ClientsideFunction, ctx, no_update
 import dash_bootstrap_components as dbc
 import plotly.graph_objs as go
-import plotly.express as px
 import numpy as np
-from datetime import timedelta
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
-from plotly.subplots import make_subplots
 from dash import dash_table
-from dash.dash_table.Format import Group
+import os
+import threading
+import diskcache
+import flask
+from urllib.parse import parse_qs, urlencode
 from functions import *
+from background import SharedJobManager
+from instrumentation import instrument_server
+from export import EXPORT_FORMATS, arrow_chunks, csv_chunks, gzip_chunks
+
+# Run heavy callbacks as background jobs in separate processes, keeping their results in a local disk cache.
+# Results are keyed by the callback inputs and the number of rows loaded, so ingested rows invalidate them.
+background_callback_manager = SharedJobManager(
+    diskcache.Cache(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data', '.cache', 'jobs')),
+    cache_by=[lambda: current_data_options()[4]],
+    expire=600,
+    metrics=metrics,
+)
 
 # Initialize the Dash app with Bootstrap for a cleaner interface and easier layout design
-app = Dash(__name__, external_stylesheets=[dbc.themes.DARKLY])
+app = Dash(__name__, external_stylesheets=[dbc.themes.DARKLY], background_callback_manager=background_callback_manager)
+
+# Serve the stage timings at /metrics and in Server-Timing headers when KPI_INSTRUMENTATION=1
+if metrics.enabled:
+    instrument_server(app.server, metrics)
 
 # # Expose the server for WSGI
 # server = app.server
 
 # Define Dash app layout, containing a 5G NR KPI Dashboard title and a control panel with dropdowns for cell selection, KPI selection,
 # date range selection and date resampling frequency. Also contains several tabs for different types of charts (line, bar, scatter, heatmap, box plot, histogram).
-app.layout = dbc.Container([
-    dbc.Row([
-        dbc.Col([
-            html.H1("5G NR KPI Dashboard",
-                     className="text-center my-4 title"),
-        ], width=12),
-    ]),
-    dbc.Row([
-        dbc.Col([
-            dbc.Card([
-                dbc.CardHeader("Control Panel", className="mb-3"),
-                dbc.CardBody([
-                    html.H6("Select Cell", className="mb-4"),
-                    dbc.Row([
-                        dbc.Col([
-                            dcc.Dropdown(
-                                id='cell_dropdown',
-                                options=[{'label': cell, 'value': cell} for cell in cell_ids],
-                                multi=False,
-                                clearable=False,
-                                className="mb-4"
-                            ),
+def build_layout(cell_ids, pis, min_date, max_date, rows, figure):
+    """
+    Build the page layout for the given data.
+
+    Args:
+        cell_ids (list): Cells offered in 'cell_dropdown'.
+        pis (list): PIs offered in 'pi_dropdown'.
+        min_date (datetime): First date of the data.
+        max_date (datetime): Last date of the data.
+        rows (int): Number of rows loaded.
+        figure (go.Figure): Chart shown before the first update.
+
+    Returns:
+        dbc.Container: The page layout.
+    """
+    return dbc.Container([
+        # Links such as /?cell_id=...&pi=... open a series, as the anomalies API does
+        dcc.Location(id='url', refresh=False),
+        dbc.Row([
+            dbc.Col([
+                html.H1("5G NR KPI Dashboard",
+                         className="text-center my-4 title"),
+            ], width=12),
+        ]),
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardHeader("Control Panel", className="mb-3"),
+                    dbc.CardBody([
+                        html.H6("Select Cell", className="mb-4"),
+                        dbc.Row([
+                            dbc.Col([
+                                dcc.Dropdown(
+                                    id='cell_dropdown',
+                                    options=[{'label': cell, 'value': cell} for cell in cell_ids],
+                                    multi=True,
+                                    clearable=False,
+                                    className="mb-4"
+                                ),
+                            ]),
                         ]),
-                    ]),
-                    html.H6("Select KPI", className="mb-4"),
-                    dbc.Row([
-                        dbc.Col([
-                            dcc.Dropdown(
-                                id='pi_dropdown',
-                                options=[{'label': pi, 'value': pi} for pi in pis],
-                                multi=True,
-                                clearable=False,
-                                className="mb-4"
-                            ),
+                        html.H6("Select KPI", className="mb-4"),
+                        dbc.Row([
+                            dbc.Col([
+                                dcc.Dropdown(
+                                    id='pi_dropdown',
+                                    options=[{'label': pi, 'value': pi} for pi in pis],
+                                    multi=True,
+                                    clearable=False,
+                                    className="mb-4"
+                                ),
+                            ]),
                         ]),
-                    ]),
-                    html.H6("Select time range", className="mb-4"),
-                    dbc.Row([
-                        dbc.Col([
-                            dcc.DatePickerRange(
-                                id='date_picker',
-                                min_date_allowed=min_date,
-                                max_date_allowed=max_date,
-                                start_date=min_date,
-                                end_date=max_date,
-                                className="mb-4"
-                            ),
+                        html.H6("Select time range", className="mb-4"),
+                        dbc.Row([
+                            dbc.Col([
+                                dcc.DatePickerRange(
+                                    id='date_picker',
+                                    min_date_allowed=min_date,
+                                    max_date_allowed=max_date,
+                                    start_date=min_date,
+                                    end_date=max_date,
+                                    className="mb-4"
+                                ),
+                            ]),
                         ]),
-                    ]),
-                    html.H6("Select date resampling", className="mb-4"),
-                    dbc.Row([
-                        dbc.Col([
-                            dcc.Dropdown(
-                                id='resample_dropdown',
-                                options=[{'label': 'Hourly', 'value': 'H'},
-                                         {'label': 'Daily', 'value': 'D'},
-                                         {'label': 'Weekly', 'value': 'W'}],
-                                value='D',
-                                className="mb-4"
-                            ),
+                        html.H6("Select date resampling", className="mb-4"),
+                        dbc.Row([
+                            dbc.Col([
+                                dcc.Dropdown(
+                                    id='resample_dropdown',
+                                    options=[{'label': 'Hourly', 'value': 'H'},
+                                             {'label': 'Daily', 'value': 'D'},
+                                             {'label': 'Weekly', 'value': 'W'}],
+                                    value='D',
+                                    className="mb-4"
+                                ),
+                            ]),
+                        ]),
+                        html.H6("Compare cells", className="mb-4"),
+                        dbc.Row([
+                            dbc.Col([
+                                dbc.RadioItems(
+                                    id='compare_mode',
+                                    options=[{'label': 'Overlay', 'value': 'overlay'},
+                                             {'label': 'Small multiples', 'value': 'grid'}],
+                                    value='overlay',
+                                    className="mb-4"
+                                ),
+                            ]),
+                        ]),
+                        html.H6("Heatmap", className="mb-4"),
+                        dbc.Row([
+                            dbc.Col([
+                                dbc.RadioItems(
+                                    id='heatmap_scope',
+                                    options=[{'label': 'Selected cells', 'value': 'cells'},
+                                             {'label': 'Whole network', 'value': 'network'}],
+                                    value='cells',
+                                    className="mb-2"
+                                ),
+                                dcc.Dropdown(
+                                    id='heatmap_sort',
+                                    options=[{'label': f'Sort cells by {aggregate}', 'value': aggregate} for aggregate in heatmap_aggregates],
+                                    value='mean',
+                                    clearable=False,
+                                    className="mb-4"
+                                ),
+                            ]),
+                        ]),
+                        html.H6("Correlation", className="mb-4"),
+                        dbc.Row([
+                            dbc.Col([
+                                dbc.RadioItems(
+                                    id='correlation_method',
+                                    options=[{'label': method.capitalize(), 'value': method} for method in CORRELATION_METHODS],
+                                    value='pearson',
+                                    className="mb-2"
+                                ),
+                                dbc.RadioItems(
+                                    id='correlation_scope',
+                                    options=[{'label': 'Per cell', 'value': 'cell'},
+                                             {'label': 'Cells pooled', 'value': 'pooled'}],
+                                    value='cell',
+                                    className="mb-2"
+                                ),
+                                dbc.InputGroup([
+                                    dbc.InputGroupText("Lags"),
+                                    dbc.Input(id='correlation_lag', type='number', min=0, max=max_correlation_lag, step=1, value=0),
+                                ], size='sm', className="mb-4"),
+                            ]),
                         ]),
                     ]),
-                ]),
-            ], className="mb-4"),
-        ], width=3),
-        dbc.Col([
-            dbc.Card([
-                dbc.CardHeader(
-                    dbc.Tabs(
-                        id="tabs",
-                        active_tab='tab-line',
-                        children=[
-                            dbc.Tab(label='Line Chart', tab_id='tab-line'),
-                            dbc.Tab(label='Bar Chart', tab_id='tab-bar'),
-                            dbc.Tab(label='Scatter Chart', tab_id='tab-scatter'),
-                            dbc.Tab(label='Heatmap', tab_id='tab-heatmap'),
-                            dbc.Tab(label='Box Plot', tab_id='tab-box'),
-                            dbc.Tab(label='Histogram', tab_id='tab-hist'),
+                ], className="mb-4"),
+                # Cells whose latest hour departs most from their recent history; a row opens its line chart
+                dbc.Card([
+                    dbc.CardHeader("Worst cells now", className="mb-3"),
+                    dbc.CardBody([
+                        dash_table.DataTable(
+                            id='worst_cells',
+                            columns=[{'name': 'Cell', 'id': 'cell_id'}, {'name': 'KPI', 'id': 'pi'},
+                                     {'name': 'Score', 'id': 'score'}],
+                            style_cell={'backgroundColor': 'rgb(50, 50, 50)', 'color': 'white', 'textAlign': 'center',
+                                        'cursor': 'pointer'},
+                            style_header={'backgroundColor': 'rgb(30, 30, 30)', 'color': 'white', 'textAlign': 'center'},
+                            style_table={'width': '100%'},
+                        ),
+                    ]),
+                ], className="mb-4"),
+            ], width=3),
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardHeader(
+                        dbc.Tabs(
+                            id="tabs",
+                            active_tab='tab-line',
+                            children=[
+                                dbc.Tab(label='Line Chart', tab_id='tab-line'),
+                                dbc.Tab(label='Bar Chart', tab_id='tab-bar'),
+                                dbc.Tab(label='Scatter Chart', tab_id='tab-scatter'),
+                                dbc.Tab(label='Heatmap', tab_id='tab-heatmap'),
+                                dbc.Tab(label='Box Plot', tab_id='tab-box'),
+                                dbc.Tab(label='Histogram', tab_id='tab-hist'),
+                                dbc.Tab(label='Correlation', tab_id='tab-corr'),
+                            ]),
+                        className='card-header'
+                    ),
+                    dbc.CardBody([
+                        # Progress of the charts being built, and a button to stop building them
+                        dbc.Row([
+                            dbc.Col(dbc.Progress(id='render_progress', value=0, max=1, striped=True, animated=True,
+                                                 style={'visibility': 'hidden'}), className="my-auto"),
+                            dbc.Col(dbc.Button("Cancel", id='cancel_render', size='sm', color='secondary', disabled=True),
+                                    width='auto'),
+                        ], className="mb-2"),
+                        html.Div(id='tabs-content',
+                                 children=dcc.Loading(
+                                     type="default",
+                                     children=dcc.Graph(
+                                         figure=figure,
+                                         config={'displayModeBar': False},
+                                         id='graph'
+                                     ))
+                                 ),
+                        # Network heatmaps are rendered on the server, and shown in place of the tab's charts
+                        html.Div(id='network-heatmap-content', style={'display': 'none'}),
+                        # Correlations are computed on the server; a pair clicked in a matrix is plotted from the browser's data
+                        html.Div(id='correlation-content', style={'display': 'none'}, children=[
+                            dcc.Loading(html.Div(id='correlation-matrices'), type="default"),
+                            dcc.Graph(id='correlation_scatter'),
                         ]),
-                    className='card-header'
-                ),
-                dbc.CardBody([
-                    html.Div(id='tabs-content',
-                             children=dcc.Loading(
-                                 type="default",
-                                 children=dcc.Graph(
-                                     figure=update_line_chart(cell_ids[0], [pis[0]], (min_date, max_date), 'D'),
-                                     config={'displayModeBar': False},
-                                     id='graph'
-                                 ))
-                             )
-                ]),
-                dbc.CardBody([
-                    html.Div(id='summary-table-container'),
-                ]),
-            ], className="mb-4"),
-        ], width=9),
-    ]),
-], fluid=True)
-
-# Define callback function to update the graph when the selected options in the control panel are changed
+                    ]),
+                    dbc.CardBody([
+                        html.Div(id='summary-table-container'),
+                    ]),
+                ], className="mb-4"),
+            ], width=9),
+        ]),
+        # Browser viewport width, used to size the point budget of time-series charts
+        dcc.Store(id='viewport'),
+        # Resampled data of the selection, drawn in the browser by assets/charts.js, and the styling of its charts
+        dcc.Store(id='chart_data'),
+        dcc.Store(id='chart_theme', data=chart_theme()),
+        # Options of the network heatmaps on display, set in the browser only while they are shown
+        dcc.Store(id='network_heatmap_request'),
+        dcc.Store(id='correlation_request'),
+        # Checks for rows ingested from the drop directory, and the data the page currently shows
+        dcc.Interval(id='ingest_interval', interval=ingest_interval * 1000, disabled=not drop_dir),
+        dcc.Store(id='data_version', data={'rows': rows, 'max_date': max_date}),
+    ], fluid=True)
+
+# Monitoring endpoints, answered without waiting for the data
+probe_paths = ('/healthz', '/readyz', '/metrics')
+
+def serve_layout():
+    """
+    Build the page layout from the data loaded when the page is requested, waiting for it if needed.
+
+    Returns:
+        dbc.Container: The page layout.
+    """
+    # Dash validates the layout on a worker's first request, which may be a probe that must not wait for the data
+    if flask.has_request_context() and flask.request.path in probe_paths and not dataset_ready():
+        return build_layout([], [], None, None, 0, None)
+    cell_ids, pis, min_date, max_date, rows = current_data_options()
+    figure = render_chart('tab-line', cell_ids[0], [pis[0]], (min_date, max_date), 'D')
+    return build_layout(cell_ids, pis, min_date, max_date, rows, figure)
+
+# Callbacks are validated against a layout without data, so that the data is only loaded when a page is requested
+app.validation_layout = build_layout([], [], None, None, 0, None)
+app.layout = serve_layout
+
+warm_up_thread = None
+warm_up_lock = threading.Lock()
+
+def warm_up():
+    """
+    Start loading the data and building the first page in the background, unless already started.
+
+    With KPI_LAZY_LOAD=1 this is started by the first readiness check, and can
+    be started earlier from a server hook, e.g. gunicorn's post_worker_init.
+    """
+    global warm_up_thread
+    with warm_up_lock:
+        if warm_up_thread is None:
+            warm_up_thread = threading.Thread(target=serve_layout, daemon=True, name='kpi-warm-up')
+            warm_up_thread.start()
+
+# Liveness: the worker is up and serving requests, whether or not the data is loaded
+@app.server.route('/healthz')
+def liveness():
+    return 'ok'
+
+# Readiness: the data is loaded and requests are served without waiting for it
+@app.server.route('/readyz')
+def readiness():
+    if dataset_ready():
+        return 'ready'
+    warm_up()
+    return 'loading', 503
+
+# Other requests wait for the data, which is loaded at startup unless KPI_LAZY_LOAD=1
+@app.server.before_request
+def wait_for_dataset():
+    if flask.request.path not in probe_paths:
+        load_dataset()
+
+# Anomalies: the worst cells now as JSON, each with a link opening its line chart around the anomaly
+@app.server.route('/api/anomalies')
+def anomalies_api():
+    limit = flask.request.args.get('limit', 10, type=int)
+    cells = worst_cells(max(limit, 0))
+    for cell in cells:
+        query = {key: cell[key] for key in ('cell_id', 'pi', 'start_date', 'end_date')}
+        cell['url'] = app.get_relative_path('/') + '?' + urlencode(query)
+    return flask.jsonify({'window': anomaly_window, 'method': anomaly_method, 'cells': cells})
+
+# Exports streamed at once by this worker
+export_slots = threading.BoundedSemaphore(export_concurrency)
+
+# Export: the data of cells and PIs over a date range, streamed a chunk at a time as CSV or Arrow IPC
+@app.server.route('/api/export')
+def export_data():
+    args = flask.request.args
+    selected_cells, selected_pis = args.getlist('cell_id'), args.getlist('pi')
+    frequency = args.get('frequency', 'H')
+    export_format = args.get('format', 'csv')
+    if not selected_cells or not selected_pis:
+        return 'cell_id and pi are required', 400
+    if frequency not in ROLLUP_FREQUENCIES + ('raw',):
+        return f'frequency must be one of {", ".join(ROLLUP_FREQUENCIES)} or raw', 400
+    if export_format not in EXPORT_FORMATS:
+        return f'format must be one of {", ".join(EXPORT_FORMATS)}', 400
+    first_date, last_date = current_data_options()[2:4]
+    try:
+        # Cover the whole selected days, as the charts do
+        date_range = (pd.to_datetime(args.get('start_date', first_date)).replace(hour=0, minute=0),
+                      pd.to_datetime(args.get('end_date', last_date)).replace(hour=23, minute=59))
+    except (ValueError, TypeError):
+        return 'start_date and end_date must be dates', 400
+    if date_range[0] > date_range[1]:
+        return 'start_date must not be after end_date', 400
+    # Large exports must not take every worker thread from interactive users
+    if not export_slots.acquire(blocking=False):
+        return flask.Response('Too many exports in progress', status=429, headers={'Retry-After': '30'})
+    frames = export_frames(selected_cells, selected_pis, date_range, None if frequency == 'raw' else frequency)
+    chunks = csv_chunks(frames) if export_format == 'csv' else arrow_chunks(frames)
+    # The body is compressed or not depending on Accept-Encoding, which caches must key on
+    headers = {'Content-Disposition': f'attachment; filename=kpi-export.{export_format}', 'Vary': 'Accept-Encoding'}
+    # A quality of 0 ('gzip;q=0') refuses gzip
+    if flask.request.accept_encodings['gzip'] > 0:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    response = flask.Response(chunks, mimetype=EXPORT_FORMATS[export_format], headers=headers)
+    # Called once the response was sent or the client went away
+    response.call_on_close(export_slots.release)
+    return response
+
+# Record the viewport width once the page has loaded
+app.clientside_callback(
+    "function(_) { return window.innerWidth; }",
+    Output('viewport', 'data'),
+    Input('tabs', 'id'))
+
+# Define callback function to send the resampled data of the selection to the browser and to update the summary tables when the
+# selected options in the control panel are changed. The tabs are drawn from that data in the browser, so switching tabs needs no request.
+# It runs as a background job: it reports its progress, is cancelled when the options change again or 'Cancel' is
+# clicked, and identical requests from several users share one job.
 @app.callback(
-    Output('graph', 'figure'),
-    [Input('cell_dropdown', 'value'),
+    Output('chart_data', 'data'),
+    Output('summary-table-container', 'children'),
+    Input('cell_dropdown', 'value'),
     Input('pi_dropdown', 'value'),
     Input('date_picker', 'start_date'),
     Input('date_picker', 'end_date'),
-    Input('tabs', 'active_tab'),  # change 'value' to 'active_tab'
-    Input('resample_dropdown', 'value')])
-def update_graph(cell_id, pis, start_date, end_date, tab, resample_freq):
+    Input('resample_dropdown', 'value'),
+    Input('viewport', 'data'),
+    Input('data_version', 'data'),
+    background=True,
+    progress=[Output('render_progress', 'value'), Output('render_progress', 'max')],
+    progress_default=[0, 1],
+    running=[(Output('cancel_render', 'disabled'), False, True),
+             (Output('render_progress', 'style'), {'visibility': 'visible'}, {'visibility': 'hidden'})],
+    cancel=[Input('cancel_render', 'n_clicks')],
+    interval=250)
+@metrics.timed('callback.update_chart_data')
+def update_chart_data(set_progress, selected_cells, selected_pis, start_date, end_date, resample_freq, viewport_width, data_version):
     """
-    Callback function to update the graph based on the selected options.
+    Callback function to update the data drawn by the charts and the summary tables based on the selected options.
 
     Args:
-        cell_id (str): The selected cell ID from 'cell_dropdown'.
-        pis (list): The selected KPIs from 'pi_dropdown'.
+        set_progress (callable): Reports the (value, max) progress shown by 'render_progress'.
+        selected_cells (str or list): The selected cell(s) from 'cell_dropdown'.
+        selected_pis (str or list): The selected KPI(s) from 'pi_dropdown'.
         start_date (str): The start date of the selected time range from 'date_picker'.
         end_date (str): The end date of the selected time range from 'date_picker'.
-        tab (str): The active tab from 'tabs'.
         resample_freq (str): The selected date resampling frequency from 'resample_dropdown'.
+        viewport_width (int): The browser viewport width in pixels from 'viewport'.
+        data_version (dict): The data shown on the page from 'data_version'; new rows trigger a refresh.
 
     Returns:
-        go.Figure: The updated graph figure based on the selected options.
+        tuple: The payload of functions.chart_payload, or None when nothing is selected, and the summary
+        tables. The summary tables are left unchanged when only the viewport or the resampling changed.
     """
-    if tab == 'tab-line':
-        return update_line_chart(cell_id, pis, (start_date, end_date), resample_freq)
-    elif tab == 'tab-bar':
-        return update_bar_chart(cell_id, pis, (start_date, end_date), resample_freq)
-    elif tab == 'tab-scatter':
-        return update_scatter_chart(cell_id, pis, (start_date, end_date), resample_freq)
-    elif tab == 'tab-heatmap':
-        return update_heatmap(cell_id, pis, (start_date, end_date), resample_freq)
-    elif tab == 'tab-box':
-        return update_box_plot(cell_id, pis, (start_date, end_date), resample_freq)
-    elif tab == 'tab-hist':
-        return update_histogram(cell_id, pis, (start_date, end_date), resample_freq)
-
-# Define callback function to render the content of the selected tab when the selected options in the control panel are changed
-@app.callback(
+    payload = None
+    if None not in (selected_cells, selected_pis, start_date, end_date) and selected_pis and selected_cells:
+        set_progress((0, 2))
+        # Cover the whole selected days
+        date_range = (pd.to_datetime(start_date).replace(hour=0, minute=0), pd.to_datetime(end_date).replace(hour=23, minute=59))
+        payload = chart_payload(selected_cells, selected_pis, date_range, resample_freq, viewport_width)
+        set_progress((1, 2))
+    # Resampling does not change the summary tables
+    if ctx.triggered_id in ('viewport', 'resample_dropdown'):
+        return payload, no_update
+    return payload, update_summary_tables(selected_cells, selected_pis, start_date, end_date)
+
+# Draw the active tab from the data in the browser; tab changes and chart options never reach the server
+app.clientside_callback(
+    ClientsideFunction(namespace='charts', function_name='render_tab'),
     Output('tabs-content', 'children'),
-    Input('tabs', 'active_tab'),  # change 'value' to 'active_tab'
+    Output('network-heatmap-content', 'style'),
+    Output('correlation-content', 'style'),
+    Input('chart_data', 'data'),
+    Input('tabs', 'active_tab'),
+    Input('compare_mode', 'value'),
+    Input('heatmap_scope', 'value'),
+    State('chart_theme', 'data'))
+
+# Request network heatmaps only while the heatmap tab shows the whole network
+app.clientside_callback(
+    ClientsideFunction(namespace='charts', function_name='network_request'),
+    Output('network_heatmap_request', 'data'),
+    Input('tabs', 'active_tab'),
+    Input('heatmap_scope', 'value'),
+    Input('heatmap_sort', 'value'),
+    Input('pi_dropdown', 'value'),
+    Input('date_picker', 'start_date'),
+    Input('date_picker', 'end_date'),
+    Input('resample_dropdown', 'value'),
+    Input('viewport', 'data'),
+    Input('data_version', 'data'),
+    State('network_heatmap_request', 'data'))
+
+# Define callback function to render the network heatmaps, one per selected KPI, as a background job that a newer request replaces
+@app.callback(
+    Output('network-heatmap-content', 'children'),
+    Input('network_heatmap_request', 'data'),
+    background=True,
+    prevent_initial_call=True,
+    interval=250)
+@metrics.timed('callback.update_network_heatmaps')
+def update_network_heatmaps(request):
+    """
+    Callback function to render the network heatmaps based on the options on display.
+
+    Args:
+        request (dict): The selected 'pis', 'start_date', 'end_date', 'frequency', heatmap 'sort'
+            and 'viewport' width from 'network_heatmap_request'.
+
+    Returns:
+        list: A network heatmap for each selected KPI, separated by horizontal lines.
+    """
+    selected_pis = request['pis']
+    if None in (selected_pis, request['start_date'], request['end_date']) or not selected_pis:
+        return [dcc.Graph(figure=go.Figure())]
+    if not isinstance(selected_pis, list):
+        selected_pis = [selected_pis]
+    date_range = (pd.to_datetime(request['start_date']).replace(hour=0, minute=0),
+                  pd.to_datetime(request['end_date']).replace(hour=23, minute=59))
+    figs = parallel_map(render_network_heatmap, [(selected_pi, date_range, request['frequency'], request['sort'], request['viewport'])
+                                                 for selected_pi in selected_pis])
+    content = []
+    for fig in figs:
+        content.append(dcc.Graph(figure=fig))
+        content.append(html.Hr())
+    return content
+
+# Request correlations only while the correlation tab is shown
+app.clientside_callback(
+    ClientsideFunction(namespace='charts', function_name='correlation_request'),
+    Output('correlation_request', 'data'),
+    Input('tabs', 'active_tab'),
     Input('cell_dropdown', 'value'),
     Input('pi_dropdown', 'value'),
     Input('date_picker', 'start_date'),
     Input('date_picker', 'end_date'),
-    Input('resample_dropdown', 'value'))
-def render_tab_content(tab, selected_cells, selected_pis, start_date, end_date, resample_freq):
+    Input('resample_dropdown', 'value'),
+    Input('correlation_method', 'value'),
+    Input('correlation_scope', 'value'),
+    Input('correlation_lag', 'value'),
+    Input('data_version', 'data'),
+    State('correlation_request', 'data'))
+
+# Define callback function to render the correlation matrices, and the lagged correlations when lags are requested.
+# It runs in the server process rather than as a background job, so that the correlations it computes stay cached.
+@app.callback(
+    Output('correlation-matrices', 'children'),
+    Output('correlation_scatter', 'figure'),
+    Input('correlation_request', 'data'),
+    prevent_initial_call=True)
+@metrics.timed('callback.update_correlations')
+def update_correlations(request):
     """
-    Callback function to render the content of the selected tab based on the selected options.
+    Callback function to render the correlations based on the options on display.
 
     Args:
-        tab (str): The active tab from 'tabs'.
-        selected_cells (str or list): The selected cell(s) from 'cell_dropdown'.
+        request (dict): The selected 'cells', 'pis', 'start_date', 'end_date', 'frequency',
+            correlation 'method', 'scope' ('cell' or 'pooled') and 'max_lag' from 'correlation_request'.
+
+    Returns:
+        tuple: A correlation matrix per cell, or one for the pooled cells, each followed by its lagged
+        correlations and separated by horizontal lines, and an empty pair scatter plot.
+    """
+    scatter = go.Figure(layout=dict(title='Click a pair of KPIs in a correlation matrix to plot them against each other',
+                                    template='plotly_dark'))
+    selected_cells, selected_pis = request['cells'], request['pis']
+    if None in (selected_cells, selected_pis, request['start_date'], request['end_date']) or not selected_cells or not selected_pis:
+        return [dcc.Graph(figure=go.Figure())], scatter
+    if not isinstance(selected_cells, list):
+        selected_cells = [selected_cells]
+    if not isinstance(selected_pis, list):
+        selected_pis = [selected_pis]
+    date_range = (pd.to_datetime(request['start_date']).replace(hour=0, minute=0),
+                  pd.to_datetime(request['end_date']).replace(hour=23, minute=59))
+    # Matrices are drawn per cell in sorted order, as plot_correlation_pair expects when a pair is clicked
+    selected_cells = sorted(set(selected_cells))
+    groups = [[cell] for cell in selected_cells] if request['scope'] == 'cell' else [selected_cells]
+    max_lag = int(request['max_lag'] or 0)
+    charts = parallel_map(render_correlation_charts, [(group, selected_pis, date_range, request['frequency'], request['method'], max_lag)
+                                                      for group in groups])
+    content = []
+    for index, figs in enumerate(charts):
+        content.append(dcc.Graph(id={'type': 'correlation-matrix', 'index': index}, figure=figs[0]))
+        content.extend(dcc.Graph(figure=fig) for fig in figs[1:])
+        content.append(html.Hr())
+    return content, scatter
+
+# Define callback function to plot the pair of KPIs clicked in a correlation matrix against each other
+@app.callback(
+    Output('correlation_scatter', 'figure', allow_duplicate=True),
+    Input({'type': 'correlation-matrix', 'index': ALL}, 'clickData'),
+    State('correlation_request', 'data'),
+    State('viewport', 'data'),
+    prevent_initial_call=True)
+@metrics.timed('callback.plot_correlation_pair')
+def plot_correlation_pair(clicks, request, viewport_width):
+    """
+    Callback function to plot a pair of KPIs clicked in a correlation matrix, over the cells of the matrix.
+
+    Args:
+        clicks (list): The click on each correlation matrix.
+        request (dict): The options of the correlations on display, from 'correlation_request'.
+        viewport_width (int): The browser viewport width in pixels from 'viewport'.
+
+    Returns:
+        go.Figure: The pair scatter plot, or no update if no pair was clicked.
+    """
+    click = ctx.triggered[0]['value'] if ctx.triggered else None
+    if not click or not request:
+        return no_update
+    point = click['points'][0]
+    # Matrices are drawn per cell in sorted order, or once for all cells pooled
+    cells = sorted(set(request['cells'] if isinstance(request['cells'], list) else [request['cells']]))
+    matrix_cells = cells if request['scope'] == 'pooled' else [cells[ctx.triggered_id['index']]]
+    date_range = (pd.to_datetime(request['start_date']).replace(hour=0, minute=0),
+                  pd.to_datetime(request['end_date']).replace(hour=23, minute=59))
+    return update_pair_scatter(matrix_cells, point['x'], point['y'], date_range, request['frequency'],
+                               point_budget(viewport_width))
+
+# Define callback function to offer the cells, PIs and dates of newly ingested rows, and refresh the charts when rows arrive
+@app.callback(
+    Output('data_version', 'data'),
+    Output('cell_dropdown', 'options'),
+    Output('pi_dropdown', 'options'),
+    Output('date_picker', 'min_date_allowed'),
+    Output('date_picker', 'max_date_allowed'),
+    Output('date_picker', 'end_date'),
+    Input('ingest_interval', 'n_intervals'),
+    State('data_version', 'data'),
+    State('date_picker', 'end_date'),
+    prevent_initial_call=True)
+@metrics.timed('callback.refresh_data_options')
+def refresh_data_options(n_intervals, data_version, end_date):
+    """
+    Callback function to update the control panel when new rows have been ingested.
+
+    Args:
+        n_intervals (int): The number of polls from 'ingest_interval'.
+        data_version (dict): The data shown on the page from 'data_version'.
+        end_date (str): The end date of the selected time range from 'date_picker'.
+
+    Returns:
+        tuple: The new data version, cell and PI options, date bounds and end date,
+        or no updates if no rows were ingested since the last poll.
+    """
+    current_cells, current_pis, first_date, last_date, rows = current_data_options()
+    if data_version and data_version['rows'] == rows:
+        return (no_update,) * 6
+    # A range that ended at the latest data keeps following it
+    if end_date is not None and data_version and pd.to_datetime(end_date).date() >= pd.to_datetime(data_version['max_date']).date():
+        end_date = last_date
+    else:
+        end_date = no_update
+    return ({'rows': rows, 'max_date': last_date},
+            [{'label': cell, 'value': cell} for cell in current_cells],
+            [{'label': pi, 'value': pi} for pi in current_pis],
+            first_date, last_date, end_date)
+
+# Define callback function to list the worst cells now, and to refresh the list when rows arrive
+@app.callback(
+    Output('worst_cells', 'data'),
+    Input('data_version', 'data'))
+@metrics.timed('callback.update_worst_cells')
+def update_worst_cells(data_version):
+    """
+    Callback function to update the worst cells panel.
+
+    Args:
+        data_version (dict): The data shown on the page from 'data_version'; new rows trigger a refresh.
+
+    Returns:
+        list: The records of functions.worst_cells.
+    """
+    return worst_cells()
+
+# Define callback function to open the line chart of a series from a link or from a row of the worst cells panel
+@app.callback(
+    Output('cell_dropdown', 'value'),
+    Output('pi_dropdown', 'value'),
+    Output('date_picker', 'start_date'),
+    Output('date_picker', 'end_date', allow_duplicate=True),
+    Output('tabs', 'active_tab'),
+    Input('url', 'search'),
+    Input('worst_cells', 'active_cell'),
+    State('worst_cells', 'data'),
+    prevent_initial_call=True)
+def show_series(search, active_cell, worst_cells_data):
+    """
+    Callback function to select a series and the range around its anomaly.
+
+    Args:
+        search (str): The query string of the page's URL, with 'cell_id', 'pi' and optionally
+            'start_date' and 'end_date' parameters, as in the links of /api/anomalies.
+        active_cell (dict): The clicked cell of 'worst_cells'.
+        worst_cells_data (list): The rows of 'worst_cells'.
+
+    Returns:
+        tuple: The selected cell and KPI, the start and end dates and the line chart tab,
+        or no updates if no series is given.
+    """
+    if ctx.triggered_id == 'worst_cells':
+        if not active_cell or active_cell['row'] >= len(worst_cells_data or []):
+            return (no_update,) * 5
+        series = worst_cells_data[active_cell['row']]
+    else:
+        series = {key: values[0] for key, values in parse_qs((search or '').lstrip('?')).items()}
+        if 'cell_id' not in series or 'pi' not in series:
+            return (no_update,) * 5
+    return ([series['cell_id']], [series['pi']], series.get('start_date', no_update),
+            series.get('end_date', no_update), 'tab-line')
+
+# Define callback function to reload a line chart with finer-grained data for the visible window when it is zoomed
+@app.callback(
+    Output({'type': 'line-graph', 'cell': MATCH}, 'figure'),
+    Input({'type': 'line-graph', 'cell': MATCH}, 'relayoutData'),
+    State('pi_dropdown', 'value'),
+    State('date_picker', 'start_date'),
+    State('date_picker', 'end_date'),
+    State('resample_dropdown', 'value'),
+    State('viewport', 'data'),
+    prevent_initial_call=True)
+@metrics.timed('callback.zoom_line_chart')
+def zoom_line_chart(relayout_data, selected_pis, start_date, end_date, resample_freq, viewport_width):
+    """
+    Callback function to load the visible window of a zoomed line chart at a finer resolution.
+
+    Args:
+        relayout_data (dict): The zoom or pan event from the line chart.
         selected_pis (str or list): The selected KPI(s) from 'pi_dropdown'.
         start_date (str): The start date of the selected time range from 'date_picker'.
         end_date (str): The end date of the selected time range from 'date_picker'.
         resample_freq (str): The selected date resampling frequency from 'resample_dropdown'.
+        viewport_width (int): The browser viewport width in pixels from 'viewport'.
 
     Returns:
-        list: The rendered content of the selected tab based on the selected options. 
-        The content includes graphs for each selected cell, separated by horizontal lines.
+        go.Figure: The line chart for the visible window, or no update for other layout changes.
     """
-    # Convert date strings to datetime objects
+    selected_cell = ctx.triggered_id['cell']
     start_date = pd.to_datetime(start_date).replace(hour=0, minute=0)
     end_date = pd.to_datetime(end_date).replace(hour=23, minute=59)
-    # Check if any selected item is None or if selected_pis is an empty list
-    if None in (selected_cells, selected_pis, start_date, end_date) or not selected_pis:
-        # If yes, return an empty figure
-        return [dcc.Graph(figure=go.Figure())]
-    else:
-        # Ensure selected_cells is a list
-        if not isinstance(selected_cells, list):
-            selected_cells = [selected_cells]
-        # Create a graph for each selected cell
-        content = []
-        for selected_cell in selected_cells:
-            fig = chart_func_dict[tab](selected_cell, selected_pis, (start_date, end_date), resample_freq)  # Include resample_freq
-            content.append(dcc.Graph(figure=fig))
-            content.append(html.Hr())
-        return content
-
-# Define callback function to update the summary tables when the selected options in the control panel are changed
-@app.callback(
-    Output('summary-table-container', 'children'),
-    [Input('cell_dropdown', 'value'),
-    Input('pi_dropdown', 'value'),
-    Input('date_picker', 'start_date'),
-    Input('date_picker', 'end_date'),
-    Input('resample_dropdown', 'value')])
-def update_summary_tables(selected_cells, selected_pis, start_date, end_date, resample_freq):
+    relayout_data = relayout_data or {}
+    if relayout_data.get('xaxis.autorange'):
+        # Zoomed back out: show the whole selected range again
+        return render_chart('tab-line', selected_cell, selected_pis, (start_date, end_date), resample_freq, viewport_width)
+    window = relayout_data.get('xaxis.range') or [relayout_data.get('xaxis.range[0]'), relayout_data.get('xaxis.range[1]')]
+    if None in window or not selected_pis:
+        return no_update
+    window = (max(pd.to_datetime(window[0]), start_date), min(pd.to_datetime(window[1]), end_date))
+    frequency = detail_frequency(selected_cell, selected_pis, window, resample_freq, point_budget(viewport_width))
+    return render_chart('tab-line', selected_cell, selected_pis, window, frequency, viewport_width)
+
+def update_summary_tables(selected_cells, selected_pis, start_date, end_date):
     """
-    Callback function to update the summary tables based on the selected options.
+    Update the summary tables based on the selected options.
 
     Args:
         selected_cells (str or list): The selected cell(s) from 'cell_dropdown'.
         selected_pis (str or list): The selected KPI(s) from 'pi_dropdown'.
         start_date (str): The start date of the selected time range from 'date_picker'.
         end_date (str): The end date of the selected time range from 'date_picker'.
-        resample_freq (str): The selected date resampling frequency from 'resample_dropdown'.
 
     Returns:
         list: The rendered summary tables based on the selected options.
         Each summary table displays statistical summary of the selected KPI for a specific cell within the selected time range.
+        The summaries cover the raw samples, whatever the resampling frequency, with quartiles merged from per-day quantile sketches.
     """
+    # Nothing to summarize until a cell, PIs and a time range are selected
+    if None in (selected_cells, selected_pis, start_date, end_date) or not selected_pis or not selected_cells:
+        return []
     # Ensure selected_pis and selected_cells are lists
     if not isinstance(selected_pis, list):
         selected_pis = [selected_pis]
     if not isinstance(selected_cells, list):
         selected_cells = [selected_cells]
 
+    # Cover the whole selected days, as the charts do
+    date_range = (pd.to_datetime(start_date).replace(hour=0, minute=0), pd.to_datetime(end_date).replace(hour=23, minute=59))
+    summaries = summarize_cells(selected_cells, selected_pis, date_range).set_index(['pi', 'cell_id'])
+    # Series without samples in the range get the summary describe() gives an empty series
+    empty = pd.Series(dtype=float).describe()
+
     table_list = []
     for pi in selected_pis:
         for cell in selected_cells:
-            # Filter the DataFrame for the current 'pi' and 'cell'
-            filtered_data = data[(data['pi'] == pi) & (data['cell_id'] == cell)]
-            filtered_data = filtered_data[(filtered_data['date_time'] >= pd.to_datetime(start_date)) & (filtered_data['date_time'] <= pd.to_datetime(end_date))]
-
-            # set 'date_time' as the index
-            filtered_data.set_index('date_time', inplace=True)
-
-            # Resample filtered data before generating the summary
-            filtered_data_resampled = filtered_data.resample(resample_freq).mean()
-
-            summary = filtered_data_resampled['value'].describe().round(2)
+            summary = (summaries.loc[(pi, cell)] if (pi, cell) in summaries.index else empty).round(2)
             summary_table = dash_table.DataTable(
                 id=f'summary-table-{pi}-{cell}',
                 columns=[{"name": i, "id": i} for i in summary.index],
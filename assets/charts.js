@@ -0,0 +1,468 @@
+// Charts drawn in the browser from the columnar payload of functions.chart_payload.
+// The server sends the resampled data of a selection once, downsampled to the point
+// budget, with scatter plots, box statistics and histograms precomputed; switching tabs, comparison
+// layouts and heatmap scope only redraws it here, without a request to the server.
+(function () {
+    'use strict';
+
+    // Typed array read from the base64 text written by functions.encode_array
+    function decodeArray(text, ArrayType) {
+        const binary = atob(text);
+        const bytes = new Uint8Array(binary.length);
+        for (let i = 0; i < binary.length; i++) {
+            bytes[i] = binary.charCodeAt(i);
+        }
+        return new ArrayType(bytes.buffer);
+    }
+
+    // Series of the payload keyed by cell and PI, with times in milliseconds since the epoch: for each
+    // kind of chart in payload.sample_flags, the samples kept for it, and the series' box statistics
+    function unpack(payload) {
+        const times = decodeArray(payload.times, Int32Array);
+        const values = decodeArray(payload.values, Float32Array);
+        const flags = decodeArray(payload.flags, Uint8Array);
+        const starts = decodeArray(payload.block_starts, Int32Array);
+        const blockCells = decodeArray(payload.block_cells, Int32Array);
+        const blockPis = decodeArray(payload.block_pis, Int32Array);
+        const series = new Map();
+        for (let b = 0; b < starts.length; b++) {
+            const start = starts[b];
+            const stop = b + 1 < starts.length ? starts[b + 1] : times.length;
+            const entry = {box: payload.boxes[b]};
+            Object.entries(payload.sample_flags).forEach(([kind, bit]) => {
+                const x = [], y = [];
+                for (let i = start; i < stop; i++) {
+                    if (flags[i] & bit) {
+                        x.push((payload.origin + times[i]) * 1000);
+                        y.push(values[i]);
+                    }
+                }
+                entry[kind] = {x: Float64Array.from(x), y: Float32Array.from(y)};
+            });
+            series.set(seriesKey(payload.cells[blockCells[b]], payload.pis[blockPis[b]]), entry);
+        }
+        return series;
+    }
+
+    function seriesKey(cell, pi) {
+        return cell + '\u0000' + pi;
+    }
+
+    // Samples of a series kept for a kind of chart ('line' or 'bar')
+    function getSeries(series, cell, pi, kind) {
+        const entry = series.get(seriesKey(cell, pi));
+        return entry ? entry[kind] : {x: new Float64Array(0), y: new Float32Array(0)};
+    }
+
+    // Evenly spaced values, computed as numpy.linspace does
+    function linspace(start, stop, num, endpoint) {
+        const div = endpoint ? num - 1 : num;
+        const step = (stop - start) / div;
+        const result = new Array(num);
+        for (let i = 0; i < num; i++) {
+            result[i] = i * step + start;
+        }
+        if (endpoint && num > 1) {
+            result[num - 1] = stop;
+        }
+        return result;
+    }
+
+    // Largest-Triangle-Three-Buckets, with neighbouring buckets represented by their averages as in downsample.lttb_indices
+    function lttbIndices(x, y, nOut) {
+        const n = x.length;
+        if (nOut >= n || nOut < 3) {
+            return null;
+        }
+        const edges = linspace(1, n - 1, nOut - 1, true).map(Math.trunc);
+        const buckets = edges.length - 1;
+        const meanX = new Float64Array(buckets);
+        const meanY = new Float64Array(buckets);
+        for (let b = 0; b < buckets; b++) {
+            let sumX = 0, sumY = 0;
+            for (let i = edges[b]; i < edges[b + 1]; i++) {
+                sumX += x[i] - x[0];
+                sumY += y[i];
+            }
+            meanX[b] = sumX / (edges[b + 1] - edges[b]);
+            meanY[b] = sumY / (edges[b + 1] - edges[b]);
+        }
+        const selected = [0];
+        for (let b = 0; b < buckets; b++) {
+            const prevX = b > 0 ? meanX[b - 1] : 0;
+            const prevY = b > 0 ? meanY[b - 1] : y[0];
+            const nextX = b + 1 < buckets ? meanX[b + 1] : x[n - 1] - x[0];
+            const nextY = b + 1 < buckets ? meanY[b + 1] : y[n - 1];
+            let best = edges[b], bestArea = -1;
+            for (let i = edges[b]; i < edges[b + 1]; i++) {
+                const area = Math.abs((prevX - nextX) * (y[i] - prevY) - (prevX - (x[i] - x[0])) * (nextY - prevY));
+                if (area > bestArea) {
+                    best = i;
+                    bestArea = area;
+                }
+            }
+            selected.push(best);
+        }
+        selected.push(n - 1);
+        return selected;
+    }
+
+    // Minimum and maximum of equal buckets, as downsample.min_max_indices selects them
+    function minMaxIndices(y, nOut) {
+        const n = y.length;
+        if (nOut >= n || nOut < 2) {
+            return null;
+        }
+        const starts = linspace(0, n, Math.floor(nOut / 2), false).map(Math.trunc);
+        const selected = new Set();
+        for (let b = 0; b < starts.length; b++) {
+            const stop = b + 1 < starts.length ? starts[b + 1] : n;
+            let low = starts[b], high = starts[b];
+            for (let i = starts[b] + 1; i < stop; i++) {
+                if (y[i] < y[low]) low = i;
+                if (y[i] > y[high]) high = i;
+            }
+            selected.add(low);
+            selected.add(high);
+        }
+        return Array.from(selected).sort((a, b) => a - b);
+    }
+
+    // Plain arrays of the points kept by a downsampling, or of every point
+    function take(data, indices) {
+        if (indices === null) {
+            return {x: Array.from(data.x), y: Array.from(data.y)};
+        }
+        return {x: indices.map(i => data.x[i]), y: indices.map(i => data.y[i])};
+    }
+
+    // Axes of a grid of subplots, laid out as plotly.subplots.make_subplots lays them out
+    function subplots(layout, rows, cols, options) {
+        const verticalSpacing = options.verticalSpacing !== undefined ? options.verticalSpacing : 0.3 / rows;
+        const horizontalSpacing = 0.2 / cols;
+        const height = (1 - verticalSpacing * (rows - 1)) / rows;
+        const width = (1 - horizontalSpacing * (cols - 1)) / cols;
+        const count = rows * cols;
+        const annotations = [];
+        for (let row = 0; row < rows; row++) {
+            for (let col = 0; col < cols; col++) {
+                const n = row * cols + col + 1;
+                const suffix = n === 1 ? '' : String(n);
+                const top = 1 - row * (height + verticalSpacing);
+                const xaxis = {anchor: 'y' + suffix, domain: [col * (width + horizontalSpacing), col * (width + horizontalSpacing) + width]};
+                const yaxis = {anchor: 'x' + suffix, domain: [top - height, top]};
+                if (options.sharedX && row < rows - 1) {
+                    xaxis.matches = 'x' + (count - cols + col + 1 === 1 ? '' : count - cols + col + 1);
+                    xaxis.showticklabels = false;
+                }
+                if (options.sharedY && col > 0) {
+                    yaxis.matches = 'y' + (row * cols + 1 === 1 ? '' : row * cols + 1);
+                    yaxis.showticklabels = false;
+                }
+                layout['xaxis' + suffix] = Object.assign(xaxis, layout['xaxis' + suffix]);
+                layout['yaxis' + suffix] = Object.assign(yaxis, layout['yaxis' + suffix]);
+                if (options.titles) {
+                    annotations.push({font: {size: 16}, showarrow: false, text: options.titles[n - 1],
+                                      x: (xaxis.domain[0] + xaxis.domain[1]) / 2, xanchor: 'center', xref: 'paper',
+                                      y: top, yanchor: 'bottom', yref: 'paper'});
+                }
+            }
+        }
+        if (annotations.length) {
+            layout.annotations = annotations;
+        }
+        return layout;
+    }
+
+    function axisRef(prefix, n) {
+        return n === 1 ? prefix : prefix + n;
+    }
+
+    function color(theme, i) {
+        return theme.colors[i % theme.colors.length];
+    }
+
+    // Horizontal legend above the plot, as the server-side charts place it
+    const legend = {orientation: 'h', yanchor: 'bottom', y: 1.02, xanchor: 'right', x: 1};
+
+    function formatValue(value) {
+        return value.toFixed(2);
+    }
+
+    // Time label of heatmap columns, '%Y-%m-%d %H:%M'
+    function formatTime(ms) {
+        return new Date(ms).toISOString().slice(0, 16).replace('T', ' ');
+    }
+
+    function lineChart(series, cell, pis, payload, theme) {
+        const data = pis.map((pi, i) => {
+            const points = getSeries(series, cell, pi, 'line');
+            // The server already kept the series' LTTB samples; this only thins them when the budget is lower
+            const kept = take(points, lttbIndices(points.x, points.y, payload.max_points));
+            const showText = kept.y.length <= theme.max_text_labels;
+            return {type: 'scatter', x: kept.x, y: kept.y, mode: showText ? 'lines+markers+text' : 'lines', name: pi,
+                    line: {color: color(theme, i)}, text: showText ? kept.y.map(formatValue) : null,
+                    textposition: 'top center', textfont: {color: '#FFFFFF', size: 10}};
+        });
+        return {data: data, layout: {
+            title: {text: 'Time Series Line Chart for ' + cell},
+            xaxis: {title: {text: 'Time'}, type: 'date'},
+            yaxis: {title: {text: 'Value'}},
+            template: theme.template,
+            uirevision: cell,
+            legend: legend,
+        }};
+    }
+
+    function barChart(series, cell, pis, payload, theme) {
+        const data = pis.map((pi, i) => {
+            const points = getSeries(series, cell, pi, 'bar');
+            const kept = take(points, minMaxIndices(points.y, payload.max_points));
+            const showText = kept.y.length <= theme.max_text_labels;
+            return {type: 'bar', x: kept.x, y: kept.y, name: pi, marker: {color: color(theme, i)},
+                    text: showText ? kept.y.map(formatValue) : null,
+                    textposition: 'outside', textfont: {color: '#FFFFFF', size: 10}};
+        });
+        return {data: data, layout: {
+            title: {text: 'Time Series Bar Chart for ' + cell},
+            xaxis: {title: {text: 'Time'}, type: 'date'},
+            yaxis: {title: {text: 'Value'}},
+            template: theme.template,
+            legend: legend,
+        }};
+    }
+
+    // Pairs drawn as the number of pairs in each cell of a grid, as functions.density_traces draws them
+    function densityTraces(grid, x, y, name) {
+        const counts = decodeArray(grid.counts, Int32Array);
+        const bins = grid.x.length;
+        const z = [];
+        for (let row = 0; row < grid.y.length; row++) {
+            z.push(Array.from(counts.subarray(row * bins, (row + 1) * bins), count => count > 0 ? count : null));
+        }
+        return [
+            {type: 'heatmap', x: grid.x, y: grid.y, z: z, name: name, colorscale: 'Viridis',
+             colorbar: {title: {text: 'Samples'}}, hoverongaps: false},
+            {type: 'scattergl', x: x, y: y, mode: 'markers', name: name, showlegend: false,
+             marker: {size: 3, color: '#FFFFFF'}},
+        ];
+    }
+
+    // Plots the first two PIs against each other, in the order they were selected, from the pairs or
+    // density grid of every sample sent by functions.scatter_payload
+    function scatterChart(series, cell, pis, payload, theme) {
+        const scatter = payload.scatters[payload.cells.indexOf(cell)];
+        if (pis.length < 2 || !scatter) {
+            return {data: [], layout: {title: {text: 'Scatter Plot'}, template: theme.template}};
+        }
+        const x = Array.from(decodeArray(scatter.x, Float32Array)), y = Array.from(decodeArray(scatter.y, Float32Array));
+        const name = pis[0] + ' vs ' + pis[1];
+        let data;
+        if (scatter.grid) {
+            data = densityTraces(scatter.grid, x, y, name);
+        } else {
+            const low = y.reduce((a, b) => Math.min(a, b), Infinity), high = y.reduce((a, b) => Math.max(a, b), -Infinity);
+            data = [{
+                type: 'scattergl', x: x, y: y, mode: 'markers', name: name,
+                marker: {size: y.map(value => (value - low) / (high - low) * 20), color: x, colorscale: 'Viridis',
+                         colorbar: {title: {text: 'Value of PI'}}},
+            }];
+        }
+        return {data: data, layout: {
+            title: {text: 'Scatter Plot for ' + cell + ' between ' + pis[0] + ' and ' + pis[1]},
+            xaxis: {title: {text: pis[0]}},
+            yaxis: {title: {text: pis[1]}},
+            template: theme.template,
+            legend: legend,
+        }};
+    }
+
+    function heatmap(series, cell, pis, payload, theme) {
+        const layout = {};
+        const data = pis.map((pi, i) => {
+            const points = getSeries(series, cell, pi, 'bar');
+            layout[axisRef('yaxis', i + 1)] = {title: {text: pi}};
+            return {type: 'heatmap', z: [Array.from(points.y)], x: Array.from(points.x, formatTime), colorscale: 'YlOrRd',
+                    colorbar: {title: {text: 'Value'}, len: 1 / pis.length, y: i / pis.length + 1 / pis.length / 2},
+                    hoverongaps: false, hoverinfo: 'x+y+z', name: pi,
+                    xaxis: axisRef('x', i + 1), yaxis: axisRef('y', i + 1)};
+        });
+        subplots(layout, pis.length, 1, {verticalSpacing: 1 / (pis.length * 10)});
+        return {data: data, layout: Object.assign(layout, {
+            title: {text: 'Heatmap for ' + cell},
+            template: theme.template,
+            showlegend: false,
+            autosize: true,
+            height: 360 * pis.length,
+        })};
+    }
+
+    // Boxes drawn from the statistics computed on the server, as functions.update_box_plot draws them
+    function boxPlot(series, cell, pis, payload, theme) {
+        const data = [];
+        pis.forEach((pi, i) => {
+            const entry = series.get(seriesKey(cell, pi));
+            if (!entry) {
+                return;
+            }
+            const box = entry.box;
+            data.push({type: 'box', x: [pi], q1: [box.q1], median: [box.median], q3: [box.q3],
+                       lowerfence: [box.lowerfence], upperfence: [box.upperfence], mean: [box.mean],
+                       name: pi, hoverinfo: 'y', marker: {color: color(theme, i)}});
+            data.push({type: 'scatter', x: box.outliers.map(() => pi), y: box.outliers, mode: 'markers', name: pi,
+                       hoverinfo: 'y', marker: {color: color(theme, i), size: 4}, showlegend: false});
+        });
+        return {data: data, layout: {
+            title: {text: 'Box Plot for ' + cell},
+            xaxis: {title: {text: 'Performance Indicator'}},
+            yaxis: {title: {text: 'Value'}},
+            template: theme.template,
+            legend: legend,
+        }};
+    }
+
+    // Bars of the counts binned on the server, in bins shared by the PIs of the cell
+    function histogram(series, cell, pis, payload, theme) {
+        const histograms = payload.histograms[payload.cells.indexOf(cell)];
+        const edges = histograms.edges;
+        const centers = edges.slice(0, -1).map((edge, i) => (edge + edges[i + 1]) / 2);
+        const widths = edges.slice(0, -1).map((edge, i) => edges[i + 1] - edge);
+        const layout = {};
+        const data = pis.map((pi, i) => {
+            layout[axisRef('xaxis', i + 1)] = {title: {text: 'Value'}};
+            return {type: 'bar', x: centers, y: histograms.counts[payload.pis.indexOf(pi)], width: widths, name: pi, marker: {color: color(theme, i)},
+                    xaxis: axisRef('x', i + 1), yaxis: axisRef('y', i + 1)};
+        });
+        layout.yaxis = {title: {text: 'Count'}};
+        subplots(layout, 1, pis.length, {sharedY: true});
+        return {data: data, layout: Object.assign(layout, {
+            title: {text: cell + ' Histogram for each PI'},
+            template: theme.template,
+            legend: legend,
+        })};
+    }
+
+    // All cells in one chart: overlaid with one color per cell and one dash style per PI, or one row per cell
+    function comparisonChart(series, cells, pis, payload, theme, mode) {
+        const layout = {};
+        const data = [];
+        cells.forEach((cell, row) => {
+            pis.forEach((pi, p) => {
+                const points = getSeries(series, cell, pi, 'line');
+                if (!points.x.length) {
+                    return;
+                }
+                const kept = take(points, lttbIndices(points.x, points.y, payload.max_points));
+                if (mode === 'grid') {
+                    data.push({type: 'scatter', x: kept.x, y: kept.y, mode: 'lines', name: pi, legendgroup: pi,
+                               showlegend: row === 0, line: {color: color(theme, p)},
+                               xaxis: axisRef('x', row + 1), yaxis: axisRef('y', row + 1)});
+                } else {
+                    data.push({type: 'scatter', x: kept.x, y: kept.y, mode: 'lines', name: cell + ' ' + pi,
+                               line: {color: color(theme, row), dash: theme.dashes[p % theme.dashes.length]}});
+                }
+            });
+        });
+        if (mode === 'grid') {
+            cells.forEach((cell, row) => {
+                layout[axisRef('xaxis', row + 1)] = {type: 'date'};
+            });
+            subplots(layout, cells.length, 1, {sharedX: true, titles: cells});
+            layout.height = Math.max(250 * cells.length, 450);
+        } else {
+            layout.xaxis = {title: {text: 'Time'}, type: 'date'};
+            layout.yaxis = {title: {text: 'Value'}};
+        }
+        return {data: data, layout: Object.assign(layout, {
+            title: {text: 'Time Series Comparison of ' + cells.length + ' Cells'},
+            template: theme.template,
+            legend: legend,
+        })};
+    }
+
+    const chartFunctions = {
+        'tab-line': lineChart,
+        'tab-bar': barChart,
+        'tab-scatter': scatterChart,
+        'tab-heatmap': heatmap,
+        'tab-box': boxPlot,
+        'tab-hist': histogram,
+    };
+
+    // Charts whose output depends on the order in which the PIs were selected; the others sort them
+    const orderedPiCharts = new Set(['tab-scatter']);
+
+    function graph(figure, id) {
+        const props = {figure: figure};
+        if (id !== undefined) {
+            props.id = id;
+        }
+        return {namespace: 'dash_core_components', type: 'Graph', props: props};
+    }
+
+    const rule = {namespace: 'dash_html_components', type: 'Hr', props: {}};
+
+    const emptyFigure = {data: [], layout: {}};
+
+    function renderTab(payload, tab, compareMode, theme) {
+        if (!payload || !theme || !payload.cells.length || !payload.pis.length) {
+            return [graph(emptyFigure)];
+        }
+        const series = unpack(payload);
+        const pis = orderedPiCharts.has(tab) ? payload.pis : payload.pis.slice().sort();
+        if (tab === 'tab-line' && payload.cells.length > 1) {
+            // Cells are compared in a fixed order, whichever order they were selected in
+            return [graph(comparisonChart(series, payload.cells.slice().sort(), pis, payload, theme, compareMode))];
+        }
+        const content = [];
+        payload.cells.forEach(cell => {
+            const figure = chartFunctions[tab](series, cell, pis, payload, theme);
+            // Line charts load more detail from the server as they are zoomed into
+            content.push(tab === 'tab-line' ? graph(figure, {type: 'line-graph', cell: cell}) : graph(figure));
+            content.push(rule);
+        });
+        return content;
+    }
+
+    const noUpdate = () => window.dash_clientside.no_update;
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        charts: {
+            // Draw the active tab, or show the server-rendered network heatmaps or correlations in its place
+            render_tab: function (payload, tab, compareMode, heatmapScope, theme) {
+                const hidden = {display: 'none'};
+                if (tab === 'tab-heatmap' && heatmapScope === 'network') {
+                    return [[], {}, hidden];
+                }
+                if (tab === 'tab-corr') {
+                    return [[], hidden, {}];
+                }
+                return [renderTab(payload, tab, compareMode, theme), hidden, hidden];
+            },
+            // Ask the server for network heatmaps only while they are shown and their options changed
+            network_request: function (tab, heatmapScope, heatmapSort, pis, startDate, endDate, frequency, viewportWidth,
+                                       dataVersion, current) {
+                if (tab !== 'tab-heatmap' || heatmapScope !== 'network') {
+                    return noUpdate();
+                }
+                const request = {pis: pis, start_date: startDate, end_date: endDate, frequency: frequency,
+                                 sort: heatmapSort, viewport: viewportWidth, rows: dataVersion ? dataVersion.rows : null};
+                return JSON.stringify(request) === JSON.stringify(current) ? noUpdate() : request;
+            },
+            // Ask the server for correlations only while they are shown and their options changed
+            correlation_request: function (tab, cells, pis, startDate, endDate, frequency, method, scope, maxLag,
+                                           dataVersion, current) {
+                if (tab !== 'tab-corr') {
+                    return noUpdate();
+                }
+                const request = {cells: cells, pis: pis, start_date: startDate, end_date: endDate, frequency: frequency,
+                                 method: method, scope: scope, max_lag: maxLag || 0, rows: dataVersion ? dataVersion.rows : null};
+                return JSON.stringify(request) === JSON.stringify(current) ? noUpdate() : request;
+            },
+        },
+    });
+
+    // Exposed for checking the browser's charts against the server's
+    window.kpiCharts = {decodeArray: decodeArray, unpack: unpack, lttbIndices: lttbIndices, minMaxIndices: minMaxIndices,
+                        renderTab: renderTab};
+})();
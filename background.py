@@ -0,0 +1,140 @@
+import time
+import uuid
+from functools import wraps
+
+from dash import DiskcacheManager
+
+# Job ID handed out for requests answered from the result cache; no process is started for them
+CACHED_JOB = -1
+
+
+def job_pid(job):
+    """
+    Return the process ID of a job ID handed out by SharedJobManager.
+
+    Args:
+        job (str | int): Job ID of the form `<pid>:<waiter token>`, or a bare process ID.
+
+    Returns:
+        int: ID of the process running the job.
+
+    """
+    return int(str(job).split(':', 1)[0])
+
+
+class SharedJobManager(DiskcacheManager):
+    """
+    Background callback manager that runs identical in-flight requests as one job.
+
+    Like DiskcacheManager, each job runs in its own process and stores its
+    result in a local diskcache. A request whose cache key matches a job that
+    is still running joins that job instead of starting another process, and
+    a request whose result is already cached starts no job at all. Every
+    request gets a job ID of its own, `<pid>:<waiter token>`, and the job's
+    process is only terminated once every token was released by cancelling
+    or answering its request; releasing a token twice has no effect.
+    Results must outlive the first request that reads them, so `cache_by` is
+    required.
+
+    With enabled metrics, each job collects the stage timings it records and
+    stores them next to its result, to be replayed by the server process when
+    the result is first handed out.
+
+    Args:
+        cache (diskcache.Cache): Cache holding the jobs' results and bookkeeping.
+        cache_by (list): Zero-argument functions whose values are part of every cache key.
+        expire (int, optional): Seconds a result is kept after it was last read.
+        metrics (instrumentation.Metrics, optional): Metrics the jobs' timings are recorded into.
+
+    """
+
+    def __init__(self, cache, cache_by, expire=None, metrics=None):
+        # Callbacks are registered, and their job functions made, as soon as the manager exists
+        self.metrics = metrics
+        super().__init__(cache, cache_by=cache_by, expire=expire)
+
+    def make_job_fn(self, fn, progress):
+        if self.metrics is None or not self.metrics.enabled:
+            return super().make_job_fn(fn, progress)
+        metrics, cache, expire = self.metrics, self.handle, self.expire
+        # Result key of the job running in this process; every job is a process of its own
+        job = {}
+
+        @wraps(fn)
+        def instrumented_fn(*args, **kwargs):
+            with metrics.collect() as events:
+                start = time.perf_counter()
+                profiler = metrics.start_profile()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    metrics.stop_profile(profiler, fn.__name__, time.perf_counter() - start)
+                    # Stored before the result, which the server may hand out as soon as it exists
+                    cache.set(('metrics', job['key']), events, expire=expire)
+
+        job_fn = super().make_job_fn(instrumented_fn, progress)
+
+        def instrumented_job_fn(result_key, progress_key, user_callback_args, context):
+            job['key'] = result_key
+            job_fn(result_key, progress_key, user_callback_args, context)
+
+        return instrumented_job_fn
+
+    def call_job_fn(self, key, job_fn, args, context):
+        token = uuid.uuid4().hex
+        with self.handle.transact():
+            if self.result_ready(key):
+                return CACHED_JOB
+            pid = self.handle.get(('job', key))
+            if pid is not None and self.job_running(pid):
+                self.handle.set(('waiters', pid), self.handle.get(('waiters', pid), set()) | {token},
+                                expire=self.expire)
+                return f'{pid}:{token}'
+        # Start the process outside the transaction, so it does not inherit the cache's lock
+        if self.metrics is None:
+            pid = super().call_job_fn(key, job_fn, args, context)
+        else:
+            with self.metrics.stage('job_start'):
+                pid = super().call_job_fn(key, job_fn, args, context)
+        with self.handle.transact():
+            self.handle.set(('waiters', pid), {token}, expire=self.expire)
+            self.handle.set(('job', key), pid, expire=self.expire)
+        return f'{pid}:{token}'
+
+    def get_result(self, key, job):
+        if self.metrics is None or not self.metrics.enabled:
+            return super().get_result(key, job)
+        with self.metrics.stage('job_result'):
+            result = super().get_result(key, job)
+            # Only the first request handed the result replays the job's timings
+            events = self.handle.pop(('metrics', key), default=None)
+            if events is not None:
+                self.metrics.replay(events)
+        return result
+
+    def terminate_job(self, job):
+        if job is None or job_pid(job) == CACHED_JOB:
+            return
+        pid, _, token = str(job).partition(':')
+        pid = int(pid)
+        with self.handle.transact():
+            waiters = self.handle.get(('waiters', pid))
+            # Dash may release a request twice, once when handing out its result and once more
+            # while the process is still exiting; only the first release counts
+            if waiters is None or token not in waiters:
+                return
+            waiters = waiters - {token}
+            # Keep the job running while other requests still wait on it
+            if waiters:
+                self.handle.set(('waiters', pid), waiters, expire=self.expire)
+                return
+            self.handle.delete(('waiters', pid))
+        super().terminate_job(pid)
+
+    def terminate_unhealthy_job(self, job):
+        return super().terminate_unhealthy_job(job_pid(job))
+
+    def job_running(self, job):
+        if job_pid(job) == CACHED_JOB:
+            return False
+        return super().job_running(job_pid(job))
@@ -0,0 +1,248 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import plotly
+
+from synthetic_data import write_kpi_csv
+
+# Directory the benchmark datasets are generated into, reused across runs
+bench_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data', '.cache', 'bench')
+
+
+def percentiles(timings):
+    """
+    Summarize the timings of a benchmark.
+
+    Args:
+        timings (list): Durations of the runs, in seconds.
+
+    Returns:
+        dict: Number of runs, and mean, p50, p90, p99 and max latency in milliseconds.
+
+    """
+    ms = np.array(timings) * 1000
+    p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+    return {'runs': len(ms), 'mean_ms': ms.mean(), 'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99, 'max_ms': ms.max()}
+
+
+def measure(func, repeat, setup=None):
+    """
+    Time repeated runs of a function, then measure its peak memory in one more run.
+
+    Memory is traced in a separate run, as tracing slows down allocations.
+
+    Args:
+        func (callable): Function to benchmark, called without arguments.
+        repeat (int): Number of timed runs.
+        setup (callable, optional): Called before every run, outside the timing,
+            for instance to clear caches.
+
+    Returns:
+        tuple: (timing summary, peak memory in MB, result of the last run).
+
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    if setup:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return percentiles(timings), peak / 1024 ** 2, result
+
+
+def dataset_path(cells, pis, days, freq, seed):
+    """
+    Get the path of a synthetic dataset, generating it on first use.
+
+    Args:
+        cells (int): Number of cells.
+        pis (int): Number of PIs per cell.
+        days (float): Number of days covered.
+        freq (str): Sampling frequency.
+        seed (int): Random seed.
+
+    Returns:
+        str: Path of the CSV file.
+
+    """
+    path = os.path.join(bench_dir, f'kpi_{cells}c_{pis}p_{days:g}d_{freq}_s{seed}.csv')
+    if not os.path.exists(path):
+        periods = int(pd.Timedelta(days=days) / pd.Timedelta(pd.tseries.frequencies.to_offset(freq)))
+        start = time.perf_counter()
+        rows = write_kpi_csv(path, n_cells=cells, n_pis=pis, periods=periods, freq=freq, seed=seed)
+        print(f'Generated {rows} rows in {time.perf_counter() - start:.1f}s: {path}', file=sys.stderr)
+    return path
+
+
+def git_revision():
+    """
+    Get the commit the benchmarked tree is at, if it is a git checkout.
+
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.realpath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(args):
+    """
+    Benchmark loading, resampling, every chart, the summary tables and figure serialization.
+
+    Args:
+        args (argparse.Namespace): Parsed command line options.
+
+    Returns:
+        dict: Run metadata and one result per benchmark.
+
+    """
+    path = dataset_path(args.cells, args.pis, args.days, args.freq, args.seed)
+    # Point the dashboard at the synthetic dataset before it loads its data at import
+    os.environ['KPI_DATA_FILE'] = path
+    os.environ.pop('KPI_DROP_DIR', None)
+    start = time.perf_counter()
+    import functions
+    import app
+    import_seconds = time.perf_counter() - start
+    # With KPI_LAZY_LOAD=1 the data is still loading in the background
+    functions.load_dataset()
+
+    results = []
+
+    def record(name, func, repeat=args.repeat, setup=None, payload=None):
+        timing, peak_mb, result = measure(func, repeat, setup)
+        entry = {'name': name, **timing, 'peak_mb': peak_mb}
+        if payload:
+            entry['payload_bytes'] = payload(result)
+        results.append(entry)
+        print(f"{name:<32} p50 {entry['p50_ms']:9.1f} ms  p99 {entry['p99_ms']:9.1f} ms  "
+              f"peak {peak_mb:8.1f} MB" + (f"  {entry['payload_bytes']:>10} B" if payload else ''), file=sys.stderr)
+        return result
+
+    record('load_data[csv]', lambda: functions.load_data(path, use_cache=False), repeat=args.load_repeat)
+    # Build the columnar cache once, so that the cached load is measured alone
+    functions.load_data(path)
+    record('load_data[cache]', lambda: functions.load_data(path), repeat=args.load_repeat)
+
+    cells = list(functions.cell_ids)
+    pis = list(functions.pis[:args.chart_pis])
+    date_range = (functions.min_date, functions.max_date)
+
+    def clear_caches():
+        functions._query_cells.cache_clear()
+        functions.figure_cache.clear()
+
+    for frequency in ['H', 'D', 'W']:
+        record(f'resample_data[{frequency}]', lambda: functions.resample_data(cells[0], pis, date_range, frequency))
+
+    # Charts are built from the hourly data of the whole range, the heaviest selection of the dashboard
+    for tab, chart_func in functions.chart_func_dict.items():
+        options = {'max_points': functions.point_budget()} if tab in functions.downsampled_charts else {}
+        figure = record(f'chart[{tab}]', lambda: chart_func(cells[0], pis, date_range, 'H', **options),
+                        setup=clear_caches)
+        record(f'to_json[{tab}]', figure.to_json, payload=lambda payload: len(payload.encode()))
+
+    summary_cells = cells[:args.summary_cells]
+    start_date, end_date = str(functions.min_date.date()), str(functions.max_date.date())
+    record(f'update_summary_tables[{len(summary_cells)} cells]',
+           lambda: app.update_summary_tables(summary_cells, pis, start_date, end_date),
+           payload=lambda tables: len(json.dumps(tables, cls=plotly.utils.PlotlyJSONEncoder).encode()))
+
+    return {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'cpus': os.cpu_count(),
+        'dataset': {'cells': args.cells, 'pis': args.pis, 'days': args.days, 'freq': args.freq,
+                    'seed': args.seed, 'rows': len(functions.store)},
+        'import_seconds': import_seconds,
+        # Peak resident set size of the whole run, in MB (ru_maxrss is in kilobytes on Linux)
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """
+    Print the change in median latency and peak memory against a baseline report.
+
+    Args:
+        report (dict): Report of this run.
+        baseline (dict): Report of an earlier run.
+        threshold (float): Relative slowdown or growth reported as a regression.
+
+    Returns:
+        list: Names of the benchmarks that regressed.
+
+    """
+    previous = {entry['name']: entry for entry in baseline['results']}
+    regressions = []
+    print(f"\nCompared with {baseline.get('revision') or 'baseline'}:")
+    for entry in report['results']:
+        old = previous.get(entry['name'])
+        if old is None:
+            continue
+        latency = entry['p50_ms'] / old['p50_ms'] - 1 if old['p50_ms'] else 0
+        memory = entry['peak_mb'] / old['peak_mb'] - 1 if old['peak_mb'] else 0
+        regressed = latency > threshold or memory > threshold
+        if regressed:
+            regressions.append(entry['name'])
+        print(f"{entry['name']:<32} p50 {latency:+7.1%}  peak {memory:+7.1%}" + ('  REGRESSION' if regressed else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard on a synthetic 5G NR KPI dataset.')
+    parser.add_argument('--cells', type=int, default=100, help='number of cells')
+    parser.add_argument('--pis', type=int, default=10, help='number of PIs per cell')
+    parser.add_argument('--days', type=float, default=90, help='number of days covered')
+    parser.add_argument('--freq', default='H', help='sampling frequency of the dataset')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the dataset')
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per benchmark')
+    parser.add_argument('--load-repeat', type=int, default=3, help='timed runs of load_data')
+    parser.add_argument('--chart-pis', type=int, default=3, help='PIs selected in the charts')
+    parser.add_argument('--summary-cells', type=int, default=10, help='cells selected in the summary tables')
+    parser.add_argument('--output', help='write the report to this JSON file')
+    parser.add_argument('--baseline', help='JSON report of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown or memory growth that fails the comparison')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
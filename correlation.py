@@ -0,0 +1,186 @@
+import numpy as np
+
+# Correlation coefficients offered by the correlation tab
+CORRELATION_METHODS = ('pearson', 'spearman')
+
+
+def average_ranks(matrix):
+    """
+    Rank the values of each column, giving tied values the average of their ranks.
+
+    Args:
+        matrix (np.ndarray): 2-D array of values, with NaN for missing ones.
+
+    Returns:
+        np.ndarray: Ranks starting at 1, with NaN where the values are missing.
+
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    n, p = matrix.shape
+    # NaN sort last in every column
+    order = np.argsort(matrix, axis=0, kind='stable')
+    ordered = np.take_along_axis(matrix, order, axis=0).T.ravel()
+    # A group of ties starts at each column's first value and wherever the value changes
+    starts = np.ones(n * p, dtype=bool)
+    if n > 1:
+        starts.reshape(p, n)[:, 1:] = ordered.reshape(p, n)[:, 1:] != ordered.reshape(p, n)[:, :-1]
+    first = np.flatnonzero(starts)
+    last = np.append(first[1:], n * p) - 1
+    group_ranks = (first % n + last % n) / 2 + 1
+    ranks = np.empty_like(matrix)
+    np.put_along_axis(ranks, order, group_ranks[np.cumsum(starts) - 1].reshape(p, n).T, axis=0)
+    ranks[np.isnan(matrix)] = np.nan
+    return ranks
+
+
+def _prepare(matrix):
+    """
+    Center the columns of a matrix and replace its missing values by zeros.
+
+    Centering leaves the correlations unchanged and keeps the sums of squares precise.
+
+    Args:
+        matrix (np.ndarray): 2-D array of values, with NaN for missing ones.
+
+    Returns:
+        tuple: (centered values, their squares, mask of 1.0 where values are present).
+
+    """
+    present = ~np.isnan(matrix)
+    mask = present.astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        values = np.where(present, matrix - np.nansum(matrix, axis=0) / mask.sum(axis=0), 0)
+    return values, values * values, mask
+
+
+def _from_sums(count, sum_a, sum_b, products, squares_a, squares_b, min_periods):
+    """
+    Compute correlations from the sums over the rows where both columns of each pair have a value.
+
+    Args:
+        count (np.ndarray): Number of rows of each pair.
+        sum_a (np.ndarray): Sum of the first column of each pair.
+        sum_b (np.ndarray): Sum of the second column of each pair.
+        products (np.ndarray): Sum of the products of both columns.
+        squares_a (np.ndarray): Sum of the squares of the first column.
+        squares_b (np.ndarray): Sum of the squares of the second column.
+        min_periods (int): Fewest rows for a pair to be correlated.
+
+    Returns:
+        tuple: (correlations, number of rows with both values).
+
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = products - sum_a * sum_b / count
+        variance_a = squares_a - sum_a * sum_a / count
+        variance_b = squares_b - sum_b * sum_b / count
+        correlation = covariance / np.sqrt(variance_a * variance_b)
+    correlation[(count < min_periods) | ~(variance_a > 0) | ~(variance_b > 0)] = np.nan
+    return np.clip(correlation, -1, 1), np.rint(count).astype(np.int64)
+
+
+def _correlate(a, b, min_periods):
+    """
+    Correlate the columns of two prepared matrices from matrix products of their values and masks.
+
+    Args:
+        a (tuple): Output of `_prepare`.
+        b (tuple): Output of `_prepare`, with as many rows as `a`.
+        min_periods (int): Fewest rows with both values for a pair to be correlated.
+
+    Returns:
+        tuple: (correlations, number of rows with both values).
+
+    """
+    values_a, squares_a, mask_a = a
+    values_b, squares_b, mask_b = b
+    return _from_sums(mask_a.T @ mask_b, values_a.T @ mask_b, mask_a.T @ values_b, values_a.T @ values_b,
+                      squares_a.T @ mask_b, mask_a.T @ squares_b, min_periods)
+
+
+def pairwise_correlation(a, b, min_periods=3):
+    """
+    Compute the Pearson correlation of every column of `a` with every column of `b`.
+
+    Each pair of columns is correlated over the rows where both have a value,
+    with all pairs computed at once from matrix products of the values and of
+    their masks.
+
+    Args:
+        a (np.ndarray): 2-D array of values, with NaN for missing ones.
+        b (np.ndarray): 2-D array of values with as many rows as `a`.
+        min_periods (int): Fewest rows with both values for a pair to be correlated.
+
+    Returns:
+        tuple: (correlations, number of rows with both values), each with a row per
+        column of `a` and a column per column of `b`. Pairs with too few rows,
+        or where a column is constant, have a NaN correlation.
+
+    """
+    return _correlate(_prepare(np.asarray(a, dtype=np.float64)), _prepare(np.asarray(b, dtype=np.float64)), min_periods)
+
+
+def correlation_matrix(matrix, method='pearson', min_periods=3):
+    """
+    Compute the correlation of every pair of columns.
+
+    Spearman's coefficient is the Pearson correlation of the ranks. Each column
+    is ranked once over all of its values, rather than once per pair over the
+    rows that both columns have, so with missing values it is an approximation.
+
+    Args:
+        matrix (np.ndarray): 2-D array with a column per variable, and NaN for missing values.
+        method (str): One of CORRELATION_METHODS.
+        min_periods (int): Fewest rows with both values for a pair to be correlated.
+
+    Returns:
+        tuple: (correlation matrix, number of rows with both values).
+
+    """
+    if method == 'spearman':
+        matrix = average_ranks(matrix)
+    return pairwise_correlation(matrix, matrix, min_periods)
+
+
+def lagged_correlations(matrix, groups, reference, lags, method='pearson', min_periods=3):
+    """
+    Correlate one column with every column at a range of lags.
+
+    Rows must be consecutive periods of a regular grid, with the rows of each
+    group (e.g. each cell) kept together, so that shifting by k rows shifts by
+    k periods. Pairs of rows from different groups are left out.
+
+    Args:
+        matrix (np.ndarray): 2-D array with a column per variable, and NaN for missing values.
+        groups (np.ndarray): Group of each row.
+        reference (int): Column correlated with the others.
+        lags (np.ndarray): Lags in periods; at lag k, the reference at period t is paired
+            with the other columns at period t + k.
+        method (str): One of CORRELATION_METHODS.
+        min_periods (int): Fewest pairs of rows for a correlation.
+
+    Returns:
+        np.ndarray: Correlations with a row per lag and a column per column.
+
+    """
+    if method == 'spearman':
+        matrix = average_ranks(matrix)
+    n, p = matrix.shape
+    values, squares, mask = _prepare(np.asarray(matrix, dtype=np.float64))
+    # Every sum at a lag comes from one product of the reference column with shifted rows of this matrix
+    stacked = np.hstack((mask, values, squares))
+    reference_stacked = stacked[:, [reference, p + reference, 2 * p + reference]]
+    correlations = np.full((len(lags), p), np.nan)
+    for i, lag in enumerate(lags):
+        shift = abs(int(lag))
+        if shift >= n:
+            continue
+        earlier, later = slice(0, n - shift), slice(shift, n)
+        leading, following = (earlier, later) if lag >= 0 else (later, earlier)
+        # Pairs of rows from different groups are zeroed out of the reference column
+        same_group = groups[:n - shift] == groups[shift:]
+        reference_columns = reference_stacked[leading] * same_group[:, None]
+        sums = reference_columns.T @ stacked[following]
+        correlations[i] = _from_sums(sums[0, :p], sums[1, :p], sums[0, p:2 * p], sums[1, p:2 * p],
+                                     sums[2, :p], sums[0, 2 * p:], min_periods)[0]
+    return correlations
@@ -0,0 +1,58 @@
+import numpy as np
+
+
+def shared_histograms(groups, bins=20):
+    """
+    Count the values of several groups into the same bins.
+
+    Args:
+        groups (list): One array of values per group, without NaN values.
+        bins (int): Number of bins spanning the values of all groups.
+
+    Returns:
+        tuple: (bin edges, list of bin counts per group).
+
+    """
+    values = np.concatenate([np.asarray(group, dtype=np.float64) for group in groups]) if groups else np.array([])
+    edges = np.histogram_bin_edges(values, bins=bins)
+    return edges, [np.histogram(group, bins=edges)[0] for group in groups]
+
+
+def box_stats(values, max_outliers=500):
+    """
+    Compute the statistics drawn by a box plot.
+
+    Quartiles are interpolated linearly, as Plotly does by default. Whiskers
+    reach the most extreme values within 1.5 times the interquartile range of
+    the box, and the values beyond them are outliers.
+
+    Args:
+        values (np.ndarray): Values, without NaN values.
+        max_outliers (int): Maximum number of outliers to keep; the most extreme
+            ones are kept.
+
+    Returns:
+        dict: 'q1', 'median', 'q3', 'lowerfence', 'upperfence', 'mean' and
+        'outliers', or None if there are no values.
+
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return None
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    inside = values[(values >= low) & (values <= high)]
+    outliers = values[(values < low) | (values > high)]
+    if len(outliers) > max_outliers:
+        # Keep the values furthest outside the box
+        distance = np.maximum(q1 - outliers, outliers - q3)
+        outliers = outliers[np.argpartition(-distance, max_outliers - 1)[:max_outliers]]
+    return {
+        'q1': q1,
+        'median': median,
+        'q3': q3,
+        'lowerfence': inside.min(),
+        'upperfence': inside.max(),
+        'mean': values.mean(),
+        'outliers': np.sort(outliers),
+    }
@@ -0,0 +1,122 @@
+import numpy as np
+
+
+def _bucket_argmax(scores, starts):
+    """
+    Find the position of the highest score within each bucket.
+
+    Args:
+        scores (np.ndarray): Score of every point.
+        starts (np.ndarray): Offset of each bucket's first point, in increasing order.
+
+    Returns:
+        np.ndarray: Position of the highest-scoring point of each bucket.
+
+    """
+    buckets = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(scores))))
+    # Sort by bucket, then by descending score; each bucket's winner comes first
+    order = np.lexsort((-scores, buckets))
+    return order[starts]
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Select points with the Largest-Triangle-Three-Buckets algorithm.
+
+    The first and last points are always kept and the points in between are
+    split into `n_out - 2` buckets, from each of which the point forming the
+    largest triangle with its neighbouring buckets is kept. To stay fully
+    vectorized, both neighbours are represented by their bucket averages
+    rather than by the previously selected point.
+
+    Args:
+        x (np.ndarray): Sorted x coordinates (numeric or datetime64).
+        y (np.ndarray): y coordinates, without NaN values.
+        n_out (int): Number of points to keep.
+
+    Returns:
+        np.ndarray: Sorted positions of the kept points.
+
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x)
+    x = (x.astype(np.int64) if x.dtype.kind == 'M' else x).astype(np.float64)
+    # Work relative to the first point to keep the cumulative sums precise
+    x = x - x[0]
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)
+    # Bucket averages from cumulative sums
+    cum_x = np.concatenate(([0.0], np.cumsum(x)))
+    cum_y = np.concatenate(([0.0], np.cumsum(y)))
+    mean_x = (cum_x[edges[1:]] - cum_x[edges[:-1]]) / counts
+    mean_y = (cum_y[edges[1:]] - cum_y[edges[:-1]]) / counts
+    prev_x, prev_y = np.append(x[0], mean_x[:-1]), np.append(y[0], mean_y[:-1])
+    next_x, next_y = np.append(mean_x[1:], x[-1]), np.append(mean_y[1:], y[-1])
+    bucket = np.repeat(np.arange(len(counts)), counts)
+    inner_x, inner_y = x[1:-1], y[1:-1]
+    # Twice the triangle area; the constant factor does not change the winner
+    area = np.abs((prev_x[bucket] - next_x[bucket]) * (inner_y - prev_y[bucket])
+                  - (prev_x[bucket] - inner_x) * (next_y[bucket] - prev_y[bucket]))
+    selected = _bucket_argmax(area, edges[:-1] - 1) + 1
+    return np.concatenate(([0], selected, [n - 1]))
+
+
+def min_max_indices(y, n_out):
+    """
+    Select the minimum and maximum point of equally sized buckets.
+
+    Keeping both extremes of every bucket preserves peaks and dips, which
+    makes it suited to bar charts of alarms and outliers.
+
+    Args:
+        y (np.ndarray): y coordinates, without NaN values.
+        n_out (int): Number of points to keep (two per bucket).
+
+    Returns:
+        np.ndarray: Sorted positions of the kept points.
+
+    """
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    y = np.asarray(y, dtype=np.float64)
+    starts = np.linspace(0, n, n_out // 2, endpoint=False).astype(np.int64)
+    return np.unique(np.concatenate((_bucket_argmax(y, starts), _bucket_argmax(-y, starts))))
+
+
+def density_grid(x, y, bins=100, max_points=500):
+    """
+    Bin the points of a scatter plot into a grid, keeping the isolated ones.
+
+    Dense areas are drawn as the number of points in each cell of the grid,
+    which costs the same whatever the number of points. Points alone in their
+    cell are kept as they are, so that outliers stay visible.
+
+    Args:
+        x (np.ndarray): x coordinates, without NaN values.
+        y (np.ndarray): y coordinates, without NaN values.
+        bins (int): Number of grid cells along each axis.
+        max_points (int): Maximum number of isolated points to keep.
+
+    Returns:
+        tuple: (x bin centers, y bin centers, counts with a row per y bin and a
+        column per x bin, positions of the isolated points).
+
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    edges = []
+    for values in (x, y):
+        low, high = (values.min(), values.max()) if len(values) else (0.0, 1.0)
+        if low == high:
+            low, high = low - 0.5, high + 0.5
+        edges.append(np.linspace(low, high, bins + 1))
+    # As in np.histogram, the last bin includes its upper edge
+    column = np.clip(np.searchsorted(edges[0], x, side='right') - 1, 0, bins - 1)
+    row = np.clip(np.searchsorted(edges[1], y, side='right') - 1, 0, bins - 1)
+    counts = np.bincount(row * bins + column, minlength=bins * bins).reshape(bins, bins)
+    isolated = np.flatnonzero(counts.ravel()[row * bins + column] == 1)[:max_points]
+    centers = [(edge[:-1] + edge[1:]) / 2 for edge in edges]
+    return centers[0], centers[1], counts, isolated
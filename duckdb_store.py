@@ -0,0 +1,444 @@
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+from kpi_store import _BUCKET_WIDTHS, MAD_SCALE, KPIStore, Rollup
+from partitions import PartitionedDataset, connect, sql_files
+
+# SQL expression of the bucket label of 'date_time' for each frequency, as pandas' `resample` labels buckets
+bucket_expressions = {
+    'H': "date_trunc('hour', date_time)",
+    'D': "date_trunc('day', date_time)",
+    # Weeks start on Monday and are labelled with their closing Sunday
+    'W': "date_trunc('week', date_time) + INTERVAL 6 DAY",
+}
+
+# Table with the KPI table's columns and no rows, read when no file can hold the requested rows
+empty_source = ('SELECT NULL::TIMESTAMP AS date_time, NULL::VARCHAR AS cell_id, NULL::VARCHAR AS kpi_category, '
+                'NULL::VARCHAR AS pi, NULL::FLOAT AS value WHERE false')
+
+# Source of data versions; every store (and every change to one) gets a new version
+_versions = itertools.count(1)
+
+
+def frame_stats(df):
+    """
+    Summarize the rows of a DataFrame the way `DuckDBStore` summarizes each file.
+
+    Args:
+        df (pd.DataFrame): KPI rows.
+
+    Returns:
+        dict: 'cells', 'pis' and 'categories' found, number of 'rows', and 'first' and 'last' timestamps.
+
+    """
+    return {
+        'cells': set(df['cell_id'].dropna()),
+        'pis': set(df['pi'].dropna()),
+        'categories': set(df['kpi_category'].dropna()),
+        'rows': len(df),
+        'first': df['date_time'].min(),
+        'last': df['date_time'].max(),
+    }
+
+
+class DuckDBStore:
+    """
+    KPI table kept in a partitioned Parquet dataset on disk and queried with DuckDB.
+
+    It answers the same queries as KPIStore for datasets that do not fit in
+    memory. A query only reads the files of the partitions overlapping its
+    cells and date range (see `PartitionedDataset`), so its cost grows with
+    the selection rather than with the history kept. The filters and the
+    time-bucket aggregation run in DuckDB, and only the aggregated result is
+    brought into pandas.
+
+    The store reads a snapshot of the dataset's manifest. Only the cells, PIs,
+    categories, row count and date bounds of each file are held in memory;
+    `refresh` picks up files appended or compacted since, summarizing only the
+    new files. Rows appended with `append` are kept in memory and queried along
+    with the files; like the appended arrays of a memory-mapped KPIStore, they
+    are private to the process.
+
+    Args:
+        path (str): Directory of the partitioned dataset.
+        config (tuple): (name, value) pairs of DuckDB settings, such as 'memory_limit'.
+        manifest (dict, optional): Manifest of the dataset; the current one if omitted.
+        file_stats (dict, optional): Summaries of files already read, by file; reused
+            for the files of the manifest that they cover.
+        appended (pd.DataFrame, optional): Rows appended in memory.
+
+    """
+
+    def __init__(self, path, config=(), manifest=None, file_stats=None, appended=None):
+        self.path = path
+        self.config = config
+        self.dataset = PartitionedDataset(path, config)
+        self.manifest = self.dataset.read_manifest() if manifest is None else manifest
+        self.appended = appended
+        self.file_stats = self._read_file_stats(file_stats or {})
+        stats = list(self.file_stats.values()) + ([frame_stats(appended)] if appended is not None else [])
+        self.cell_names = np.array(sorted(set().union(*(s['cells'] for s in stats))), dtype=object)
+        self.pi_names = np.array(sorted(set().union(*(s['pis'] for s in stats))), dtype=object)
+        self.category_names = np.array(sorted(set().union(*(s['categories'] for s in stats))), dtype=object)
+        self.rows = sum(s['rows'] for s in stats)
+        self.first = min((s['first'] for s in stats), default=pd.NaT)
+        self.last = max((s['last'] for s in stats), default=pd.NaT)
+        # Identifies the data held by the store, for invalidating derived caches
+        self.version = next(_versions)
+
+    def _read_file_stats(self, known):
+        """
+        Summarize the live files of the manifest, reusing known summaries.
+
+        Args:
+            known (dict): Summaries of files already read, by file.
+
+        Returns:
+            dict: Summary of every live file (see `frame_stats`), by file.
+
+        """
+        files = [file for files in self.manifest['partitions'].values() for file in files]
+        stats = {file: known[file] for file in files if file in known}
+        new_files = [file for file in files if file not in known]
+        if new_files:
+            summaries = self._execute(f"""
+                SELECT filename, list(DISTINCT cell_id) AS cells, list(DISTINCT pi) AS pis,
+                       list(DISTINCT kpi_category) AS categories, count(*) AS rows,
+                       min(date_time) AS first, max(date_time) AS last
+                FROM read_parquet({sql_files([os.path.join(self.path, file) for file in new_files])},
+                                  hive_partitioning = false, filename = true)
+                GROUP BY filename
+            """, appended=False)
+            for row in summaries.itertuples(index=False):
+                stats[os.path.relpath(row.filename, self.path)] = {
+                    'cells': set(row.cells) - {None}, 'pis': set(row.pis) - {None},
+                    'categories': set(row.categories) - {None}, 'rows': row.rows,
+                    'first': pd.Timestamp(row.first), 'last': pd.Timestamp(row.last),
+                }
+        return stats
+
+    def refresh(self):
+        """
+        Return a store over the current files of the dataset, or this one if they have not changed.
+
+        Returns:
+            DuckDBStore: The up-to-date store, keeping the rows appended in memory.
+
+        """
+        manifest = self.dataset.read_manifest()
+        if manifest['version'] == self.manifest['version']:
+            return self
+        return DuckDBStore(self.path, self.config, manifest, self.file_stats, self.appended)
+
+    def _rows(self, cell_ids=None, pis=None, start_date=None, end_date=None, double=False):
+        """
+        Build the SQL selecting the rows of some cells and PIs within a date range.
+
+        Only the files of the partitions that may hold such rows are read, along
+        with the rows appended in memory.
+
+        Args:
+            cell_ids (str or list, optional): Cell ID(s); all cells if omitted.
+            pis (str or list, optional): Performance Indicator(s); all PIs if omitted.
+            start_date (datetime, optional): Inclusive start of the range.
+            end_date (datetime, optional): Inclusive end of the range.
+            double (bool): Read the values as DOUBLE, for aggregating them.
+
+        Returns:
+            tuple: (SELECT statement with the KPI table's columns, where NaN values
+            are NULL, values of its '?' placeholders).
+
+        """
+        conditions, params = [], []
+        if cell_ids is not None:
+            cell_ids = list(dict.fromkeys(cell_ids if isinstance(cell_ids, list) else [cell_ids]))
+            conditions.append(f"cell_id IN ({', '.join(['?'] * len(cell_ids))})" if cell_ids else 'false')
+            params += cell_ids
+        if pis is not None:
+            pis = list(dict.fromkeys(pis if isinstance(pis, list) else [pis]))
+            conditions.append(f"pi IN ({', '.join(['?'] * len(pis))})" if pis else 'false')
+            params += pis
+        if start_date is not None:
+            conditions.append('date_time >= ?')
+            params.append(pd.Timestamp(start_date).to_pydatetime())
+        if end_date is not None:
+            conditions.append('date_time <= ?')
+            params.append(pd.Timestamp(end_date).to_pydatetime())
+        files = self.dataset.files(self.manifest, cell_ids, start_date, end_date)
+        sources = [f'SELECT date_time, cell_id, kpi_category, pi, value FROM read_parquet({sql_files(files)}, '
+                   f'hive_partitioning = false, union_by_name = true)'] if files else []
+        if self.appended is not None:
+            sources.append('SELECT date_time, cell_id, kpi_category, pi, value FROM appended_rows')
+        value = "nullif(value, 'NaN'::FLOAT)"
+        if double:
+            value = f'CAST({value} AS DOUBLE)'
+        source = ' UNION ALL BY NAME '.join(sources) or empty_source
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        return f'SELECT date_time, cell_id, kpi_category, pi, {value} AS value FROM ({source}){where}', params
+
+    def _execute(self, sql, params=(), appended=True):
+        """
+        Run a query on a cursor of its own, so that threads can query at the same time.
+
+        Args:
+            sql (str): The query.
+            params (list): Values of its '?' placeholders.
+            appended (bool): Whether the query reads the rows appended in memory.
+
+        Returns:
+            pd.DataFrame: The result.
+
+        """
+        with connect(self.config).cursor() as cursor:
+            if appended and self.appended is not None:
+                cursor.register('appended_rows', self.appended)
+            return cursor.execute(sql, list(params)).df()
+
+    def append(self, df):
+        """
+        Return a new store with extra rows, leaving this one untouched.
+
+        Args:
+            df (pd.DataFrame): New rows with 'date_time', 'cell_id', 'kpi_category',
+                'pi' and 'value' columns.
+
+        Returns:
+            DuckDBStore: Store holding the old and new rows.
+
+        """
+        if not len(df):
+            return self
+        rows = df[KPIStore.columns].astype({'cell_id': object, 'kpi_category': object, 'pi': object,
+                                            'value': np.float32})
+        appended = rows if self.appended is None else pd.concat([self.appended, rows], ignore_index=True)
+        return DuckDBStore(self.path, self.config, self.manifest, self.file_stats, appended)
+
+    def __len__(self):
+        return self.rows
+
+    @property
+    def min_date(self):
+        """pd.Timestamp: Earliest timestamp in the store."""
+        return pd.Timestamp(self.first)
+
+    @property
+    def max_date(self):
+        """pd.Timestamp: Latest timestamp in the store."""
+        return pd.Timestamp(self.last)
+
+    def summary(self):
+        """
+        Summarize all the values in the store, like `describe()` on the table.
+
+        The quartiles are approximated by DuckDB, so that no column is sorted in memory.
+
+        Returns:
+            pd.DataFrame: A 'value' row with 'count', 'mean', 'std', 'min', '25%',
+            '50%', '75%' and 'max' columns, rounded to two decimals.
+
+        """
+        rows, params = self._rows(double=True)
+        summary = self._execute(f"""
+            SELECT count(value) AS count, avg(value) AS mean, stddev_samp(value) AS std, min(value) AS min,
+                   approx_quantile(value, 0.25) AS "25%", approx_quantile(value, 0.5) AS "50%",
+                   approx_quantile(value, 0.75) AS "75%", max(value) AS max
+            FROM ({rows})
+        """, params)
+        return summary.set_axis(['value']).astype(np.float64).round(2)
+
+    def count_rows(self, cell_id, pis, start_date=None, end_date=None):
+        """
+        Count the samples of a cell's series within a date range.
+
+        Args:
+            cell_id (str): Cell ID.
+            pis (str or list): Performance Indicator(s).
+            start_date (datetime, optional): Inclusive start of the range.
+            end_date (datetime, optional): Inclusive end of the range.
+
+        Returns:
+            np.ndarray: Number of rows of each PI, in the given order.
+
+        """
+        pis = pis if isinstance(pis, list) else [pis]
+        rows, params = self._rows(cell_id, pis, start_date, end_date)
+        counts = self._execute(f'SELECT pi, count(*) AS rows FROM ({rows}) GROUP BY pi', params)
+        return counts.set_index('pi')['rows'].reindex(pis, fill_value=0).to_numpy()
+
+    def query(self, cell_ids, pis, start_date=None, end_date=None):
+        """
+        Return the raw rows for a list of cells, a list of PIs and a date range.
+
+        Args:
+            cell_ids (str or list): Cell ID(s).
+            pis (str or list): Performance Indicator(s).
+            start_date (datetime, optional): Inclusive start of the range.
+            end_date (datetime, optional): Inclusive end of the range.
+
+        Returns:
+            pd.DataFrame: Matching rows, as returned by `KPIStore.query`.
+
+        """
+        rows = self._execute(*self._rows(cell_ids, pis, start_date, end_date))
+        cell_ids = list(dict.fromkeys(cell_ids if isinstance(cell_ids, list) else [cell_ids]))
+        pis = list(dict.fromkeys(pis if isinstance(pis, list) else [pis]))
+        cells = pd.Categorical(rows['cell_id'], categories=cell_ids)
+        series_pis = pd.Categorical(rows['pi'], categories=pis)
+        times = rows['date_time'].to_numpy(dtype='datetime64[ns]')
+        # Group the rows by cell and PI in the requested order, sorted by time
+        order = np.lexsort((times, series_pis.codes, cells.codes))
+        return pd.DataFrame({
+            'date_time': times[order],
+            'cell_id': cells[order],
+            'kpi_category': pd.Categorical(rows['kpi_category'].to_numpy()[order]),
+            'pi': series_pis[order],
+            'value': rows['value'].to_numpy(dtype=np.float32)[order],
+        }, columns=KPIStore.columns)
+
+    def _rollup_arrays(self, cell_ids, pis, start_date, end_date, frequency):
+        """
+        Compute the per-bucket statistics behind `rollup` as arrays, like `KPIStore._rollup_arrays`.
+
+        DuckDB aggregates the buckets that have rows; the buckets between them
+        are then added empty.
+
+        Args:
+            cell_ids (str or list): Cell ID(s).
+            pis (str or list): Performance Indicator(s).
+            start_date (datetime): Inclusive start of the range.
+            end_date (datetime): Inclusive end of the range.
+            frequency (str): One of ROLLUP_FREQUENCIES.
+
+        Returns:
+            tuple: ((cell_id, pi) of each series with data, series index of each bucket,
+            bucket labels, dict of per-bucket statistic arrays).
+
+        """
+        rows, params = self._rows(cell_ids, pis, start_date, end_date, double=True)
+        buckets = self._execute(f"""
+            SELECT cell_id, pi, {bucket_expressions[frequency]} AS label, count(value) AS count,
+                   coalesce(sum(value), 0) AS sum, min(value) AS min, max(value) AS max,
+                   coalesce(sum(value * value), 0) AS sumsq
+            FROM ({rows}) GROUP BY ALL ORDER BY cell_id, pi, label
+        """, params)
+        cells, bucket_pis = buckets['cell_id'].to_numpy(dtype=object), buckets['pi'].to_numpy(dtype=object)
+        bucket_labels = buckets['label'].to_numpy(dtype='datetime64[ns]')
+        # A new series starts wherever the cell or the PI changes
+        is_first = np.ones(len(buckets), dtype=bool)
+        is_first[1:] = (cells[1:] != cells[:-1]) | (bucket_pis[1:] != bucket_pis[:-1])
+        firsts = np.flatnonzero(is_first)
+        keys = list(zip(cells[firsts], bucket_pis[firsts]))
+        series = np.cumsum(is_first) - 1
+        first_label = bucket_labels[firsts]
+        last_label = bucket_labels[np.append(firsts[1:], len(buckets)) - 1]
+        # Spread the buckets over the full label range of each series, leaving gaps empty
+        width = _BUCKET_WIDTHS[frequency]
+        lengths = (last_label - first_label) // width + 1
+        offsets = np.cumsum(lengths) - lengths
+        full_series = np.repeat(np.arange(len(keys)), lengths)
+        labels = first_label[full_series] + (np.arange(lengths.sum()) - offsets[full_series]) * width
+        slots = offsets[series] + (bucket_labels - first_label[series]) // width
+        columns = {}
+        for stat in Rollup.stats:
+            column = np.full(len(labels), np.nan if stat in ('min', 'max') else 0.0)
+            column[slots] = buckets[stat].to_numpy(dtype=np.float64)
+            columns[stat] = column
+        return keys, full_series, labels, columns
+
+    # The result tables are built from the same arrays as the in-memory store's
+    rollup = KPIStore.rollup
+    rollup_matrix = KPIStore.rollup_matrix
+
+    def describe(self, cell_ids, pis, start_date, end_date, exact=False, by_cell=True):
+        """
+        Summarize the samples of each series in a date range, like `KPIStore.describe`.
+
+        The count, mean, standard deviation, minimum and maximum are exact. The
+        quartiles are approximated by DuckDB, unless `exact` is set.
+
+        Args:
+            cell_ids (str or list): Cell ID(s).
+            pis (str or list): Performance Indicator(s).
+            start_date (datetime): Inclusive start of the range.
+            end_date (datetime): Inclusive end of the range.
+            exact (bool): Compute exact quartiles.
+            by_cell (bool): Summarize each (cell_id, pi) series; otherwise merge
+                the selected cells and summarize each PI across them.
+
+        Returns:
+            pd.DataFrame: 'cell_id' (if by_cell), 'pi', 'count', 'mean', 'std', 'min',
+            '25%', '50%', '75%' and 'max' columns, for the series with samples in the range.
+
+        """
+        rows, params = self._rows(cell_ids, pis, start_date, end_date, double=True)
+        quantile = 'quantile_cont' if exact else 'approx_quantile'
+        groups = 'cell_id, pi' if by_cell else 'pi'
+        result = self._execute(f"""
+            SELECT {groups}, count(value) AS count, avg(value) AS mean, stddev_samp(value) AS std,
+                   min(value) AS min, {quantile}(value, 0.25) AS "25%", {quantile}(value, 0.5) AS "50%",
+                   {quantile}(value, 0.75) AS "75%", max(value) AS max
+            FROM ({rows}) GROUP BY {groups} HAVING count(value) > 0 ORDER BY {groups}
+        """, params)
+        return result.astype({column: np.float64 for column in result.columns[2 if by_cell else 1:]})
+
+    def baselines(self, window, method='zscore', keys=None, since=None, frequency='H'):
+        """
+        Compare the latest bucket of each series with the buckets before it, like `KPIStore.baselines`.
+
+        DuckDB aggregates the buckets and reduces each series' window in one
+        query. With `since`, only the files holding rows of the windows that
+        end after it are read.
+
+        Args:
+            window (int): Number of buckets before the latest one that form its baseline.
+            method (str): 'zscore' or 'mad', see `kpi_store.window_stats`.
+            keys (list, optional): (cell_id, pi) of the series to compare; all series if omitted.
+            since (datetime, optional): Skip the series whose latest bucket is older.
+            frequency (str): One of ROLLUP_FREQUENCIES.
+
+        Returns:
+            pd.DataFrame: 'cell_id', 'pi', 'date_time' (label of the latest bucket),
+            'value' (its mean), 'baseline', 'scale' and 'periods' (non-empty buckets in
+            the baseline) columns, one row per series with data. The cell and PI
+            columns are categoricals.
+
+        """
+        span = pd.Timedelta(_BUCKET_WIDTHS[frequency]) * window
+        cell_ids = None if keys is None else sorted({key[0] for key in keys})
+        pis = None if keys is None else sorted({key[1] for key in keys})
+        start_date = None if since is None else pd.Timestamp(since) - span
+        rows, params = self._rows(cell_ids, pis, start_date, None, double=True)
+        baseline = 'FILTER (WHERE label < latest)'
+        if method == 'mad':
+            center, scale = f'median(mean) {baseline}', f'mad(mean) {baseline} * {MAD_SCALE}'
+        else:
+            center, scale = f'avg(mean) {baseline}', f'stddev_samp(mean) {baseline}'
+        result = self._execute(f"""
+            WITH buckets AS (
+                SELECT cell_id, pi, {bucket_expressions[frequency]} AS label, avg(value) AS mean
+                FROM ({rows}) GROUP BY ALL
+            ), windows AS (
+                SELECT *, max(label) OVER (PARTITION BY cell_id, pi) AS latest FROM buckets
+            )
+            SELECT cell_id, pi, latest AS date_time, max(mean) FILTER (WHERE label = latest) AS value,
+                   {center} AS baseline, {scale} AS scale, count(mean) {baseline} AS periods
+            FROM windows
+            WHERE label >= latest - to_microseconds(?) AND latest >= ?
+            GROUP BY cell_id, pi, latest ORDER BY cell_id, pi
+        """, [*params, span // pd.Timedelta(microseconds=1),
+              pd.Timestamp.min if since is None else pd.Timestamp(since)])
+        if keys is not None:
+            # The query read every pair of the requested cells and PIs
+            result = result[pd.MultiIndex.from_frame(result[['cell_id', 'pi']]).isin(keys)]
+        return pd.DataFrame({
+            'cell_id': pd.Categorical(result['cell_id']),
+            'pi': pd.Categorical(result['pi']),
+            'date_time': result['date_time'].to_numpy(dtype='datetime64[ns]'),
+            'value': result['value'].to_numpy(dtype=np.float64),
+            'baseline': result['baseline'].to_numpy(dtype=np.float64),
+            'scale': result['scale'].to_numpy(dtype=np.float64),
+            'periods': result['periods'].to_numpy(dtype=np.int64),
+        })
@@ -0,0 +1,94 @@
+import io
+import zlib
+
+import numpy as np
+
+# Content type of each export format
+EXPORT_FORMATS = {'csv': 'text/csv', 'arrow': 'application/vnd.apache.arrow.stream'}
+
+# Columns of exported rows
+EXPORT_COLUMNS = ['date_time', 'cell_id', 'pi', 'value']
+
+
+def csv_chunks(frames, columns=EXPORT_COLUMNS):
+    """
+    Encode DataFrames as one CSV document, a piece per frame.
+
+    Values are written at the float32 precision the KPI values are loaded
+    with, so that resampled means, computed in float64, carry no digits that
+    the samples did not have.
+
+    Args:
+        frames (iterable): DataFrames with the given columns.
+        columns (list): Columns written, in order.
+
+    Yields:
+        bytes: The header line, then the rows of each frame.
+
+    """
+    yield (','.join(columns) + '\n').encode()
+    for frame in frames:
+        if 'value' in columns:
+            frame = frame.astype({'value': np.float32})
+        yield frame.to_csv(columns=columns, index=False, header=False, date_format='%Y-%m-%d %H:%M:%S').encode()
+
+
+def arrow_chunks(frames, columns=EXPORT_COLUMNS):
+    """
+    Encode DataFrames as one Arrow IPC stream, a record batch per frame.
+
+    Requires pyarrow.
+
+    Args:
+        frames (iterable): DataFrames with the given columns.
+        columns (list): Columns written, in order.
+
+    Yields:
+        bytes: The schema, then each record batch, then the end-of-stream marker.
+
+    """
+    import pyarrow as pa
+    schema = pa.schema([
+        ('date_time', pa.timestamp('ms')),
+        ('cell_id', pa.string()),
+        ('pi', pa.string()),
+        ('value', pa.float64()),
+    ])
+    schema = pa.schema([schema.field(column) for column in columns])
+    buffer = io.BytesIO()
+
+    def drain():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    with pa.ipc.new_stream(buffer, schema) as writer:
+        yield drain()
+        for frame in frames:
+            # Categorical cells and PIs are written as plain strings, so batches need no shared dictionary
+            writer.write_table(pa.Table.from_pandas(frame[columns].astype({'cell_id': str, 'pi': str}),
+                                                    schema=schema, preserve_index=False, safe=False))
+            yield drain()
+    yield drain()
+
+
+def gzip_chunks(chunks, level=6):
+    """
+    Compress a stream of bytes into a gzip stream, piece by piece.
+
+    Args:
+        chunks (iterable): Pieces of bytes.
+        level (int): zlib compression level.
+
+    Yields:
+        bytes: Pieces of the gzip stream.
+
+    """
+    # A window size of 16 + 15 makes zlib write gzip headers
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
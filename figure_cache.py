@@ -0,0 +1,122 @@
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# Resolution that chart date ranges are truncated to for each resampling frequency
+date_resolutions = {'H': 'H', 'D': 'D', 'W': 'D'}
+
+
+def normalize_chart_args(selected_pis, date_range, frequency, keep_pi_order=False):
+    """
+    Normalize chart inputs so that equivalent requests share a cache entry.
+
+    PIs are de-duplicated and sorted (unless their order matters to the chart),
+    and the date range is widened to whole units of the resolution in use.
+
+    Args:
+        selected_pis (str or list): Selected Performance Indicators.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency.
+        keep_pi_order (bool): Keep the PIs in the order they were selected.
+
+    Returns:
+        tuple: Normalized (selected_pis, date_range).
+
+    """
+    if not isinstance(selected_pis, list):
+        selected_pis = [selected_pis]
+    selected_pis = list(dict.fromkeys(selected_pis)) if keep_pi_order else sorted(set(selected_pis))
+    start_date, end_date = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
+    resolution = date_resolutions.get(frequency)
+    if resolution is not None:
+        start_date = start_date.floor(resolution)
+        end_date = (end_date + pd.Timedelta(1, 'ns')).ceil(resolution) - pd.Timedelta(1, 'ns')
+    return selected_pis, (start_date, end_date)
+
+
+class FigureCache:
+    """
+    Bounded, thread-safe LRU cache of chart figures.
+
+    Figures are kept until the total size of their JSON serialization exceeds
+    `max_bytes`, at which point the least recently used ones are evicted. Each
+    lookup carries the version of the data the figure is built from; when the
+    version changes every cached figure is dropped.
+
+    Args:
+        max_bytes (int): Memory budget for cached figures.
+
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def clear(self):
+        """
+        Drop every cached figure.
+
+        """
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def get(self, key, build, version=None):
+        """
+        Return the cached figure for a key, building and caching it on a miss.
+
+        Args:
+            key (tuple): Hashable, normalized chart inputs.
+            build (callable): Function without arguments that builds the figure.
+            version (hashable, optional): Version of the underlying data.
+
+        Returns:
+            go.Figure: The chart figure.
+
+        """
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.nbytes = 0
+                self.version = version
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        figure = build()
+        nbytes = len(figure.to_json())
+        with self.lock:
+            if version == self.version and key not in self.entries and nbytes <= self.max_bytes:
+                self.entries[key] = (figure, nbytes)
+                self.nbytes += nbytes
+                while self.nbytes > self.max_bytes:
+                    _, (_, evicted_bytes) = self.entries.popitem(last=False)
+                    self.nbytes -= evicted_bytes
+                    self.evictions += 1
+        return figure
+
+    def stats(self):
+        """
+        Report the cache's counters.
+
+        Returns:
+            dict: Hits, misses, evictions, number of entries and bytes in use.
+
+        """
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.nbytes,
+            }
@@ -2,22 +2,175 @@ import pandas as pd
 from dash import Dash, dcc, html, Input, Output, State
 import dash_bootstrap_components as dbc
 import plotly.graph_objs as go
-import plotly.express as px
+import plotly.colors as pc
+import plotly.io as pio
 import numpy as np
-from datetime import timedelta
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
 from plotly.subplots import make_subplots
-from dash import dash_table
-from dash.dash_table.Format import Group
 import os
+import base64
+import logging
+import shutil
+import multiprocessing
+import threading
+import time
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import lru_cache
+from kpi_store import ROLLUP_FREQUENCIES, KPIStore
+from ingest import DropDirectory, read_kpi_csv
+from figure_cache import FigureCache, normalize_chart_args
+from downsample import density_grid, lttb_indices, min_max_indices
+from distribution import box_stats, shared_histograms
+from correlation import CORRELATION_METHODS, correlation_matrix, lagged_correlations
+from instrumentation import Metrics
+from anomalies import AnomalyScan
+
+logger = logging.getLogger(__name__)
+
+# Compact dtypes used for the KPI table
+data_dtypes = {
+    'cell_id': 'category',
+    'kpi_category': 'category',
+    'pi': 'category',
+    'value': 'float32',
+}
+
+# Set KPI_LAZY_LOAD=1 to start workers without the dataset, which is loaded by the first request or warm-up
+lazy_load = os.environ.get('KPI_LAZY_LOAD') == '1'
+
+# CSV file holding the KPI rows, relative to this directory unless absolute
+data_file = os.environ.get('KPI_DATA_FILE', 'data/5G_NR_data.csv')
+
+# Memory budget of the server-side figure cache, in megabytes
+figure_cache_mb = int(os.environ.get('KPI_FIGURE_CACHE_MB', '256'))
+
+# Points per trace for each pixel of viewport width in time-series charts
+points_per_pixel = float(os.environ.get('KPI_POINTS_PER_PIXEL', '1'))
+
+# Query engine of the charts and summaries: 'memory' (the dataset is loaded) or 'duckdb' (it stays in Parquet files)
+data_backend = os.environ.get('KPI_BACKEND', 'memory')
+
+# Partitioned dataset queried by the DuckDB backend (see partitions.py); converted from KPI_DATA_FILE when unset
+parquet_dir = os.environ.get('KPI_PARQUET_DIR')
+
+# Memory the DuckDB backend may use before spilling to disk, e.g. '4GB'; DuckDB's default when unset
+duckdb_memory_limit = os.environ.get('KPI_DUCKDB_MEMORY_LIMIT')
+
+# Set KPI_SHARED_STORE=1 to memory-map the dataset so that WSGI workers share one copy of it
+shared_store = os.environ.get('KPI_SHARED_STORE') == '1'
+
+# Pool that builds figures and summaries in parallel: 'thread', or 'process' (best with KPI_SHARED_STORE=1)
+render_executor_kind = os.environ.get('KPI_RENDER_EXECUTOR', 'thread')
+
+# Worker threads or processes shared by all requests
+render_workers = int(os.environ.get('KPI_RENDER_WORKERS', str(os.cpu_count() or 1)))
+
+# Maximum number of tasks of a single request running at once
+render_concurrency = int(os.environ.get('KPI_RENDER_CONCURRENCY', '4'))
+
+# Set KPI_EXACT_SUMMARIES=1 to compute summary quartiles from every sample instead of the per-day quantile sketches
+exact_summaries = os.environ.get('KPI_EXACT_SUMMARIES') == '1'
+
+# Directory tailed for new KPI rows (CSV files dropped into it or appended to); ingestion is off when unset
+drop_dir = os.environ.get('KPI_DROP_DIR')
+
+# Seconds between polls of the drop directory, and of the DuckDB backend's dataset for new files
+ingest_interval = float(os.environ.get('KPI_INGEST_INTERVAL', '60'))
+
+# Hours before the latest one that an hour is compared with to find anomalies
+anomaly_window = int(os.environ.get('KPI_ANOMALY_WINDOW', '168'))
+
+# How anomalies are scored: 'zscore' (mean and standard deviation) or 'mad' (median and median absolute deviation)
+anomaly_method = os.environ.get('KPI_ANOMALY_METHOD', 'zscore')
+
+# Maximum number of exports streamed at once by each worker; further ones are refused until one ends
+export_concurrency = int(os.environ.get('KPI_EXPORT_CONCURRENCY', '2'))
+
+# Set KPI_INSTRUMENTATION=1 to time the stages of building the dashboard, served at /metrics and in Server-Timing headers
+instrumentation = os.environ.get('KPI_INSTRUMENTATION') == '1'
+
+# Share of instrumented requests and background jobs run under cProfile
+profile_rate = float(os.environ.get('KPI_PROFILE_RATE', '0'))
+
+# Profiled runs taking at least this many milliseconds are saved to data/.cache/profiles
+profile_slow_ms = float(os.environ.get('KPI_PROFILE_SLOW_MS', '1000'))
+
+metrics = Metrics(enabled=instrumentation, profile_rate=profile_rate, profile_slow_ms=profile_slow_ms,
+                  profile_dir=os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data', '.cache', 'profiles'))
+
+def cache_path(filepath, suffix='.parquet'):
+    """
+    Get the path of a cache derived from a CSV file.
+
+    The cache name embeds the CSV's size and modification time, so an edited or
+    replaced CSV never matches a stale cache.
+
+    Args:
+        filepath (str): Full path of the CSV file.
+        suffix (str): Suffix of the cache ('.parquet' for the columnar table,
+            '.v<format version>.kpi' for the memory-mapped store,
+            '.v<format version>.dataset' for the DuckDB backend's Parquet files).
+
+    Returns:
+        str: Full path of the cache.
+
+    """
+    stat = os.stat(filepath)
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    return os.path.join(os.path.dirname(filepath), '.cache', f'{name}-{stat.st_size}-{stat.st_mtime_ns}{suffix}')
 
-def load_data(filename):
+def remove_stale_caches(path):
+    """
+    Remove caches of the same kind built from previous versions of a CSV.
+
+    Args:
+        path (str): Full path of the current cache.
+
+    """
+    cache_dir, current = os.path.split(path)
+    prefix = current.rsplit('-', 2)[0] + '-'
+    suffix = os.path.splitext(current)[1]
+    for name in os.listdir(cache_dir):
+        if name.startswith(prefix) and name.endswith(suffix) and name != current:
+            stale = os.path.join(cache_dir, name)
+            if os.path.isdir(stale):
+                shutil.rmtree(stale, ignore_errors=True)
+            else:
+                os.remove(stale)
+
+def write_cache(df, path):
+    """
+    Write the KPI table to a Parquet cache file, replacing older caches of the same CSV.
+
+    The file is written under a temporary name and moved into place, so other
+    worker processes never read a partially written cache. Without a Parquet
+    engine installed the cache is skipped.
+
+    Args:
+        df (pd.DataFrame): KPI table to cache.
+        path (str): Full path of the Parquet cache file.
+
+    """
+    cache_dir = os.path.dirname(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        df.to_parquet(tmp_path, index=False)
+    except ImportError:
+        return
+    os.replace(tmp_path, path)
+    remove_stale_caches(path)
+
+def load_data(filename, use_cache=True):
     """
     Load data from a CSV file and convert the 'date_time' column to datetime.
 
+    The parsed table is cached next to the CSV in a columnar Parquet file that is
+    reused for as long as the CSV's size and modification time are unchanged.
+
     Args:
         filename (str): Name of the CSV file.
+        use_cache (bool): Whether to read and write the columnar cache.
 
     Returns:
         pd.DataFrame: Loaded data.
@@ -27,23 +180,383 @@ def load_data(filename):
     script_dir = os.path.dirname(os.path.realpath(__file__))
     # Construct full file path
     filepath = os.path.join(script_dir, filename)
-    df = pd.read_csv(filepath)
-    df['date_time'] = pd.to_datetime(df['date_time'])
+    path = cache_path(filepath)
+    if use_cache and os.path.exists(path):
+        return pd.read_parquet(path)
+    df = read_kpi_csv(filepath, dtype=data_dtypes)
+    if use_cache:
+        write_cache(df, path)
     return df
 
-data = load_data('data/5G_NR_data.csv')
+def open_shared_store(filename):
+    """
+    Open the memory-mapped KPI store for a CSV file, building it on first use.
+
+    The store's column arrays are saved next to the CSV and memory-mapped
+    read-only, so every worker process maps the same physical pages instead of
+    holding its own copy of the data. The newest generation saved by
+    `ingest_rows` is opened, so that restarted workers keep the ingested rows.
+
+    Args:
+        filename (str): Name of the CSV file.
+
+    Returns:
+        KPIStore: The memory-mapped store.
+
+    """
+    filepath = os.path.join(os.path.dirname(os.path.realpath(__file__)), filename)
+    path = cache_path(filepath, suffix=f'.v{KPIStore.format_version}.kpi')
+    if not os.path.exists(path):
+        df = load_data(filename)
+        summary = df.describe(include=[np.number]).transpose().round(2)
+        KPIStore.from_frame(df, meta={'summary': summary.to_dict()}).save(path)
+        remove_stale_caches(path)
+    return KPIStore.open(path)
+
+def open_duckdb_store(filename):
+    """
+    Open the DuckDB store over the partitioned Parquet files of the dataset.
+
+    Unless KPI_PARQUET_DIR points to an existing dataset, the CSV file is
+    converted to one next to it on first use, without loading it into memory.
+
+    Args:
+        filename (str): Name of the CSV file.
+
+    Returns:
+        DuckDBStore: The store.
+
+    """
+    from duckdb_store import DuckDBStore
+    from partitions import PartitionedDataset, create_dataset
+    cache_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data', '.cache')
+    config = (('temp_directory', os.path.join(cache_dir, 'duckdb')),)
+    if duckdb_memory_limit:
+        config += (('memory_limit', duckdb_memory_limit),)
+    if parquet_dir:
+        return DuckDBStore(parquet_dir, config)
+    filepath = os.path.join(os.path.dirname(os.path.realpath(__file__)), filename)
+    path = cache_path(filepath, suffix=f'.v{PartitionedDataset.format_version}.dataset')
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        create_dataset(filepath, path, config=config)
+        remove_stale_caches(path)
+    return DuckDBStore(path, config)
+
+bright_colors = ['#e6194b', '#3cb44b', '#ffe119', '#4363d8', '#f58231', '#911eb4', '#46f0f0', '#f032e6', '#bcf60c', '#fabebe', '#008080', '#e6beff', '#9a6324', '#fffac8', '#800000', '#aaffc3', '#808000', '#ffd8b1', '#000075', '#808080', '#ffffff', '#000000']
+
+# Dash styles that tell PIs apart when cells are told apart by color
+line_dashes = ['solid', 'dash', 'dot', 'dashdot', 'longdash', 'longdashdot']
+
+# The dataset and the state derived from it, set by load_dataset
+store = summary = None
+cell_ids = kpi_categories = pis = min_date = max_date = None
+line_colors = bright_colors
+dataset_lock = threading.Lock()
+
+def load_dataset():
+    """
+    Load the dataset and the state derived from it, unless it is already loaded.
+
+    Callers that find the dataset being loaded by another thread wait for it
+    to be ready. The store is published last, so a loaded store means that
+    everything derived from it is set.
+
+    """
+    global store, summary, cell_ids, kpi_categories, pis, min_date, max_date, line_colors
+    if store is not None:
+        return
+    with dataset_lock:
+        if store is not None:
+            return
+        if data_backend == 'duckdb':
+            # Only the list of series is loaded; queries read the Parquet files
+            new_store = open_duckdb_store(data_file)
+            summary = new_store.summary()
+        elif shared_store:
+            # The raw table is never materialized; workers only build views over the shared arrays
+            new_store = open_shared_store(data_file)
+            summary = pd.DataFrame(new_store.meta['summary'])
+        else:
+            data = load_data(data_file)
+            # Index the data by (cell_id, pi) and pre-aggregate it for the dashboard's resampling frequencies
+            new_store = KPIStore.from_frame(data)
+            # Generate statistical summary
+            summary = data.describe(include=[np.number]).transpose().round(2)
+
+        # Extract unique cell_ids, kpi_categories, and pis
+        cell_ids = np.array(sorted(new_store.cell_names), dtype=object)
+        kpi_categories = new_store.category_names
+        pis = np.array(sorted(new_store.pi_names), dtype=object)
+
+        # Extract the minimum and maximum dates
+        min_date = new_store.min_date
+        max_date = new_store.max_date
+
+        line_colors = bright_colors * (len(pis) // len(bright_colors)) + bright_colors[:len(pis) % len(bright_colors)]
+        store = new_store
+
+def dataset_ready():
+    """
+    Check whether the dataset has been loaded, without loading it.
+
+    Returns:
+        bool: True once requests can be served without waiting for the data.
+
+    """
+    return store is not None
+
+# Workers started with KPI_LAZY_LOAD=1 load the data on first use instead
+if not lazy_load:
+    load_dataset()
+
+def merge_summary(summary, df):
+    """
+    Combine a statistical summary with the summary of new rows.
+
+    Count, mean, standard deviation, minimum and maximum are merged exactly;
+    the quartiles are count-weighted averages of the two summaries' quartiles,
+    which approximates them without revisiting the old rows.
+
+    Args:
+        summary (pd.DataFrame): Summary as produced by `describe().transpose()`.
+        df (pd.DataFrame): New rows.
+
+    Returns:
+        pd.DataFrame: Summary of the old and new rows.
+
+    """
+    delta = df.describe(include=[np.number]).transpose().reindex(summary.index)
+    n1, n2 = summary['count'], delta['count'].fillna(0)
+    n = n1 + n2
+    merged = summary.copy()
+    merged['count'] = n
+    merged['mean'] = (n1 * summary['mean'] + n2 * delta['mean'].fillna(0)) / n
+    # Pooled variance: within-group sums of squares plus the spread of the group means
+    squares = ((n1 - 1) * summary['std'] ** 2 + (n2 - 1).clip(lower=0) * delta['std'].fillna(0) ** 2
+               + n1 * n2 / n * (summary['mean'] - delta['mean'].fillna(0)) ** 2)
+    merged['std'] = np.sqrt(squares / (n - 1))
+    merged['min'] = np.fmin(summary['min'], delta['min'])
+    merged['max'] = np.fmax(summary['max'], delta['max'])
+    for quartile in ['25%', '50%', '75%']:
+        merged[quartile] = (n1 * summary[quartile] + n2 * delta[quartile].fillna(0)) / n
+    return merged.round(2)
+
+# Serializes ingestion; readers keep using the store they started with
+ingest_lock = threading.Lock()
+
+def ingest_rows(rows, drop_state=None):
+    """
+    Append new KPI rows to the store and update the state derived from it.
+
+    The store is replaced by a new one holding the extra rows, so callbacks that
+    are running keep a consistent view. The cell and PI lists, the date bounds,
+    the summary and the rollups are updated from the new rows alone.
+
+    Appending copies the store's arrays into the memory of this process. A
+    memory-mapped shared store is therefore saved again as its next generation
+    and mapped back, with the summary and how far the drop directory was read;
+    the other workers switch to it in `refresh_store`. Only the worker holding
+    the ingest lock (see `acquire_ingest_lock`) ingests rows into it.
+
+    Args:
+        rows (pd.DataFrame): New rows with 'date_time', 'cell_id', 'kpi_category',
+            'pi' and 'value' columns.
+        drop_state (dict, optional): The drop directory's `state` once the rows were read.
+
+    """
+    global store, summary, cell_ids, kpi_categories, pis, min_date, max_date, anomaly_scan
+    with ingest_lock:
+        new_store = store.append(rows)
+        summary = merge_summary(summary, rows)
+        if isinstance(store, KPIStore) and store.root is not None:
+            new_store = new_store.save_generation(store.root, {**store.meta, 'summary': summary.to_dict(),
+                                                               'drop_state': drop_state or {}})
+        cell_ids = np.union1d(cell_ids, np.asarray(rows['cell_id'].unique(), dtype=object))
+        pis = np.union1d(pis, np.asarray(rows['pi'].unique(), dtype=object))
+        kpi_categories = new_store.category_names
+        min_date = new_store.min_date
+        max_date = new_store.max_date
+        store = new_store
+        if anomaly_scan is not None:
+            # Only the series that got new rows are scored again
+            anomaly_scan = anomaly_scan.update(new_store, rows)
+
+# File locked by the worker that ingests rows into the shared store, for as long as it runs
+_ingest_lock_file = None
+
+def acquire_ingest_lock(path):
+    """
+    Try to become the worker process that ingests rows into the shared store.
 
-# Extract unique cell_ids, kpi_categories, and pis
-cell_ids = data['cell_id'].unique()
-kpi_categories = data['kpi_category'].unique()
-pis = data['pi'].unique()
+    The lock is an exclusive flock on a file in the store's directory. It is
+    held until the process exits, and then taken by another worker.
 
-# Extract the minimum and maximum dates
-min_date = data['date_time'].min()
-max_date = data['date_time'].max()
+    Args:
+        path (str): Directory of the shared store.
+
+    Returns:
+        bool: Whether this process holds the lock.
+
+    """
+    global _ingest_lock_file
+    # Only POSIX systems have flock, as only their WSGI servers run several workers
+    import fcntl
+    lock_file = open(os.path.join(path, 'ingest.lock'), 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _ingest_lock_file = lock_file
+    return True
+
+def poll_drop_dir(path, interval):
+    """
+    Ingest the rows added to a drop directory, polling it forever.
+
+    With a memory-mapped shared store, one worker ingests the rows and saves
+    each new generation of the store, and the others switch to it. When that
+    worker exits, another one takes over from where it stopped reading.
+
+    Args:
+        path (str): Directory that new KPI CSV files are dropped into.
+        interval (float): Seconds between polls.
+
+    """
+    load_dataset()
+    drop = DropDirectory(path, dtype=data_dtypes)
+    ingesting = not (isinstance(store, KPIStore) and store.root is not None)
+    while True:
+        try:
+            if not ingesting:
+                ingesting = acquire_ingest_lock(store.root)
+                refresh_store()
+                if ingesting:
+                    drop.restore(store.meta.get('drop_state', {}))
+            if ingesting:
+                rows = drop.poll()
+                if rows is not None:
+                    ingest_rows(rows, drop.state())
+        except Exception:
+            # A malformed file must not stop ingestion of the others; its rows are skipped
+            logger.exception('Ingestion from %s failed', path)
+        time.sleep(interval)
+
+def current_data_options():
+    """
+    Get the cells, PIs and date bounds of the data currently loaded.
 
-# Generate statistical summary
-summary = data.describe(include=[np.number]).transpose().round(2)
+    Unlike the module-level names copied by `from functions import *`, these
+    reflect the rows ingested since startup. The dataset is loaded first if
+    it is not yet.
+
+    Returns:
+        tuple: (cell_ids, pis, min_date, max_date, number of rows).
+
+    """
+    load_dataset()
+    return cell_ids, pis, min_date, max_date, len(store)
+
+# Latest anomaly scores of every series, built on first use by current_anomalies
+anomaly_scan = None
+
+def current_anomalies():
+    """
+    Get the anomaly scores of the latest hour of every series.
+
+    The scan of the whole store is built on first use, and then kept up to
+    date as rows are ingested.
+
+    Returns:
+        AnomalyScan: Scores of the data currently loaded.
+
+    """
+    global anomaly_scan
+    load_dataset()
+    if anomaly_scan is None:
+        with ingest_lock:
+            if anomaly_scan is None:
+                with metrics.stage('anomaly_scan'):
+                    anomaly_scan = AnomalyScan.scan(store, anomaly_window, anomaly_method)
+    return anomaly_scan
+
+def worst_cells(limit=10):
+    """
+    List the cells whose latest hour is the most anomalous, for the dashboard's panel and the anomalies API.
+
+    Args:
+        limit (int): Number of cells to list.
+
+    Returns:
+        list: A dict per cell, worst first, with its most anomalous 'pi', the 'date_time'
+        and 'value' of its latest hour, the 'baseline' and 'score' of that value, and the
+        'start_date' and 'end_date' of a range showing the hour with its baseline window.
+
+    """
+    worst = current_anomalies().worst_cells(limit)
+    records = []
+    for row in worst.itertuples(index=False):
+        records.append({
+            'cell_id': row.cell_id,
+            'pi': row.pi,
+            'date_time': row.date_time.isoformat(),
+            'value': round(float(row.value), 4),
+            'baseline': round(float(row.baseline), 4),
+            'score': round(float(row.score), 2),
+            'start_date': max(row.date_time - pd.Timedelta(hours=anomaly_window), min_date).date().isoformat(),
+            'end_date': row.date_time.date().isoformat(),
+        })
+    return records
+
+def refresh_store():
+    """
+    Switch to the current files of the DuckDB backend's dataset, if files were appended or compacted,
+    or to the newest generation of the shared store, if another worker ingested rows.
+
+    The cell and PI lists and the date bounds are updated. A shared store's
+    generation carries its summary; the DuckDB backend's overall summary is
+    left as loaded, as updating it would read every file.
+
+    """
+    global store, summary, cell_ids, kpi_categories, pis, min_date, max_date, anomaly_scan
+    with ingest_lock:
+        new_store = store.refresh()
+        if new_store is store:
+            return
+        if isinstance(new_store, KPIStore):
+            summary = pd.DataFrame(new_store.meta['summary'])
+        cell_ids = np.array(sorted(new_store.cell_names), dtype=object)
+        kpi_categories = new_store.category_names
+        pis = np.array(sorted(new_store.pi_names), dtype=object)
+        min_date = new_store.min_date
+        max_date = new_store.max_date
+        store = new_store
+        if anomaly_scan is not None:
+            # The appended files do not tell which series changed
+            anomaly_scan = anomaly_scan.update(new_store)
+
+def poll_dataset(interval):
+    """
+    Pick up the files appended to the DuckDB backend's dataset, polling it forever.
+
+    Args:
+        interval (float): Seconds between polls.
+
+    """
+    while True:
+        time.sleep(interval)
+        # Workers started with KPI_LAZY_LOAD=1 only poll once they have loaded the data
+        if dataset_ready():
+            try:
+                refresh_store()
+            except Exception:
+                logger.exception('Refreshing the dataset failed')
+
+if drop_dir:
+    threading.Thread(target=poll_drop_dir, args=(drop_dir, ingest_interval), daemon=True, name='kpi-ingest').start()
+if data_backend == 'duckdb':
+    threading.Thread(target=poll_dataset, args=(ingest_interval,), daemon=True, name='kpi-refresh').start()
 
 def df_to_table(df):
     """
@@ -58,9 +571,42 @@ def df_to_table(df):
     """
     return [{column: row[i] for i, column in enumerate(df.columns)} for row in df.values]
 
-bright_colors = ['#e6194b', '#3cb44b', '#ffe119', '#4363d8', '#f58231', '#911eb4', '#46f0f0', '#f032e6', '#bcf60c', '#fabebe', '#008080', '#e6beff', '#9a6324', '#fffac8', '#800000', '#aaffc3', '#808000', '#ffd8b1', '#000075', '#808080', '#ffffff', '#000000']
+def resample_cells(selected_cells, selected_pis, date_range, frequency):
+    """
+    Resample data for several cells and PIs in a single grouped pass.
+
+    Args:
+        selected_cells (str or list): Selected cell ID(s).
+        selected_pis (str or list): Selected Performance Indicators.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency, or None for the raw samples.
 
-line_colors = bright_colors * (len(pis) // len(bright_colors)) + bright_colors[:len(pis) % len(bright_colors)]
+    Returns:
+        pd.DataFrame: Resampled data with 'cell_id', 'pi', 'date_time' and 'value' columns.
+
+    """
+    start_date, end_date = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
+    # Dashboard frequencies are answered from the pre-computed rollups, or aggregated by DuckDB
+    if frequency in ROLLUP_FREQUENCIES:
+        with metrics.stage('filter') as stage:
+            rollup = store.rollup(selected_cells, selected_pis, start_date, end_date, frequency)
+            stage['rows'] = len(rollup)
+        return rollup[['cell_id', 'pi', 'date_time', 'mean']].rename(columns={'mean': 'value'})
+    # Otherwise look up the matching rows in the indexed store
+    with metrics.stage('filter') as stage:
+        rows = store.query(selected_cells, selected_pis, start_date, end_date)
+        stage['rows'] = len(rows)
+    if frequency is None:
+        return rows[['cell_id', 'pi', 'date_time', 'value']]
+    with metrics.stage('resample') as stage:
+        # Set 'date_time' as the index
+        rows = rows.set_index('date_time')
+        # Group by 'cell_id' and 'pi' and resample
+        resampled_data = rows.groupby(['cell_id', 'pi'], observed=True)[['value']].resample(frequency).mean()
+        # Reset the index
+        resampled_data.reset_index(inplace=True)
+        stage['rows'] = len(resampled_data)
+    return resampled_data
 
 def resample_data(selected_cell, selected_pis, date_range, frequency):
     """
@@ -70,32 +616,459 @@ def resample_data(selected_cell, selected_pis, date_range, frequency):
         selected_cell (str): Selected cell ID.
         selected_pis (str or list): Selected Performance Indicators.
         date_range (tuple): Date range in the format (start_date, end_date).
-        frequency (str): Resampling frequency.
+        frequency (str): Resampling frequency, or None for the raw samples.
 
     Returns:
         pd.DataFrame: Resampled data.
 
     """
-    start_date, end_date = date_range
-    # Ensure selected_pis is a list
+    return resample_cells([selected_cell], selected_pis, date_range, frequency).drop(columns='cell_id')
+
+@lru_cache(maxsize=64)
+def _query_cells(version, selected_cells, selected_pis, date_range, frequency):
+    """
+    Memoized resample_cells, keyed on the store version and normalized inputs.
+
+    """
+    return resample_cells(list(selected_cells), list(selected_pis), date_range, frequency)
+
+def query_cells(selected_cells, selected_pis, date_range, frequency):
+    """
+    Get the resampled data for several cells, computing it at most once per set of inputs.
+
+    The charts and the summary tables of one interaction share the returned
+    DataFrame, so callers must not modify it in place.
+
+    Args:
+        selected_cells (str or list): Selected cell ID(s).
+        selected_pis (str or list): Selected Performance Indicators.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency.
+
+    Returns:
+        pd.DataFrame: Resampled data with 'cell_id', 'pi', 'date_time' and 'value' columns.
+
+    """
+    if not isinstance(selected_cells, list):
+        selected_cells = [selected_cells]
+    selected_pis, date_range = normalize_chart_args(selected_pis, date_range, frequency)
+    return _query_cells(store.version, tuple(sorted(set(selected_cells))), tuple(selected_pis), date_range, frequency)
+
+def query_data(selected_cell, selected_pis, date_range, frequency):
+    """
+    Get the resampled data for a cell, computing it at most once per set of inputs.
+
+    Args:
+        selected_cell (str): Selected cell ID.
+        selected_pis (str or list): Selected Performance Indicators.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency.
+
+    Returns:
+        pd.DataFrame: Resampled data (shared, not to be modified in place).
+
+    """
+    return query_cells([selected_cell], selected_pis, date_range, frequency)
+
+def encode_array(values, dtype):
+    """
+    Encode an array as base64 text of its little-endian bytes, which the browser reads back as a typed array.
+
+    Args:
+        values (array-like): Values to encode.
+        dtype (str): Little-endian NumPy dtype matching the browser's typed array, e.g. '<f4' for a Float32Array.
+
+    Returns:
+        str: Base64 encoding of the array's bytes.
+
+    """
+    return base64.b64encode(np.ascontiguousarray(values, dtype=dtype).tobytes()).decode('ascii')
+
+def chart_payload(selected_cells, selected_pis, date_range, frequency, viewport_width=None):
+    """
+    Pack the resampled data of the selected cells into the columnar payload drawn by assets/charts.js.
+
+    Every tab and chart option is drawn in the browser from this payload, so it
+    is built once per selection rather than once per tab. As in KPIStore, the
+    samples of each (cell, PI) series are stored together, sorted by time, and
+    located by the offset of their block. Each series is downsampled to the
+    point budget here, as the server-side charts are: its samples are those
+    kept by LTTB for line charts, or by min_max_indices for bar charts and
+    heatmaps. Scatter plots, box plot statistics and histogram counts are
+    computed from every sample.
+
+    Args:
+        selected_cells (str or list): Selected cell ID(s).
+        selected_pis (str or list): Selected Performance Indicators.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency.
+        viewport_width (int, optional): Width of the browser viewport in pixels,
+            which sets the point budget of downsampled charts.
+
+    Returns:
+        dict: 'cells' and 'pis' in the order selected, 'frequency', 'max_points',
+        'sample_flags' and 'origin' (the first sample's time in seconds since the
+        epoch), with the arrays encoded by encode_array: 'times' (int32 seconds
+        after 'origin'), 'values' (float32), 'flags' (uint8 sum of the
+        'sample_flags' of the charts each sample is kept for), 'block_starts'
+        (int32 offset of each series' first sample), and 'block_cells' and
+        'block_pis' (int32 positions in 'cells' and 'pis'). 'boxes' holds the
+        box_stats of each series, 'histograms' the bin 'edges' and the 'counts'
+        of each PI of each cell, in the order of 'cells' and 'pis', and
+        'scatters' the scatter_payload of the first two PIs of each cell, or
+        None per cell when fewer than two PIs are selected.
+
+    """
+    if not isinstance(selected_cells, list):
+        selected_cells = [selected_cells]
     if not isinstance(selected_pis, list):
         selected_pis = [selected_pis]
-    # Now proceed with filtering and resampling
-    resampled_data = data[
-        (data['cell_id'] == selected_cell) &
-        (data['pi'].isin(selected_pis)) &
-        (data['date_time'] >= pd.to_datetime(start_date)) &
-        (data['date_time'] <= pd.to_datetime(end_date))
-    ]
-    # Convert the 'date_time' column to datetime
-    resampled_data['date_time'] = pd.to_datetime(resampled_data['date_time'])
-    # Set 'date_time' as the index
-    resampled_data.set_index('date_time', inplace=True)
-    # Group by 'pi' and resample
-    resampled_data = resampled_data.groupby('pi').resample(frequency).mean()
-    # Reset the index
-    resampled_data.reset_index(inplace=True)
-    return resampled_data
+    selected_cells, selected_pis = list(dict.fromkeys(selected_cells)), list(dict.fromkeys(selected_pis))
+    resampled_data = query_cells(selected_cells, selected_pis, date_range, frequency).dropna()
+    max_points = point_budget(viewport_width)
+    with metrics.stage('encode') as stage:
+        cell_codes = pd.Categorical(resampled_data['cell_id'], categories=selected_cells).codes.astype(np.int32)
+        pi_codes = pd.Categorical(resampled_data['pi'], categories=selected_pis).codes.astype(np.int32)
+        times = resampled_data['date_time'].to_numpy().astype('datetime64[s]').astype(np.int64)
+        order = np.lexsort((times, pi_codes, cell_codes))
+        cell_codes, pi_codes, times = cell_codes[order], pi_codes[order], times[order]
+        values = resampled_data['value'].to_numpy()[order]
+        # A block starts wherever the (cell, PI) pair changes
+        block_starts = np.flatnonzero(np.diff(cell_codes, prepend=-1) | np.diff(pi_codes, prepend=-1))
+        block_stops = np.append(block_starts[1:], len(values))
+        block_cells, block_pis = cell_codes[block_starts], pi_codes[block_starts]
+        flags = np.zeros(len(values), dtype=np.uint8)
+        boxes = []
+        for start, stop in zip(block_starts, block_stops):
+            flags[start + lttb_indices(times[start:stop], values[start:stop], max_points)] |= sample_flags['line']
+            flags[start + min_max_indices(values[start:stop], max_points)] |= sample_flags['bar']
+            stats = box_stats(values[start:stop])
+            boxes.append({key: stats[key].tolist() for key in stats})
+        histograms, scatters = [], []
+        for c in range(len(selected_cells)):
+            in_cell = block_cells == c
+            cell_blocks = {p: (start, stop) for p, start, stop in
+                           zip(block_pis[in_cell], block_starts[in_cell], block_stops[in_cell])}
+            cell_values = [values[slice(*cell_blocks.get(p, (0, 0)))] for p in range(len(selected_pis))]
+            edges, counts = shared_histograms(cell_values, bins=20)
+            histograms.append({'edges': edges.tolist(), 'counts': [group_counts.tolist() for group_counts in counts]})
+            if len(selected_pis) < 2:
+                scatters.append(None)
+                continue
+            # Pair the samples of the first two PIs by time, as update_scatter_chart does
+            first, second = (slice(*cell_blocks.get(p, (0, 0))) for p in (0, 1))
+            _, x, y = np.intersect1d(times[first], times[second], assume_unique=True, return_indices=True)
+            scatters.append(scatter_payload(values[first][x], values[second][y], max_points))
+        keep = flags > 0
+        kept_per_block = np.add.reduceat(keep.astype(np.int64), block_starts) if len(block_starts) else block_starts
+        origin = int(times.min()) if len(times) else 0
+        stage['rows'] = int(keep.sum())
+        return {
+            'cells': selected_cells,
+            'pis': selected_pis,
+            'frequency': frequency,
+            'max_points': max_points,
+            'sample_flags': sample_flags,
+            'origin': origin,
+            'times': encode_array(times[keep] - origin, '<i4'),
+            'values': encode_array(values[keep], '<f4'),
+            'flags': encode_array(flags[keep], '<u1'),
+            'block_starts': encode_array(np.cumsum(kept_per_block) - kept_per_block, '<i4'),
+            'block_cells': encode_array(block_cells, '<i4'),
+            'block_pis': encode_array(block_pis, '<i4'),
+            'boxes': boxes,
+            'histograms': histograms,
+            'scatters': scatters,
+        }
+
+def chart_theme():
+    """
+    Get the styling shared by the charts drawn in the browser, sent once with the page.
+
+    Returns:
+        dict: The 'plotly_dark' template, the trace colors and dash styles, the
+        number of points per trace above which text labels are not drawn, and the
+        grid cells along each axis of dense scatter plots.
+
+    """
+    return {
+        'template': pio.templates['plotly_dark'].to_plotly_json(),
+        'colors': bright_colors,
+        'dashes': line_dashes,
+        'max_text_labels': max_text_labels,
+        'density_bins': density_bins,
+    }
+
+_render_executor = None
+_render_executor_lock = threading.Lock()
+
+def render_executor():
+    """
+    Get the pool shared by all requests, starting it on first use.
+
+    Returns:
+        concurrent.futures.Executor: Thread or process pool with render_workers workers.
+
+    """
+    global _render_executor
+    with _render_executor_lock:
+        if _render_executor is None:
+            if render_executor_kind == 'process':
+                # Spawned workers load the data themselves, so they share the memory-mapped store and tail the
+                # drop directory rather than keeping a stale copy of the data forked at startup
+                _render_executor = ProcessPoolExecutor(max_workers=render_workers, mp_context=multiprocessing.get_context('spawn'),
+                                                       initializer=load_dataset)
+            else:
+                _render_executor = ThreadPoolExecutor(max_workers=render_workers)
+        return _render_executor
+
+def parallel_map(func, args_list, max_concurrency=None, progress=None):
+    """
+    Call a function for each set of arguments on the shared pool.
+
+    At most `max_concurrency` calls of one request are queued or running at a
+    time, so a single large view cannot take over the pool. With a single call,
+    or a cap of one, the calls run in the calling thread.
+
+    Args:
+        func (callable): Module-level function (it must be picklable for process pools).
+        args_list (list): Tuple of positional arguments for each call.
+        max_concurrency (int, optional): Per-request cap. Defaults to render_concurrency.
+        progress (callable, optional): Called with the number of finished calls and
+            the total each time a call finishes.
+
+    Returns:
+        list: The results, in the order of `args_list`.
+
+    """
+    max_concurrency = max_concurrency or render_concurrency
+    results = [None] * len(args_list)
+    if len(args_list) <= 1 or max_concurrency <= 1 or render_workers <= 1:
+        for i, args in enumerate(args_list):
+            results[i] = func(*args)
+            if progress:
+                progress(i + 1, len(args_list))
+        return results
+    executor = render_executor()
+    pending = {}
+    finished = 0
+    for i, args in enumerate(args_list + [None]):
+        if args is not None:
+            if render_executor_kind == 'thread':
+                # Thread workers record their metrics into the calling request's events
+                future = executor.submit(contextvars.copy_context().run, func, *args)
+            else:
+                future = executor.submit(func, *args)
+            pending[future] = i
+        # Refill the window as calls complete, and drain it after the last call
+        while len(pending) >= max_concurrency or (args is None and pending):
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+                finished += 1
+                if progress:
+                    progress(finished, len(args_list))
+    return results
+
+def _reset_after_fork():
+    """
+    Replace the locks and pool a forked process inherits from its parent.
+
+    Background callback jobs are forked from the server; a lock held by one of
+    the server's other threads at that moment would otherwise never be released,
+    and the parent's pool threads do not exist in the child.
+
+    """
+    global _render_executor, _render_executor_lock, ingest_lock, dataset_lock
+    _render_executor = None
+    _render_executor_lock = threading.Lock()
+    ingest_lock = threading.Lock()
+    dataset_lock = threading.Lock()
+    figure_cache.lock = threading.Lock()
+    metrics.lock = threading.Lock()
+
+# Smallest group of cells worth summarizing on its own worker
+summary_chunk_cells = 50
+
+def summarize_cells(selected_cells, selected_pis, date_range, exact=None):
+    """
+    Get the statistical summary of the samples of several cells and PIs over a date range.
+
+    Args:
+        selected_cells (str or list): Selected cell ID(s).
+        selected_pis (str or list): Selected Performance Indicators.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        exact (bool, optional): Compute the quartiles from every sample rather than
+            from quantile sketches. Defaults to exact_summaries.
+
+    Returns:
+        pd.DataFrame: 'cell_id', 'pi', 'count', 'mean', 'std', 'min', '25%', '50%',
+        '75%' and 'max' columns for each series with samples in the range.
+
+    """
+    exact = exact_summaries if exact is None else exact
+    if not isinstance(selected_cells, list):
+        selected_cells = [selected_cells]
+    # Summarize groups of cells in parallel
+    chunk = max(-(-len(selected_cells) // render_concurrency), summary_chunk_cells)
+    chunks = [selected_cells[i:i + chunk] for i in range(0, len(selected_cells), chunk)]
+    summaries = parallel_map(describe_cells, [(cells, selected_pis, date_range, exact) for cells in chunks])
+    return pd.concat(summaries, ignore_index=True) if summaries else describe_cells([], selected_pis, date_range, exact)
+
+def describe_cells(selected_cells, selected_pis, date_range, exact):
+    """
+    Summarize the samples of a group of cells and PIs over a date range.
+
+    Args:
+        selected_cells (list): Selected cell IDs.
+        selected_pis (str or list): Selected Performance Indicators.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        exact (bool): Compute the quartiles from every sample.
+
+    Returns:
+        pd.DataFrame: Summary of each series with samples in the range, see `KPIStore.describe`.
+
+    """
+    return store.describe(selected_cells, selected_pis, date_range[0], date_range[1], exact=exact)
+
+# Approximate number of rows read at a time by an export, which bounds the memory it uses
+export_chunk_rows = 200000
+
+def export_plan(selected_cells, selected_pis, date_range, frequency):
+    """
+    Split an export into chunks of about export_chunk_rows rows.
+
+    The rows of each cell are counted in the store: its samples in the range,
+    or for a resampled export, at most one row per bucket of each PI. Cells
+    are grouped, in order, while their rows over the whole range fit in a
+    chunk. A cell with more rows than that is read alone, a window of weeks at
+    a time, sized from its rows per day. Windows start at the start of a
+    resampling bucket, so that no bucket is split across chunks.
+
+    Args:
+        selected_cells (list): Selected cell IDs.
+        selected_pis (list): Selected Performance Indicators.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency, or None for the raw samples.
+
+    Yields:
+        tuple: (cell IDs, (start_date, end_date)) of each chunk.
+
+    """
+    start_date, end_date = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
+    days = max((end_date - start_date) / pd.Timedelta(days=1), 1)
+    # Buckets that the range touches, counting the partial ones at both ends
+    buckets = None if frequency is None else len(pd.date_range(start_date, end_date, freq=frequency)) + 1
+    group, group_rows = [], 0
+    for cell in selected_cells:
+        counts = store.count_rows(cell, selected_pis, start_date, end_date)
+        rows = int((counts if buckets is None else np.minimum(counts, buckets)).sum())
+        if group and (group_rows + rows > export_chunk_rows or rows > export_chunk_rows):
+            yield group, (start_date, end_date)
+            group, group_rows = [], 0
+        if rows <= export_chunk_rows:
+            group.append(cell)
+            group_rows += rows
+            continue
+        width = pd.Timedelta(weeks=max(int(export_chunk_rows // (rows / days * 7)), 1))
+        origin = start_date.floor('D')
+        if frequency == 'W':
+            # Weekly buckets start on Mondays
+            origin -= pd.Timedelta(days=origin.weekday())
+        for bound in pd.date_range(origin, end_date, freq=width):
+            yield [cell], (max(bound, start_date), min(bound + width - pd.Timedelta(1, 'ns'), end_date))
+    if group:
+        yield group, (start_date, end_date)
+
+def export_frames(selected_cells, selected_pis, date_range, frequency):
+    """
+    Read the data of an export a chunk at a time.
+
+    Args:
+        selected_cells (list): Selected cell IDs.
+        selected_pis (list): Selected Performance Indicators.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency, or None for the raw samples.
+
+    Yields:
+        pd.DataFrame: 'date_time', 'cell_id', 'pi' and 'value' columns of each chunk's
+        rows, by cell, PI and time. Periods without samples are left out.
+
+    """
+    for cells, window in export_plan(selected_cells, selected_pis, date_range, frequency):
+        with metrics.stage('export') as stage:
+            frame = resample_cells(cells, selected_pis, window, frequency).dropna(subset=['value'])
+            stage['rows'] = len(frame)
+        if len(frame):
+            yield frame
+
+# Bounds of the per-trace point budget, and the viewport width assumed when it is unknown
+min_point_budget = 200
+max_point_budget = 5000
+default_viewport_width = 1920
+
+# Above this many points per trace, per-point text labels are not drawn
+max_text_labels = 100
+
+# Bits of the flags of chart_payload's samples, marking the charts each sample is kept for
+sample_flags = {'line': 1, 'bar': 2}
+
+def point_budget(viewport_width=None):
+    """
+    Get the maximum number of points per trace for time-series charts.
+
+    Args:
+        viewport_width (int, optional): Width of the browser viewport in pixels.
+
+    Returns:
+        int: Points per trace, rounded down to a multiple of 100 so that similar
+        viewports share cached figures.
+
+    """
+    width = viewport_width or default_viewport_width
+    # The charts take up 9 of the 12 layout columns
+    budget = int(width * 9 / 12 * points_per_pixel) // 100 * 100
+    return min(max(budget, min_point_budget), max_point_budget)
+
+# Levels of detail from coarsest to finest; None stands for the raw samples
+detail_levels = ['W', 'D', 'H', None]
+detail_widths = {'W': pd.Timedelta(weeks=1), 'D': pd.Timedelta(days=1), 'H': pd.Timedelta(hours=1)}
+
+def detail_frequency(selected_cell, selected_pis, date_range, frequency, max_points):
+    """
+    Pick the finest level of detail whose points in a date range fit a budget.
+
+    Used when zooming into a chart: the visible window is re-fetched at the finest
+    frequency (down to the raw samples) that still yields at most `max_points`
+    points per trace, but never coarser than the selected frequency.
+
+    Args:
+        selected_cell (str): Selected cell ID.
+        selected_pis (str or list): Selected Performance Indicators.
+        date_range (tuple): Visible date range in the format (start_date, end_date).
+        frequency (str): Selected resampling frequency.
+        max_points (int): Maximum number of points per trace.
+
+    Returns:
+        str: Resampling frequency, or None for the raw samples.
+
+    """
+    if frequency not in detail_levels:
+        return frequency
+    if not isinstance(selected_pis, list):
+        selected_pis = [selected_pis]
+    start_date, end_date = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
+    chosen = frequency
+    for level in detail_levels[detail_levels.index(frequency) + 1:]:
+        if level is None:
+            # Count the raw samples in the window with a binary search per series
+            points = store.count_rows(selected_cell, selected_pis, start_date, end_date).max()
+        else:
+            points = (end_date - start_date) / detail_widths[level]
+        if points > max_points:
+            break
+        chosen = level
+    return chosen
 
 def get_date_marks(start_date, end_date):
     """
@@ -116,7 +1089,8 @@ def get_date_marks(start_date, end_date):
 
 
 # Functions for the different chart types
-def update_line_chart(selected_cell, selected_pis, date_range, frequency):
+@metrics.timed('chart.line')
+def update_line_chart(selected_cell, selected_pis, date_range, frequency, max_points=None):
     """
     Updates the line chart.
 
@@ -125,19 +1099,24 @@ def update_line_chart(selected_cell, selected_pis, date_range, frequency):
         selected_pis (str or list): Selected Performance Indicators.
         date_range (tuple): Date range in the format (start_date, end_date).
         frequency (str): Resampling frequency.
+        max_points (int, optional): Maximum number of points per trace; longer
+            series are downsampled with LTTB. Defaults to `point_budget()`.
 
     Returns:
         go.Figure: Updated line chart figure.
 
     """
-    resampled_data = resample_data(selected_cell, selected_pis, date_range, frequency)
+    max_points = max_points or point_budget()
+    resampled_data = query_data(selected_cell, selected_pis, date_range, frequency)
     resampled_data = resampled_data.sort_values(by=['date_time'])
     fig = go.Figure()
     for i, pi in enumerate(selected_pis):
         pi_data = resampled_data[resampled_data['pi'] == pi]
         pi_data = pi_data.dropna()
-        fig.add_trace(go.Scatter(x=pi_data['date_time'].dt.strftime('%Y-%m-%d %H'), y=pi_data['value'], mode='lines+markers+text', name=pi, line=dict(color=line_colors[i % len(line_colors)]),
-                                 text=["{:.2f}".format(val) for val in pi_data['value']],
+        pi_data = pi_data.iloc[lttb_indices(pi_data['date_time'].to_numpy(), pi_data['value'].to_numpy(), max_points)]
+        show_text = len(pi_data) <= max_text_labels
+        fig.add_trace(go.Scatter(x=pi_data['date_time'], y=pi_data['value'], mode='lines+markers+text' if show_text else 'lines', name=pi, line=dict(color=line_colors[i % len(line_colors)]),
+                                 text=["{:.2f}".format(val) for val in pi_data['value']] if show_text else None,
                                  textposition='top center',
                                  textfont=dict(color="#FFFFFF", size=10)))
     fig.update_layout(
@@ -145,11 +1124,14 @@ def update_line_chart(selected_cell, selected_pis, date_range, frequency):
         xaxis_title='Time',
         yaxis_title='Value',
         template='plotly_dark',
+        # Keep the user's zoom when the figure is replaced with more detailed data
+        uirevision=selected_cell,
         legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
     )
     return fig
 
-def update_bar_chart(selected_cell, selected_pis, date_range, frequency):
+@metrics.timed('chart.bar')
+def update_bar_chart(selected_cell, selected_pis, date_range, frequency, max_points=None):
     """
     Updates the bar chart.
 
@@ -158,20 +1140,25 @@ def update_bar_chart(selected_cell, selected_pis, date_range, frequency):
         selected_pis (str or list): Selected Performance Indicators.
         date_range (tuple): Date range in the format (start_date, end_date).
         frequency (str): Resampling frequency.
+        max_points (int, optional): Maximum number of bars per trace; longer series
+            keep the minimum and maximum of equal buckets. Defaults to `point_budget()`.
 
     Returns:
         go.Figure: Updated bar chart figure.
 
     """
-    resampled_data = resample_data(selected_cell, selected_pis, date_range, frequency)
+    max_points = max_points or point_budget()
+    resampled_data = query_data(selected_cell, selected_pis, date_range, frequency)
     fig = go.Figure()
 
     for i, pi in enumerate(selected_pis):
         pi_data = resampled_data[resampled_data['pi'] == pi]
         pi_data = pi_data.dropna()  # make sure to drop NaN values
-        fig.add_trace(go.Bar(x=pi_data['date_time'].dt.strftime('%Y-%m-%d %H'), y=pi_data['value'],
+        pi_data = pi_data.iloc[min_max_indices(pi_data['value'].to_numpy(), max_points)]
+        show_text = len(pi_data) <= max_text_labels
+        fig.add_trace(go.Bar(x=pi_data['date_time'], y=pi_data['value'],
                              name=pi, marker=dict(color=line_colors[i % len(line_colors)]),
-                             text=["{:.2f}".format(val) for val in pi_data['value']],
+                             text=["{:.2f}".format(val) for val in pi_data['value']] if show_text else None,
                              textposition='outside',
                              textfont=dict(color="#FFFFFF", size=10)))
 
@@ -184,21 +1171,27 @@ def update_bar_chart(selected_cell, selected_pis, date_range, frequency):
     )
     return fig
 
-def update_scatter_chart(selected_cell, selected_pis, date_range, frequency):
+@metrics.timed('chart.scatter')
+def update_scatter_chart(selected_cell, selected_pis, date_range, frequency, max_points=None):
     """
     Updates the scatter chart.
 
+    The samples of the first two PIs taken at the same time are plotted against
+    each other with WebGL. Beyond `max_points` pairs, they are drawn as a density
+    grid by density_traces.
+
     Args:
         selected_cell (str): Selected cell ID.
         selected_pis (str or list): Selected Performance Indicators.
         date_range (tuple): Date range in the format (start_date, end_date).
         frequency (str): Resampling frequency.
+        max_points (int, optional): Maximum number of points drawn individually.
 
     Returns:
         go.Figure: Updated scatter chart figure.
 
     """
-    resampled_data = resample_data(selected_cell, selected_pis, date_range, frequency)
+    resampled_data = query_data(selected_cell, selected_pis, date_range, frequency)
     resampled_data = resampled_data.dropna()
     fig = go.Figure()
 
@@ -206,24 +1199,29 @@ def update_scatter_chart(selected_cell, selected_pis, date_range, frequency):
         fig.update_layout(title='Scatter Plot', template='plotly_dark')
         return fig
 
-    pi_data_x = resampled_data[resampled_data['pi'] == selected_pis[0]]
-    pi_data_y = resampled_data[resampled_data['pi'] == selected_pis[1]]
-
-    # Normalize the size data for better visualization
-    size = (pi_data_y['value'] - pi_data_y['value'].min()) / (pi_data_y['value'].max() - pi_data_y['value'].min()) * 20
-
-    fig.add_trace(go.Scatter(
-        x=pi_data_x['value'],
-        y=pi_data_y['value'],
-        mode='markers',
-        name=f'{selected_pis[0]} vs {selected_pis[1]}',
-        marker=dict(
-            size=size,  # Use normalized size
-            color=pi_data_x['value'],  # Use the value of the first PI for color
-            colorscale='Viridis',  # Set color scale
-            colorbar=dict(title="Value of PI")  # Set color bar title
-        )
-    ))
+    # Pair the samples of both PIs by time
+    pairs = resampled_data[resampled_data['pi'].isin(selected_pis[:2])].pivot(index='date_time', columns='pi', values='value')
+    pairs = pairs.reindex(columns=selected_pis[:2]).dropna()
+    x, y = pairs[selected_pis[0]].to_numpy(), pairs[selected_pis[1]].to_numpy()
+    name = f'{selected_pis[0]} vs {selected_pis[1]}'
+
+    if max_points is not None and len(x) > max_points:
+        fig.add_traces(density_traces(x, y, name, max_points))
+    else:
+        # Normalize the size data for better visualization
+        size = (y - y.min()) / (y.max() - y.min()) * 20 if len(y) else y
+        fig.add_trace(go.Scattergl(
+            x=x,
+            y=y,
+            mode='markers',
+            name=name,
+            marker=dict(
+                size=size,  # Use normalized size
+                color=x,  # Use the value of the first PI for color
+                colorscale='Viridis',  # Set color scale
+                colorbar=dict(title="Value of PI")  # Set color bar title
+            )
+        ))
 
     fig.update_layout(
         title=f'Scatter Plot for {selected_cell} between {selected_pis[0]} and {selected_pis[1]}',
@@ -234,6 +1232,57 @@ def update_scatter_chart(selected_cell, selected_pis, date_range, frequency):
     )
     return fig
 
+# Grid cells along each axis of dense scatter plots
+density_bins = 100
+
+def density_traces(x, y, name, max_points):
+    """
+    Draw many points of a scatter plot as the number of points in each cell of a grid.
+
+    Args:
+        x (np.ndarray): x coordinates, without NaN values.
+        y (np.ndarray): y coordinates, without NaN values.
+        name (str): Name of the plotted pairs.
+        max_points (int): Maximum number of isolated points drawn individually.
+
+    Returns:
+        list: A heatmap of the counts, leaving empty cells blank, and a WebGL trace
+        of the points alone in their cell.
+
+    """
+    centers_x, centers_y, counts, isolated = density_grid(x, y, density_bins, max_points)
+    return [
+        go.Heatmap(x=centers_x, y=centers_y, z=np.where(counts > 0, counts, np.nan), name=name,
+                   colorscale='Viridis', colorbar=dict(title="Samples"), hoverongaps=False),
+        go.Scattergl(x=x[isolated], y=y[isolated], mode='markers', name=name, showlegend=False,
+                     marker=dict(size=3, color='#FFFFFF')),
+    ]
+
+def scatter_payload(x, y, max_points):
+    """
+    Pack the pairs of a scatter plot for assets/charts.js, drawn as update_scatter_chart draws them.
+
+    Args:
+        x (np.ndarray): x coordinates, without NaN values.
+        y (np.ndarray): y coordinates, without NaN values.
+        max_points (int): Maximum number of points drawn individually.
+
+    Returns:
+        dict: 'pairs', the number of pairs, 'x' and 'y' (float32, by encode_array)
+        of the points drawn individually, and 'grid': None when every pair is drawn,
+        or beyond max_points pairs, the 'x' and 'y' bin centers and the int32
+        'counts' of density_grid, by row, the points being those alone in their bin.
+
+    """
+    grid = None
+    pairs = len(x)
+    if pairs > max_points:
+        centers_x, centers_y, counts, isolated = density_grid(x, y, density_bins, max_points)
+        grid = {'x': centers_x.tolist(), 'y': centers_y.tolist(), 'counts': encode_array(counts, '<i4')}
+        x, y = x[isolated], y[isolated]
+    return {'pairs': pairs, 'x': encode_array(x, '<f4'), 'y': encode_array(y, '<f4'), 'grid': grid}
+
+@metrics.timed('chart.heatmap')
 def update_heatmap(selected_cell, selected_pis, date_range, frequency):
     """
     Updates the heatmap.
@@ -248,7 +1297,7 @@ def update_heatmap(selected_cell, selected_pis, date_range, frequency):
         go.Figure: Updated heatmap figure.
 
     """
-    resampled_data = resample_data(selected_cell, selected_pis, date_range, frequency)
+    resampled_data = query_data(selected_cell, selected_pis, date_range, frequency)
     resampled_data = resampled_data.dropna()
 
     # Scale the vertical spacing based on the number of rows
@@ -285,6 +1334,7 @@ def update_heatmap(selected_cell, selected_pis, date_range, frequency):
 
     return fig
 
+@metrics.timed('chart.box')
 def update_box_plot(selected_cell, selected_pis, date_range, frequency):
     """
     Updates the box plot.
@@ -299,12 +1349,21 @@ def update_box_plot(selected_cell, selected_pis, date_range, frequency):
         go.Figure: Updated box plot figure.
 
     """
-    resampled_data = resample_data(selected_cell, selected_pis, date_range, frequency)
+    resampled_data = query_data(selected_cell, selected_pis, date_range, frequency)
     resampled_data = resampled_data.dropna()
     fig = go.Figure()
     for i, pi in enumerate(selected_pis):
         pi_data = resampled_data[resampled_data['pi'] == pi]
-        fig.add_trace(go.Box(y=pi_data['value'], name=pi, hoverinfo='y', marker_color=line_colors[i % len(line_colors)]))
+        # Send the box statistics and outliers rather than every value
+        stats = box_stats(pi_data['value'].to_numpy())
+        if stats is None:
+            continue
+        color = line_colors[i % len(line_colors)]
+        fig.add_trace(go.Box(x=[pi], q1=[stats['q1']], median=[stats['median']], q3=[stats['q3']],
+                             lowerfence=[stats['lowerfence']], upperfence=[stats['upperfence']], mean=[stats['mean']],
+                             name=pi, hoverinfo='y', marker_color=color))
+        fig.add_trace(go.Scatter(x=[pi] * len(stats['outliers']), y=stats['outliers'], mode='markers', name=pi,
+                                 hoverinfo='y', marker=dict(color=color, size=4), showlegend=False))
     fig.update_layout(
         title=f'Box Plot for {selected_cell}',
         xaxis_title='Performance Indicator',
@@ -314,6 +1373,7 @@ def update_box_plot(selected_cell, selected_pis, date_range, frequency):
     )
     return fig
 
+@metrics.timed('chart.hist')
 def update_histogram(selected_cell, selected_pis, date_range, frequency):
     """
     Updates the histogram chart.
@@ -328,19 +1388,22 @@ def update_histogram(selected_cell, selected_pis, date_range, frequency):
         go.Figure: Updated histogram chart figure.
 
     """
-    resampled_data = resample_data(selected_cell, selected_pis, date_range, frequency)
+    resampled_data = query_data(selected_cell, selected_pis, date_range, frequency)
     resampled_data = resampled_data.dropna()
 
     # Create subplots, using 'domain' type for x-axes
     fig = make_subplots(rows=1, cols=len(selected_pis),
                         shared_yaxes=True)
 
+    # Bin on the server with edges shared by all PIs, and send only the counts
+    edges, counts = shared_histograms([resampled_data.loc[resampled_data['pi'] == pi, 'value'].to_numpy() for pi in selected_pis], bins=20)
+    centers, widths = (edges[:-1] + edges[1:]) / 2, np.diff(edges)
     for i, pi in enumerate(selected_pis):
-        pi_data = resampled_data[resampled_data['pi'] == pi]
-        fig.add_trace(go.Histogram(x=pi_data['value'],
-                                   name=pi,
-                                   nbinsx=20,
-                                   marker_color=line_colors[i % len(line_colors)]),
+        fig.add_trace(go.Bar(x=centers,
+                             y=counts[i],
+                             width=widths,
+                             name=pi,
+                             marker_color=line_colors[i % len(line_colors)]),
                       row=1, col=i+1)
         fig.update_xaxes(title_text='Value', row=1, col=i+1)
 
@@ -357,6 +1420,449 @@ def update_histogram(selected_cell, selected_pis, date_range, frequency):
 
     return fig
 
+@metrics.timed('chart.comparison')
+def update_comparison_chart(selected_cells, selected_pis, date_range, frequency, max_points=None, layout='overlay'):
+    """
+    Updates the multi-cell comparison line chart.
+
+    All cells are resampled together in one grouped pass and drawn either
+    overlaid in a single plot or as small multiples with one row per cell.
+
+    Args:
+        selected_cells (list): Selected cell IDs.
+        selected_pis (str or list): Selected Performance Indicators.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency.
+        max_points (int, optional): Maximum number of points per trace; longer
+            series are downsampled with LTTB. Defaults to `point_budget()`.
+        layout (str): 'overlay' for a single plot, 'grid' for one row per cell.
+
+    Returns:
+        go.Figure: Updated comparison chart figure.
+
+    """
+    max_points = max_points or point_budget()
+    if not isinstance(selected_pis, list):
+        selected_pis = [selected_pis]
+    resampled_data = query_cells(selected_cells, selected_pis, date_range, frequency).dropna()
+    cell_rows = {cell: i for i, cell in enumerate(selected_cells)}
+    pi_styles = {pi: i for i, pi in enumerate(selected_pis)}
+    if layout == 'grid':
+        fig = make_subplots(rows=len(selected_cells), cols=1, shared_xaxes=True,
+                            vertical_spacing=0.3 / len(selected_cells), subplot_titles=selected_cells)
+    else:
+        fig = go.Figure()
+    traces, rows = [], []
+    for (cell, pi), series in resampled_data.groupby(['cell_id', 'pi'], observed=True, sort=False):
+        series = series.iloc[lttb_indices(series['date_time'].to_numpy(), series['value'].to_numpy(), max_points)]
+        if layout == 'grid':
+            # One row per cell, one color per PI shared by all rows
+            traces.append(go.Scatter(x=series['date_time'].to_numpy(), y=series['value'].to_numpy(), mode='lines', name=pi,
+                                     legendgroup=pi, showlegend=cell_rows[cell] == 0,
+                                     line=dict(color=line_colors[pi_styles[pi] % len(line_colors)])))
+        else:
+            # One color per cell, one dash style per PI
+            traces.append(go.Scatter(x=series['date_time'].to_numpy(), y=series['value'].to_numpy(), mode='lines',
+                                     name=f'{cell} {pi}',
+                                     line=dict(color=bright_colors[cell_rows[cell] % len(bright_colors)],
+                                               dash=line_dashes[pi_styles[pi] % len(line_dashes)])))
+        rows.append(cell_rows[cell] + 1)
+    # Add all traces at once; adding them one by one copies the figure's data every time
+    if layout == 'grid' and traces:
+        fig.add_traces(traces, rows=rows, cols=[1] * len(traces))
+    else:
+        fig.add_traces(traces)
+    fig.update_layout(
+        title=f'Time Series Comparison of {len(selected_cells)} Cells',
+        template='plotly_dark',
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    if layout == 'grid':
+        fig.update_layout(height=max(250 * len(selected_cells), 450))
+    else:
+        fig.update_layout(xaxis_title='Time', yaxis_title='Value')
+    return fig
+
+# Ways of ranking cells in the network heatmap, from the statistics of all their samples in the range
+heatmap_aggregates = ['mean', 'max', 'min', 'std']
+
+# Network heatmaps with more values than this (cells x time buckets) are sent as a compressed image rather than a heatmap trace
+max_heatmap_points = 100000
+
+def cell_time_matrix(selected_pi, date_range, frequency, sort_by='mean', max_columns=None):
+    """
+    Build the cells x time matrix of a PI across the whole network.
+
+    Every cell is resampled in one batch rollup, whose buckets are scattered
+    into the matrix. Rows are ordered by the chosen aggregate of each cell's
+    samples over the range, highest first.
+
+    Args:
+        selected_pi (str): Selected Performance Indicator.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency; hourly if None.
+        sort_by (str): One of heatmap_aggregates.
+        max_columns (int, optional): Merge adjacent buckets so that at most this
+            many columns remain.
+
+    Returns:
+        tuple: (cell IDs, bucket labels, matrix of bucket means with NaN for empty buckets,
+        aggregate of each cell).
+
+    """
+    frequency = frequency or 'H'
+    cells, labels, stats = store.rollup_matrix(list(cell_ids), selected_pi, date_range[0], date_range[1], frequency)
+    # Per-cell statistics over the whole range
+    with np.errstate(invalid='ignore', divide='ignore'):
+        count = stats['count'].sum(axis=1)
+        mean = stats['sum'].sum(axis=1) / count
+        aggregates = {
+            'mean': mean,
+            'max': np.fmax.reduce(stats['max'], axis=1) if len(labels) else mean,
+            'min': np.fmin.reduce(stats['min'], axis=1) if len(labels) else mean,
+            'std': np.sqrt(np.clip((stats['sumsq'].sum(axis=1) - stats['sum'].sum(axis=1) * mean) / (count - 1), 0, None)),
+        }
+    aggregate = aggregates[sort_by]
+    # Highest first; cells without a value for the aggregate go last
+    order = np.argsort(-np.nan_to_num(aggregate, nan=-np.inf), kind='stable')
+    sums, counts = stats['sum'][order], stats['count'][order]
+    # Merge runs of adjacent buckets when there are more than fit
+    step = -(-len(labels) // max_columns) if max_columns else 1
+    if step > 1:
+        padding = ((0, 0), (0, -len(labels) % step))
+        sums = np.pad(sums, padding).reshape(len(cells), -1, step).sum(axis=2)
+        counts = np.pad(counts, padding).reshape(len(cells), -1, step).sum(axis=2)
+        labels = labels[::step]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        matrix = sums / np.where(counts > 0, counts, np.nan)
+    return cells[order], labels, matrix, aggregate[order]
+
+@metrics.timed('chart.network_heatmap')
+def update_network_heatmap(selected_pi, date_range, frequency, sort_by='mean', max_columns=None):
+    """
+    Updates the network heatmap of one PI, with a row per cell and a column per bucket.
+
+    Grids of up to max_heatmap_points values (cells x buckets) are drawn as a
+    heatmap trace with hover details; larger ones are colored on the server and
+    sent as a single compressed image, which keeps the figure small enough for
+    thousands of cells.
+
+    Args:
+        selected_pi (str): Selected Performance Indicator.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency.
+        sort_by (str): Aggregate that cells are ranked by, one of heatmap_aggregates.
+        max_columns (int, optional): Maximum number of time columns. Defaults to `point_budget()`.
+
+    Returns:
+        go.Figure: Updated network heatmap figure.
+
+    """
+    max_columns = max_columns or point_budget()
+    cells, labels, matrix, aggregate = cell_time_matrix(selected_pi, date_range, frequency, sort_by, max_columns)
+    fig = go.Figure()
+    if matrix.size <= max_heatmap_points:
+        fig.add_trace(go.Heatmap(
+            z=matrix,
+            x=labels,
+            y=cells,
+            colorscale='YlOrRd',
+            colorbar=dict(title="Value"),
+            hoverongaps=False,
+            hoverinfo='x+y+z',
+        ))
+        fig.update_yaxes(autorange='reversed', type='category')
+    else:
+        low, high = np.nanmin(matrix), np.nanmax(matrix)
+        palette = np.array([pc.unlabel_rgb(color) for color in pc.sample_colorscale(pc.get_colorscale('YlOrRd'), np.linspace(0, 1, 256))],
+                           dtype=np.uint8)
+        levels = np.nan_to_num((matrix - low) / ((high - low) or 1) * 255).astype(np.uint8)
+        # Empty buckets are left transparent
+        pixels = np.dstack((palette[levels], np.where(np.isnan(matrix), 0, 255).astype(np.uint8)))
+        # Plotly Express is slow to import and only needed to encode large heatmaps
+        import plotly.express as px
+        fig.add_trace(px.imshow(pixels, binary_string=True).data[0].update(hoverinfo='skip'))
+        # An invisible trace carries the colorbar of the image
+        fig.add_trace(go.Scatter(x=[None], y=[None], mode='markers', showlegend=False, hoverinfo='skip',
+                                 marker=dict(colorscale='YlOrRd', cmin=low, cmax=high, showscale=True, colorbar=dict(title="Value"))))
+        ticks = np.unique(np.linspace(0, len(labels) - 1, 10).astype(int))
+        fig.update_xaxes(tickvals=ticks, ticktext=pd.DatetimeIndex(labels[ticks]).strftime('%Y-%m-%d %H:%M'))
+        rows = np.unique(np.linspace(0, len(cells) - 1, 40).astype(int))
+        fig.update_yaxes(tickvals=rows, ticktext=cells[rows])
+    fig.update_layout(
+        title=f'{selected_pi} across {len(cells)} cells, by {sort_by}',
+        template='plotly_dark',
+        autosize=True,
+        height=min(max(20 * len(cells), 360), 1200),
+    )
+    return fig
+
+# Longest lag, in periods, of the lagged correlation view
+max_correlation_lag = 48
+
+# Matrices of up to this many PIs show their coefficients as text
+max_correlation_labels = 20
+
+# Names of the periods of each resampling frequency
+period_names = {'H': 'hours', 'D': 'days', 'W': 'weeks'}
+
+def correlation_frame(selected_cells, selected_pis, date_range, frequency):
+    """
+    Pivot the resampled data of cells into a matrix with a column per PI.
+
+    The long-format data is scattered into the matrix in one pass. Each cell
+    gets a row per period of the same regular grid, so that shifting a cell's
+    rows by k shifts its samples by k periods.
+
+    Args:
+        selected_cells (list): Selected cell IDs.
+        selected_pis (list): Selected Performance Indicators, in column order.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency.
+
+    Returns:
+        tuple: (matrix of resampled values with NaN for empty periods, position
+        in selected_cells of each row's cell).
+
+    """
+    data = query_cells(selected_cells, selected_pis, date_range, frequency).dropna()
+    step = detail_widths[frequency].value
+    times = data['date_time'].to_numpy().astype('datetime64[ns]').astype(np.int64)
+    origin = times.min() if len(times) else 0
+    periods = int((times.max() - origin) // step) + 1 if len(times) else 0
+    cell_codes = pd.Categorical(data['cell_id'], categories=selected_cells).codes.astype(np.int64)
+    pi_codes = pd.Categorical(data['pi'], categories=selected_pis).codes
+    matrix = np.full((len(selected_cells) * periods, len(selected_pis)), np.nan)
+    matrix[cell_codes * periods + (times - origin) // step, pi_codes] = data['value'].to_numpy()
+    return matrix, np.repeat(np.arange(len(selected_cells)), periods)
+
+@lru_cache(maxsize=64)
+def _correlations(version, selected_cells, selected_pis, date_range, frequency, method):
+    """
+    Memoized correlation_matrix of the cells' resampled data, keyed on the store version and normalized inputs.
+
+    """
+    with metrics.stage('correlation') as stage:
+        matrix, _ = correlation_frame(list(selected_cells), list(selected_pis), date_range, frequency)
+        stage['rows'] = len(matrix)
+        return correlation_matrix(matrix, method)
+
+@lru_cache(maxsize=64)
+def _lagged_correlations(version, selected_cells, selected_pis, date_range, frequency, method, reference, max_lag):
+    """
+    Memoized lagged_correlations of the cells' resampled data, keyed on the store version and normalized inputs.
+
+    """
+    with metrics.stage('lagged_correlation') as stage:
+        matrix, groups = correlation_frame(list(selected_cells), list(selected_pis), date_range, frequency)
+        stage['rows'] = len(matrix)
+        return lagged_correlations(matrix, groups, selected_pis.index(reference), np.arange(-max_lag, max_lag + 1), method)
+
+def pi_correlations(selected_cells, selected_pis, date_range, frequency, method='pearson'):
+    """
+    Get the correlation of every pair of PIs, computing it at most once per set of inputs.
+
+    The periods of all the given cells are pooled; a single cell gives the
+    correlations within that cell.
+
+    Args:
+        selected_cells (str or list): Selected cell ID(s).
+        selected_pis (str or list): Selected Performance Indicators.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency.
+        method (str): One of CORRELATION_METHODS.
+
+    Returns:
+        tuple: (PIs in sorted order, matrix of coefficients, matrix of the number
+        of periods with both PIs).
+
+    """
+    if not isinstance(selected_cells, list):
+        selected_cells = [selected_cells]
+    selected_pis, date_range = normalize_chart_args(selected_pis, date_range, frequency)
+    coefficients, counts = _correlations(store.version, tuple(sorted(set(selected_cells))), tuple(selected_pis),
+                                         date_range, frequency, method)
+    return selected_pis, coefficients, counts
+
+def pi_lagged_correlations(selected_cells, selected_pis, date_range, frequency, reference, max_lag, method='pearson'):
+    """
+    Get the correlation of a PI with every PI some periods later, computing it at most once per set of inputs.
+
+    Args:
+        selected_cells (str or list): Selected cell ID(s), pooled as in pi_correlations.
+        selected_pis (str or list): Selected Performance Indicators.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency.
+        reference (str): PI at the start of each lag, one of selected_pis.
+        max_lag (int): Largest lag in periods, at most max_correlation_lag; lags run from -max_lag to max_lag.
+        method (str): One of CORRELATION_METHODS.
+
+    Returns:
+        tuple: (PIs in sorted order, lags, matrix of coefficients with a row per lag and a column per PI).
+
+    """
+    if not isinstance(selected_cells, list):
+        selected_cells = [selected_cells]
+    selected_pis, date_range = normalize_chart_args(selected_pis, date_range, frequency)
+    max_lag = min(max_lag, max_correlation_lag)
+    coefficients = _lagged_correlations(store.version, tuple(sorted(set(selected_cells))), tuple(selected_pis),
+                                        date_range, frequency, method, reference, max_lag)
+    return selected_pis, np.arange(-max_lag, max_lag + 1), coefficients
+
+def correlation_scope(selected_cells):
+    """
+    Describe the cells that correlations are computed over, for chart titles.
+
+    Args:
+        selected_cells (list): Cell IDs.
+
+    Returns:
+        str: The cell ID, or the number of pooled cells.
+
+    """
+    return selected_cells[0] if len(selected_cells) == 1 else f'{len(selected_cells)} cells pooled'
+
+@metrics.timed('chart.correlation_matrix')
+def update_correlation_matrix(selected_cells, selected_pis, date_range, frequency, method='pearson'):
+    """
+    Updates the PI x PI correlation matrix of cells.
+
+    Args:
+        selected_cells (list): Selected cell IDs, pooled as in pi_correlations.
+        selected_pis (str or list): Selected Performance Indicators.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency.
+        method (str): One of CORRELATION_METHODS.
+
+    Returns:
+        go.Figure: Updated correlation matrix figure.
+
+    """
+    pis, coefficients, counts = pi_correlations(selected_cells, selected_pis, date_range, frequency, method)
+    fig = go.Figure(go.Heatmap(
+        z=coefficients,
+        x=pis,
+        y=pis,
+        zmin=-1,
+        zmax=1,
+        colorscale='RdBu',
+        reversescale=True,
+        colorbar=dict(title=method.capitalize()),
+        customdata=counts,
+        texttemplate='%{z:.2f}' if len(pis) <= max_correlation_labels else None,
+        hovertemplate='%{y} / %{x}<br>%{z:.3f} over %{customdata} periods<extra></extra>',
+        hoverongaps=False,
+    ))
+    fig.update_xaxes(type='category')
+    fig.update_yaxes(type='category', autorange='reversed')
+    fig.update_layout(
+        title=f'{method.capitalize()} correlation of KPIs in {correlation_scope(selected_cells)}',
+        template='plotly_dark',
+        height=min(max(30 * len(pis) + 200, 400), 1000),
+    )
+    return fig
+
+@metrics.timed('chart.lagged_correlation')
+def update_lagged_correlation(selected_cells, selected_pis, date_range, frequency, reference, max_lag, method='pearson'):
+    """
+    Updates the chart of the correlation of a PI with every PI at a range of lags.
+
+    Args:
+        selected_cells (list): Selected cell IDs, pooled as in pi_correlations.
+        selected_pis (str or list): Selected Performance Indicators.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency.
+        reference (str): PI at the start of each lag, one of selected_pis.
+        max_lag (int): Largest lag in periods.
+        method (str): One of CORRELATION_METHODS.
+
+    Returns:
+        go.Figure: Updated lagged correlation figure.
+
+    """
+    pis, lags, coefficients = pi_lagged_correlations(selected_cells, selected_pis, date_range, frequency, reference,
+                                                     max_lag, method)
+    fig = go.Figure()
+    for i, pi in enumerate(pis):
+        fig.add_trace(go.Scatter(x=lags, y=coefficients[:, i], mode='lines+markers', name=pi,
+                                 line=dict(color=line_colors[i % len(line_colors)])))
+    fig.add_vline(x=0, line_dash='dot', line_color='#808080')
+    fig.update_layout(
+        title=f'{method.capitalize()} correlation of {reference} with KPIs later in {correlation_scope(selected_cells)}',
+        xaxis_title=f'Lag ({period_names[frequency]})',
+        yaxis_title='Correlation',
+        yaxis_range=[-1.05, 1.05],
+        template='plotly_dark',
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    return fig
+
+@metrics.timed('chart.pair_scatter')
+def update_pair_scatter(selected_cells, pi_x, pi_y, date_range, frequency, max_points=None):
+    """
+    Updates the scatter plot of a pair of PIs clicked in a correlation matrix.
+
+    The samples of both PIs in the same period of the same cell are paired,
+    over every period of the cells, as in their correlation. Beyond
+    `max_points` pairs, they are drawn as a density grid by density_traces.
+
+    Args:
+        selected_cells (list): Selected cell IDs, pooled as in pi_correlations.
+        pi_x (str): PI along the x axis.
+        pi_y (str): PI along the y axis.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency.
+        max_points (int, optional): Maximum number of points drawn individually.
+
+    Returns:
+        go.Figure: Updated pair scatter figure.
+
+    """
+    pis = list(dict.fromkeys([pi_x, pi_y]))
+    matrix = correlation_frame(selected_cells, pis, date_range, frequency)[0][:, [pis.index(pi_x), pis.index(pi_y)]]
+    matrix = matrix[~np.isnan(matrix).any(axis=1)]
+    x, y = matrix[:, 0], matrix[:, 1]
+    name = f'{pi_y} vs {pi_x}'
+    fig = go.Figure()
+    if max_points is not None and len(x) > max_points:
+        fig.add_traces(density_traces(x, y, name, max_points))
+    else:
+        fig.add_trace(go.Scattergl(x=x, y=y, mode='markers', name=name,
+                                   marker=dict(size=4, opacity=0.6, color=line_colors[0])))
+    fig.update_layout(
+        title=f'{pi_y} against {pi_x} in {correlation_scope(selected_cells)} ({len(x)} periods)',
+        xaxis_title=pi_x,
+        yaxis_title=pi_y,
+        template='plotly_dark',
+    )
+    return fig
+
+def render_correlation_charts(selected_cells, selected_pis, date_range, frequency, method='pearson', max_lag=0,
+                              reference=None):
+    """
+    Build the correlation matrix of cells, and their lagged correlations when lags are requested.
+
+    Args:
+        selected_cells (list): Selected cell IDs, pooled as in pi_correlations.
+        selected_pis (str or list): Selected Performance Indicators.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency.
+        method (str): One of CORRELATION_METHODS.
+        max_lag (int): Largest lag in periods; no lagged correlations when 0.
+        reference (str, optional): PI at the start of each lag. Defaults to the first of selected_pis.
+
+    Returns:
+        list: The correlation matrix figure, followed by the lagged correlation figure if max_lag > 0.
+
+    """
+    if not isinstance(selected_pis, list):
+        selected_pis = [selected_pis]
+    figs = [update_correlation_matrix(selected_cells, selected_pis, date_range, frequency, method)]
+    if max_lag:
+        figs.append(update_lagged_correlation(selected_cells, selected_pis, date_range, frequency,
+                                              reference or selected_pis[0], max_lag, method))
+    return figs
+
 # Dictionary to map tab values to chart functions
 chart_func_dict = {
     'tab-line': update_line_chart,
@@ -366,3 +1872,84 @@ chart_func_dict = {
     'tab-box': update_box_plot,
     'tab-hist': update_histogram,
 }
+
+# Charts whose output depends on the order in which the PIs were selected
+ordered_pi_charts = {'tab-scatter'}
+
+# Charts that downsample long series to a point budget
+downsampled_charts = {'tab-line', 'tab-bar', 'tab-scatter'}
+
+figure_cache = FigureCache(max_bytes=figure_cache_mb * 1024 * 1024)
+
+# Background callback jobs are forked from the server
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def render_chart(tab, selected_cell, selected_pis, date_range, frequency, viewport_width=None):
+    """
+    Build the chart for a tab, reusing a cached figure for equivalent inputs.
+
+    Args:
+        tab (str): Tab value from chart_func_dict.
+        selected_cell (str): Selected cell ID.
+        selected_pis (str or list): Selected Performance Indicators.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency.
+        viewport_width (int, optional): Width of the browser viewport in pixels,
+            which sets the point budget of downsampled charts.
+
+    Returns:
+        go.Figure: The chart figure.
+
+    """
+    selected_pis, date_range = normalize_chart_args(selected_pis, date_range, frequency,
+                                                    keep_pi_order=tab in ordered_pi_charts)
+    options = {'max_points': point_budget(viewport_width)} if tab in downsampled_charts else {}
+    key = (tab, selected_cell, tuple(selected_pis), date_range, frequency, tuple(options.items()))
+    return figure_cache.get(key, lambda: chart_func_dict[tab](selected_cell, selected_pis, date_range, frequency, **options),
+                            version=store.version)
+
+def render_comparison_chart(selected_cells, selected_pis, date_range, frequency, layout='overlay', viewport_width=None):
+    """
+    Build the multi-cell comparison chart, reusing a cached figure for equivalent inputs.
+
+    Args:
+        selected_cells (list): Selected cell IDs.
+        selected_pis (str or list): Selected Performance Indicators.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency.
+        layout (str): 'overlay' for a single plot, 'grid' for one row per cell.
+        viewport_width (int, optional): Width of the browser viewport in pixels.
+
+    Returns:
+        go.Figure: The comparison chart figure.
+
+    """
+    selected_pis, date_range = normalize_chart_args(selected_pis, date_range, frequency)
+    selected_cells = sorted(set(selected_cells))
+    max_points = point_budget(viewport_width)
+    key = ('compare', layout, tuple(selected_cells), tuple(selected_pis), date_range, frequency, max_points)
+    return figure_cache.get(key, lambda: update_comparison_chart(selected_cells, selected_pis, date_range, frequency,
+                                                                 max_points=max_points, layout=layout),
+                            version=store.version)
+
+def render_network_heatmap(selected_pi, date_range, frequency, sort_by='mean', viewport_width=None):
+    """
+    Build the network heatmap of a PI, reusing a cached figure for equivalent inputs.
+
+    Args:
+        selected_pi (str): Selected Performance Indicator.
+        date_range (tuple): Date range in the format (start_date, end_date).
+        frequency (str): Resampling frequency.
+        sort_by (str): Aggregate that cells are ranked by, one of heatmap_aggregates.
+        viewport_width (int, optional): Width of the browser viewport in pixels,
+            which sets the number of time columns.
+
+    Returns:
+        go.Figure: The network heatmap figure.
+
+    """
+    _, date_range = normalize_chart_args(selected_pi, date_range, frequency)
+    max_columns = point_budget(viewport_width)
+    key = ('network-heatmap', selected_pi, date_range, frequency, sort_by, max_columns)
+    return figure_cache.get(key, lambda: update_network_heatmap(selected_pi, date_range, frequency, sort_by, max_columns),
+                            version=store.version)
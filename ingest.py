@@ -0,0 +1,121 @@
+import glob
+import io
+import os
+
+import pandas as pd
+
+
+def read_kpi_csv(source, dtype=None):
+    """
+    Read KPI rows from CSV and convert the 'date_time' column to datetime.
+
+    Args:
+        source (str or file-like): Path or buffer holding the CSV, header included.
+        dtype (dict, optional): Column dtypes passed to `pd.read_csv`.
+
+    Returns:
+        pd.DataFrame: Parsed KPI rows.
+
+    """
+    df = pd.read_csv(source, dtype=dtype)
+    df['date_time'] = pd.to_datetime(df['date_time'])
+    return df
+
+
+class DropDirectory:
+    """
+    Tail the CSV files of a drop directory, reading only the rows added since the last poll.
+
+    New files are read from the start and files that keep growing are read from
+    where the previous poll stopped, re-using their header line. A partly written
+    last line is left for the next poll, and a file that shrank or was replaced
+    is read again from the start.
+
+    Args:
+        path (str): Directory that new KPI CSV files are dropped into.
+        dtype (dict, optional): Column dtypes passed to `pd.read_csv`.
+
+    """
+
+    def __init__(self, path, dtype=None):
+        self.path = path
+        self.dtype = dtype
+        # (inode, offset read up to, header line) of every file seen so far
+        self.files = {}
+
+    def poll(self):
+        """
+        Read the rows added to the drop directory since the last poll.
+
+        Returns:
+            pd.DataFrame: The new rows, or None if there are none.
+
+        """
+        frames = []
+        for filepath in sorted(glob.glob(os.path.join(self.path, '*.csv'))):
+            df = self._read_new_rows(filepath)
+            if df is not None and len(df):
+                frames.append(df)
+        if not frames:
+            return None
+        return pd.concat(frames, ignore_index=True)
+
+    def state(self):
+        """
+        Get how far each file has been read, for `restore`.
+
+        Returns:
+            dict: JSON-serializable [inode, offset read up to, header line] of every file seen so far, by path.
+
+        """
+        return {filepath: [inode, offset, header.decode('latin-1')]
+                for filepath, (inode, offset, header) in self.files.items()}
+
+    def restore(self, state):
+        """
+        Carry on reading from where the drop directory whose `state` was taken stopped.
+
+        Args:
+            state (dict): Output of `state`.
+
+        """
+        self.files = {filepath: (inode, offset, header.encode('latin-1'))
+                      for filepath, (inode, offset, header) in state.items()}
+
+    def _read_new_rows(self, filepath):
+        """
+        Read the complete lines appended to a file since it was last read.
+
+        Args:
+            filepath (str): Full path of the CSV file.
+
+        Returns:
+            pd.DataFrame: The new rows, or None if there are none.
+
+        """
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            self.files.pop(filepath, None)
+            return None
+        inode, offset, header = self.files.get(filepath, (stat.st_ino, 0, None))
+        if inode != stat.st_ino or stat.st_size < offset:
+            # Replaced or truncated: start over
+            offset, header = 0, None
+        if stat.st_size == offset:
+            return None
+        with open(filepath, 'rb') as f:
+            f.seek(offset)
+            chunk = f.read(stat.st_size - offset)
+        # Only parse complete lines; the rest is read once it has been fully written
+        end = chunk.rfind(b'\n') + 1
+        if not end:
+            return None
+        chunk = chunk[:end]
+        if header is None:
+            header_end = chunk.find(b'\n') + 1
+            header, chunk = chunk[:header_end], chunk[header_end:]
+        self.files[filepath] = (stat.st_ino, offset + end, header)
+        if not chunk.strip():
+            return None
+        return read_kpi_csv(io.BytesIO(header + chunk), dtype=self.dtype)
@@ -0,0 +1,335 @@
+import contextvars
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import flask
+
+# Upper bounds of the stage duration histogram buckets, in seconds
+duration_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Upper bounds of the response size histogram buckets, in bytes
+size_buckets = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7)
+
+# Events recorded while handling the current request or background job, if they are being collected
+_events = contextvars.ContextVar('kpi_metrics_events', default=None)
+
+
+class Histogram:
+    """
+    Cumulative histogram of observed values, as exposed to Prometheus.
+
+    Args:
+        buckets (tuple): Increasing upper bounds of the buckets.
+
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    """
+    Opt-in timings of the stages of building the dashboard, with row counts and response sizes.
+
+    Stages are recorded with `stage` blocks and `timed` functions, which cost
+    nothing when instrumentation is disabled. Besides being aggregated into
+    histograms, the events of a request are collected for its Server-Timing
+    header. Background jobs run in other processes: they collect their events
+    and the server replays them when it hands out the job's result.
+
+    Args:
+        enabled (bool): Whether to record anything.
+        profile_rate (float): Share of requests and jobs run under cProfile.
+        profile_slow_ms (float): Profiled runs taking at least this long are saved.
+        profile_dir (str, optional): Directory the profiles of slow runs are saved to.
+
+    """
+
+    def __init__(self, enabled=False, profile_rate=0.0, profile_slow_ms=1000, profile_dir=None):
+        self.enabled = enabled
+        self.profile_rate = profile_rate if profile_dir else 0.0
+        self.profile_slow_ms = profile_slow_ms
+        self.profile_dir = profile_dir
+        self.lock = threading.Lock()
+        # Duration histogram and number of rows processed of each stage
+        self.durations = {}
+        self.rows = {}
+        # Response size histogram of each callback output
+        self.payloads = {}
+
+    def _apply(self, event):
+        kind, name, value, rows = event
+        with self.lock:
+            if kind in ('stage', 'job_stage'):
+                self.durations.setdefault(name, Histogram(duration_buckets)).observe(value)
+                if rows is not None:
+                    self.rows[name] = self.rows.get(name, 0) + rows
+            else:
+                self.payloads.setdefault(name, Histogram(size_buckets)).observe(value)
+        events = _events.get()
+        if events is not None:
+            events.append(event)
+
+    def record(self, stage, seconds, rows=None):
+        """
+        Record the duration of a stage.
+
+        Args:
+            stage (str): Name of the stage.
+            seconds (float): Time spent in the stage.
+            rows (int, optional): Number of rows the stage produced.
+
+        """
+        if self.enabled:
+            self._apply(('stage', stage, seconds, rows))
+
+    def record_payload(self, output, size):
+        """
+        Record the size of a response.
+
+        Args:
+            output (str): Callback output the response updates.
+            size (int): Size of the response body, in bytes.
+
+        """
+        if self.enabled:
+            self._apply(('payload', output, size, None))
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a block of code as a stage.
+
+        Yields a dict in which the block can set the number of 'rows' it produced.
+
+        Args:
+            name (str): Name of the stage.
+
+        """
+        info = {}
+        if not self.enabled:
+            yield info
+            return
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            self.record(name, time.perf_counter() - start, info.get('rows'))
+
+    def timed(self, name):
+        """
+        Decorate a function to time each of its calls as a stage.
+
+        Args:
+            name (str): Name of the stage.
+
+        Returns:
+            callable: The decorator; it returns the function itself when disabled.
+
+        """
+        def decorator(func):
+            if not self.enabled:
+                return func
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def collect(self):
+        """
+        Collect the events recorded by the current context, including threads it is copied to.
+
+        Yields the list the events are appended to.
+
+        """
+        events = []
+        token = _events.set(events)
+        try:
+            yield events
+        finally:
+            _events.reset(token)
+
+    def replay(self, events):
+        """
+        Record events collected in another process.
+
+        Their stages are marked as having run in a background job, so that they
+        are not mistaken for time spent handling the current request.
+
+        Args:
+            events (list): Events, as yielded by `collect`.
+
+        """
+        if self.enabled:
+            for kind, name, value, rows in events:
+                self._apply(('job_stage' if kind == 'stage' else kind, name, value, rows))
+
+    def start_profile(self):
+        """
+        Start profiling the current thread for a sampled share of calls.
+
+        Returns:
+            cProfile.Profile: The running profiler, or None if this call is not sampled.
+
+        """
+        if not self.enabled or random.random() >= self.profile_rate:
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def stop_profile(self, profiler, name, seconds):
+        """
+        Stop a profiler, saving its statistics if the profiled run was slow.
+
+        Args:
+            profiler (cProfile.Profile): Profiler returned by `start_profile`, or None.
+            name (str): Name of the profiled request or job, used in the file name.
+            seconds (float): Duration of the profiled run.
+
+        Returns:
+            str: Path of the saved profile, or None if it was not saved.
+
+        """
+        if profiler is None:
+            return None
+        profiler.disable()
+        if seconds * 1000 < self.profile_slow_ms:
+            return None
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-"
+                                              f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)[:80]}.prof")
+        profiler.dump_stats(path)
+        return path
+
+    def render(self):
+        """
+        Render the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+
+        """
+        lines = []
+        with self.lock:
+            lines += _render_histograms('kpi_stage_duration_seconds', 'Time spent in each stage of building the dashboard.',
+                                        'stage', self.durations)
+            lines += ['# HELP kpi_stage_rows_total Rows produced by each stage.', '# TYPE kpi_stage_rows_total counter']
+            lines += [f'kpi_stage_rows_total{{stage="{_escape(name)}"}} {rows}' for name, rows in sorted(self.rows.items())]
+            lines += _render_histograms('kpi_response_bytes', 'Size of callback responses, by output updated.',
+                                        'output', self.payloads)
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _render_histograms(metric, help_text, label, histograms):
+    lines = [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+    for name, histogram in sorted(histograms.items()):
+        labels = f'{label}="{_escape(name)}"'
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f'{metric}_bucket{{{labels},le="{bound:g}"}} {count}')
+        lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f'{metric}_sum{{{labels}}} {histogram.sum:.6f}')
+        lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+    return lines
+
+
+def server_timing(events):
+    """
+    Build a Server-Timing header value from the events of a request.
+
+    Stages recorded several times, for instance once per cell, are summed.
+
+    Args:
+        events (list): Events, as yielded by `Metrics.collect`.
+
+    Returns:
+        str: The header value, e.g. 'filter;dur=12.5, chart.tab-line;dur=80.1'.
+
+    """
+    totals = {}
+    for kind, name, value, _ in events:
+        if kind in ('stage', 'job_stage'):
+            totals[name] = totals.get(name, 0.0) + value
+    return ', '.join(f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)};dur={seconds * 1000:.1f}"
+                     for name, seconds in totals.items())
+
+
+def instrument_server(server, metrics, handler_stages=('callback.', 'job_')):
+    """
+    Time the requests of the Flask server and expose the metrics at /metrics.
+
+    Callback requests are timed as the 'dispatch' stage. The part of it not
+    spent in callbacks, or in starting background jobs and fetching their
+    results, is recorded as 'serialize': it is mostly the validation and JSON
+    serialization of the callback's output. Each response gets a Server-Timing
+    header with the stages of its request.
+
+    Args:
+        server (flask.Flask): The Dash app's server.
+        metrics (Metrics): Enabled metrics to record into.
+        handler_stages (tuple): Prefixes of the stages that are not part of serialization.
+
+    """
+    @server.before_request
+    def start_request():
+        flask.g.metrics_start = time.perf_counter()
+        flask.g.metrics_events = []
+        flask.g.metrics_token = _events.set(flask.g.metrics_events)
+        flask.g.metrics_profiler = metrics.start_profile()
+
+    @server.after_request
+    def finish_request(response):
+        start = flask.g.pop('metrics_start', None)
+        if start is None:
+            return response
+        seconds = time.perf_counter() - start
+        events = flask.g.metrics_events
+        if flask.request.path.endswith('/_dash-update-component'):
+            output = (flask.request.get_json(silent=True) or {}).get('output', '')
+            # Multi-output callbacks are named after their first output
+            output = output.lstrip('.').split('...')[0]
+            handled = sum(value for kind, name, value, _ in events
+                          if kind == 'stage' and name.startswith(handler_stages))
+            metrics.record('dispatch', seconds)
+            metrics.record('serialize', max(seconds - handled, 0.0))
+            if not response.direct_passthrough:
+                metrics.record_payload(output, response.calculate_content_length() or 0)
+        timing = server_timing(events)
+        if timing:
+            response.headers['Server-Timing'] = timing
+        metrics.stop_profile(flask.g.pop('metrics_profiler', None), flask.request.path, seconds)
+        return response
+
+    @server.teardown_request
+    def end_request(exc):
+        token = flask.g.pop('metrics_token', None)
+        if token is not None:
+            _events.reset(token)
+
+    @server.route('/metrics')
+    def serve_metrics():
+        return flask.Response(metrics.render(), mimetype='text/plain; version=0.0.4')
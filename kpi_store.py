@@ -0,0 +1,1287 @@
+import itertools
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# Resampling frequencies offered by the dashboard, pre-aggregated at load time
+ROLLUP_FREQUENCIES = ('H', 'D', 'W')
+
+# Width of one bucket for each rollup frequency (weekly buckets run Monday to Sunday)
+_BUCKET_WIDTHS = {
+    'H': np.timedelta64(1, 'h'),
+    'D': np.timedelta64(1, 'D'),
+    'W': np.timedelta64(7, 'D'),
+}
+
+# Maximum number of values kept by the quantile sketch of one (cell_id, pi, day)
+SKETCH_SIZE = 100
+
+# Factor turning a median absolute deviation into an estimate of the standard deviation of normal data
+MAD_SCALE = 1.4826
+
+# Number of series whose recent buckets are gathered into one matrix by `KPIStore.baselines`
+BASELINE_CHUNK_SIZE = 16384
+
+# Source of data versions; every store (and every change to one) gets a new version
+_versions = itertools.count(1)
+
+
+def bucket_labels(times, frequency):
+    """
+    Label timestamps with the bucket pandas' `resample(frequency)` puts them in.
+
+    Args:
+        times (np.ndarray): datetime64[ns] timestamps.
+        frequency (str): One of ROLLUP_FREQUENCIES.
+
+    Returns:
+        np.ndarray: datetime64[ns] bucket labels, one per timestamp.
+
+    """
+    if frequency == 'H':
+        return times.astype('datetime64[h]').astype('datetime64[ns]')
+    days = times.astype('datetime64[D]')
+    if frequency == 'W':
+        # 1970-01-01 was a Thursday; weekly buckets are labelled with their closing Sunday
+        weekday = (days.astype(np.int64) + 3) % 7
+        days = days + (6 - weekday).astype('timedelta64[D]')
+    return days.astype('datetime64[ns]')
+
+
+def bucket_bounds(label, frequency):
+    """
+    Return the half-open time span [start, stop) covered by a bucket.
+
+    Args:
+        label (np.datetime64): Bucket label as returned by `bucket_labels`.
+        frequency (str): One of ROLLUP_FREQUENCIES.
+
+    Returns:
+        tuple: (start, stop) of the bucket as datetime64[ns].
+
+    """
+    stop = label + np.timedelta64(1, 'h' if frequency == 'H' else 'D')
+    return stop - _BUCKET_WIDTHS[frequency], stop
+
+
+def concat_ranges(starts, stops):
+    """
+    Concatenate the integer ranges [start, stop) without a Python-level loop.
+
+    Args:
+        starts (np.ndarray): Start of each range.
+        stops (np.ndarray): Stop of each range.
+
+    Returns:
+        np.ndarray: The concatenated ranges.
+
+    """
+    lengths = stops - starts
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+
+
+def aggregate(values, starts):
+    """
+    Compute the rollup statistics of consecutive segments of an array.
+
+    Args:
+        values (np.ndarray): Values to aggregate (NaN values are ignored).
+        starts (np.ndarray): Offset of each non-empty segment, in increasing order.
+
+    Returns:
+        dict: Count, sum, min, max and sum of squares of each segment.
+
+    """
+    if not len(starts):
+        return {'count': np.zeros(0, dtype=np.int64), 'sum': np.zeros(0), 'min': np.zeros(0),
+                'max': np.zeros(0), 'sumsq': np.zeros(0)}
+    values = values.astype(np.float64)
+    valid = ~np.isnan(values)
+    return {
+        'count': np.add.reduceat(valid.astype(np.int64), starts),
+        'sum': np.add.reduceat(np.where(valid, values, 0.0), starts),
+        'min': np.fmin.reduceat(values, starts),
+        'max': np.fmax.reduceat(values, starts),
+        'sumsq': np.add.reduceat(np.where(valid, values * values, 0.0), starts),
+    }
+
+
+def encode(names, values):
+    """
+    Dictionary-encode values, extending the dictionary with values not seen before.
+
+    Args:
+        names (np.ndarray): Known values; a value's code is its position here.
+        values (array-like): Values to encode.
+
+    Returns:
+        tuple: (names extended with the unseen values in order of appearance, int32 codes).
+
+    """
+    values = np.asarray(values, dtype=object)
+    unseen = pd.unique(values[pd.Index(names).get_indexer(values) < 0])
+    names = np.concatenate((names, np.asarray(unseen, dtype=object)))
+    return names, pd.Index(names).get_indexer(values).astype(np.int32)
+
+
+def code_dtype(n_names):
+    """
+    Pick the smallest integer dtype that holds the codes of a dictionary.
+
+    Args:
+        n_names (int): Number of values in the dictionary.
+
+    Returns:
+        type: np.int8, np.int16 or np.int32.
+
+    """
+    for dtype in (np.int8, np.int16):
+        if n_names <= np.iinfo(dtype).max:
+            return dtype
+    return np.int32
+
+
+def insert_segments(block_starts, blocks, n_blocks):
+    """
+    Compute block offsets after inserting items into some blocks.
+
+    Args:
+        block_starts (np.ndarray): Current block offsets followed by the item count.
+        blocks (np.ndarray): Block index of every inserted item; blocks at or past
+            `len(block_starts) - 1` are new and placed at the end.
+        n_blocks (int): Number of blocks after the insertion.
+
+    Returns:
+        np.ndarray: New block offsets followed by the new item count.
+
+    """
+    counts = np.bincount(blocks, minlength=n_blocks)
+    n_new = n_blocks - (len(block_starts) - 1)
+    starts = np.concatenate((block_starts[:-1], np.full(n_new, block_starts[-1], dtype=np.int64)))
+    starts = starts + np.cumsum(counts) - counts
+    return np.append(starts, block_starts[-1] + len(blocks)).astype(np.int64)
+
+
+def sketch_ranges(values, starts, stops, size):
+    """
+    Reduce ranges of an array to quantile sketches of at most `size` weighted values.
+
+    A range with n <= size values is kept whole. A longer one keeps its values
+    at `size` evenly spaced ranks, each weighted n / size, so any rank read from
+    the sketch is off by at most n / size.
+
+    Args:
+        values (np.ndarray): Values (NaN values are ignored).
+        starts (np.ndarray): Start of each range.
+        stops (np.ndarray): Stop of each range.
+        size (int): Maximum number of values per sketch.
+
+    Returns:
+        tuple: (sketch values, their weights, offset of each sketch followed by the total).
+
+    """
+    lengths = stops - starts
+    sketch = np.repeat(np.arange(len(starts)), lengths)
+    values = values[concat_ranges(starts, stops)].astype(np.float64)
+    valid = ~np.isnan(values)
+    sketch, values = sketch[valid], values[valid]
+    values = values[np.lexsort((values, sketch))]
+    counts = np.bincount(sketch, minlength=len(starts))
+    kept = np.minimum(counts, size)
+    offsets = np.append(np.cumsum(kept) - kept, kept.sum())
+    owner = np.repeat(np.arange(len(starts)), kept)
+    ranks = ((np.arange(kept.sum()) - offsets[owner] + 0.5) * counts[owner] / kept[owner]).astype(np.int64)
+    firsts = np.cumsum(counts) - counts
+    return values[firsts[owner] + ranks], (counts[owner] / kept[owner]).astype(np.float64), offsets
+
+
+def weighted_quantiles(values, weights, groups, n_groups, quantiles):
+    """
+    Compute quantiles of weighted values for several groups at once.
+
+    A value of weight w stands for w equal values. With unit weights the result
+    matches `np.percentile` with linear interpolation.
+
+    Args:
+        values (np.ndarray): Values, without NaN values.
+        weights (np.ndarray): Weight of each value.
+        groups (np.ndarray): Group index of each value.
+        n_groups (int): Number of groups.
+        quantiles (list): Quantiles to compute, between 0 and 1.
+
+    Returns:
+        np.ndarray: (n_groups, len(quantiles)) array, NaN for empty groups.
+
+    """
+    quantiles = np.asarray(quantiles, dtype=np.float64)
+    result = np.full((n_groups, len(quantiles)), np.nan)
+    if not len(values):
+        return result
+    order = np.lexsort((values, groups))
+    values, weights, groups = values[order], weights[order], groups[order]
+    # Global rank of the middle of the run of equal values each weighted value stands for
+    totals = np.cumsum(weights)
+    centers = totals - weights + (weights - 1) / 2
+    firsts = np.searchsorted(groups, np.arange(n_groups), side='left')
+    lasts = np.searchsorted(groups, np.arange(n_groups), side='right') - 1
+    present = lasts >= firsts
+    firsts, lasts = firsts[present], lasts[present]
+    before = np.where(firsts > 0, totals[firsts - 1], 0.0)
+    targets = before[:, None] + quantiles[None, :] * (totals[lasts] - before - 1)[:, None]
+    targets = np.clip(targets, centers[firsts][:, None], centers[lasts][:, None])
+    right = np.clip(np.searchsorted(centers, targets), firsts[:, None], lasts[:, None])
+    left = np.clip(right - 1, firsts[:, None], lasts[:, None])
+    span = centers[right] - centers[left]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fraction = np.where(span > 0, (targets - centers[left]) / span, 0.0)
+    result[present] = values[left] + (values[right] - values[left]) * np.clip(fraction, 0, 1)
+    return result
+
+
+def row_medians(matrix):
+    """
+    Compute the median of each row of a matrix, ignoring NaN values.
+
+    The rows are sorted in single precision, which NumPy sorts several times
+    faster than double precision; NaN values sort last.
+
+    Args:
+        matrix (np.ndarray): 2-D array of values, NaN where missing.
+
+    Returns:
+        np.ndarray: Median of each row, NaN for rows without values.
+
+    """
+    ordered = np.sort(matrix.astype(np.float32), axis=1)
+    count = (~np.isnan(ordered)).sum(axis=1)
+    rows = np.arange(len(ordered))
+    low = ordered[rows, np.maximum(count - 1, 0) // 2].astype(np.float64)
+    high = ordered[rows, count // 2].astype(np.float64)
+    return np.where(count > 0, (low + high) / 2, np.nan)
+
+
+def window_stats(matrix, method='zscore'):
+    """
+    Compute the center and spread of each row of a matrix, ignoring NaN values.
+
+    Args:
+        matrix (np.ndarray): 2-D array with one row of values per series, NaN where missing.
+        method (str): 'zscore' for the mean and sample standard deviation, or 'mad' for the
+            median and the median absolute deviation scaled by MAD_SCALE.
+
+    Returns:
+        tuple: (center, scale, number of values) of each row. Rows with too few
+        values for the method have a NaN center or scale.
+
+    """
+    valid = ~np.isnan(matrix)
+    count = valid.sum(axis=1)
+    if method == 'mad':
+        center = row_medians(matrix)
+        return center, MAD_SCALE * row_medians(np.abs(matrix - center[:, None])), count
+    with np.errstate(invalid='ignore', divide='ignore'):
+        center = np.where(valid, matrix, 0.0).sum(axis=1) / count
+        deviations = np.where(valid, matrix - center[:, None], 0.0)
+        scale = np.sqrt(np.square(deviations).sum(axis=1) / (count - 1))
+    return center, np.where(count > 1, scale, np.nan), count
+
+
+def save_arrays(path, arrays):
+    """
+    Save named arrays as `.npy` files in a directory.
+
+    Args:
+        path (str): Directory to write to (created if missing).
+        arrays (dict): Mapping of array name to array.
+
+    """
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f'{name}.npy'), np.asarray(array))
+
+
+def load_arrays(path, names, mmap_mode='r'):
+    """
+    Load named arrays saved with `save_arrays`.
+
+    Args:
+        path (str): Directory holding the arrays.
+        names (list): Names of the arrays to load.
+        mmap_mode (str, optional): Memory-map mode passed to `np.load`; None reads
+            the arrays into private memory.
+
+    Returns:
+        dict: Mapping of array name to array.
+
+    """
+    return {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode) for name in names}
+
+
+def generation_path(path, generation):
+    """
+    Get the directory of a generation of a store saved with `KPIStore.save`.
+
+    Args:
+        path (str): Directory of the saved store, which is its generation 0.
+        generation (int): Generation number.
+
+    Returns:
+        str: Directory holding the generation's arrays.
+
+    """
+    return path if generation == 0 else os.path.join(path, f'g{generation}')
+
+
+def latest_generation(path):
+    """
+    Find the newest generation of a store saved with `KPIStore.save`.
+
+    Args:
+        path (str): Directory of the saved store.
+
+    Returns:
+        int: Number of the newest generation saved by `KPIStore.save_generation`, or 0.
+
+    """
+    return max((int(name[1:]) for name in os.listdir(path) if name[:1] == 'g' and name[1:].isdigit()), default=0)
+
+
+class Rollup:
+    """
+    Per-(cell_id, pi, bucket) aggregates of a KPIStore at one resampling frequency.
+
+    Each bucket keeps the count, sum, min, max and sum of squares of its non-NaN
+    values, laid out in the same (cell_id, pi) blocks as the store so a series is
+    again a dictionary hit plus a binary search over bucket labels.
+
+    Args:
+        frequency (str): One of ROLLUP_FREQUENCIES.
+        labels (np.ndarray): Bucket labels, time-sorted within each block.
+        stats (dict): Mapping of each name in `Rollup.stats` to its per-bucket array.
+        block_starts (np.ndarray): Offset of each store block's first bucket, followed
+            by the total number of buckets.
+        keys (list): (cell_id, pi) of each store block.
+
+    """
+
+    stats = ['count', 'sum', 'min', 'max', 'sumsq']
+
+    def __init__(self, frequency, labels, stats, block_starts, keys):
+        self.frequency = frequency
+        self.labels = labels
+        for stat in self.stats:
+            setattr(self, stat, stats[stat])
+        self.block_starts = block_starts
+        self.blocks = {key: (int(start), int(stop)) for key, start, stop in zip(keys, block_starts[:-1], block_starts[1:])}
+
+    @classmethod
+    def from_store(cls, store, frequency):
+        """
+        Aggregate a store's rows into buckets.
+
+        Args:
+            store (KPIStore): Store to aggregate.
+            frequency (str): One of ROLLUP_FREQUENCIES.
+
+        Returns:
+            Rollup: The rollup of the store at the given frequency.
+
+        """
+        labels = bucket_labels(store.times, frequency)
+        # A new bucket starts wherever the series or the bucket label changes
+        is_start = np.ones(len(labels), dtype=bool)
+        is_start[1:] = labels[1:] != labels[:-1]
+        is_start[store.block_starts[:-1]] = True
+        starts = np.flatnonzero(is_start)
+        stats = aggregate(store.values, starts)
+        # Translate the store's row blocks into bucket blocks
+        block_starts = np.searchsorted(starts, store.block_starts)
+        return cls(frequency, labels[starts], stats, block_starts, store.keys)
+
+    def append(self, blocks, labels, values, n_blocks, keys):
+        """
+        Return a new rollup with extra rows merged into their buckets.
+
+        The statistics are mergeable, so buckets that already exist are updated
+        from the new rows alone and missing buckets are inserted; the cost grows
+        with the number of new rows, not with the size of the rollup.
+
+        Args:
+            blocks (np.ndarray): Store block index of every new row.
+            labels (np.ndarray): Bucket label of every new row.
+            values (np.ndarray): Value of every new row.
+            n_blocks (int): Number of store blocks after the append.
+            keys (list): (cell_id, pi) of each store block after the append.
+
+        Returns:
+            Rollup: The updated rollup.
+
+        """
+        # Aggregate the new rows per (block, bucket)
+        order = np.lexsort((labels, blocks))
+        blocks, labels, values = blocks[order], labels[order], values[order]
+        is_start = np.ones(len(labels), dtype=bool)
+        is_start[1:] = (blocks[1:] != blocks[:-1]) | (labels[1:] != labels[:-1])
+        starts = np.flatnonzero(is_start)
+        delta = aggregate(values, starts)
+        blocks, labels = blocks[starts], labels[starts]
+        # Find each new bucket's place within its block, and whether it already exists
+        positions = np.empty(len(starts), dtype=np.int64)
+        exists = np.zeros(len(starts), dtype=bool)
+        n_old = len(self.block_starts) - 1
+        block_ids, firsts = np.unique(blocks, return_index=True)
+        for block, lo, hi in zip(block_ids, firsts, np.append(firsts[1:], len(blocks))):
+            start, stop = (self.block_starts[block], self.block_starts[block + 1]) if block < n_old \
+                else (self.block_starts[-1], self.block_starts[-1])
+            found = start + np.searchsorted(self.labels[start:stop], labels[lo:hi])
+            positions[lo:hi] = found
+            within = found < stop
+            exists[lo:hi][within] = self.labels[found[within]] == labels[lo:hi][within]
+        # Insert the missing buckets empty, then merge the new rows into every touched bucket
+        inserted = positions[~exists]
+        targets = positions + np.searchsorted(inserted, positions, side='right')
+        targets[~exists] = inserted + np.arange(len(inserted))
+        stats = {}
+        for stat in self.stats:
+            stats[stat] = np.insert(getattr(self, stat), inserted, np.nan if stat in ('min', 'max') else 0)
+            if stat == 'min':
+                stats[stat][targets] = np.fmin(stats[stat][targets], delta[stat])
+            elif stat == 'max':
+                stats[stat][targets] = np.fmax(stats[stat][targets], delta[stat])
+            else:
+                stats[stat][targets] += delta[stat]
+        return Rollup(self.frequency, np.insert(self.labels, inserted, labels[~exists]), stats,
+                      insert_segments(self.block_starts, blocks[~exists], n_blocks), keys)
+
+    def save(self, path):
+        """
+        Save the rollup's arrays to a directory.
+
+        Args:
+            path (str): Directory to write to.
+
+        """
+        save_arrays(path, {'labels': self.labels, 'block_starts': self.block_starts,
+                           **{stat: getattr(self, stat) for stat in self.stats}})
+
+    @classmethod
+    def open(cls, path, frequency, keys):
+        """
+        Open a rollup saved with `save`, memory-mapping its arrays.
+
+        Args:
+            path (str): Directory holding the rollup.
+            frequency (str): One of ROLLUP_FREQUENCIES.
+            keys (list): (cell_id, pi) of each store block.
+
+        Returns:
+            Rollup: The memory-mapped rollup.
+
+        """
+        arrays = load_arrays(path, ['labels', 'block_starts'] + cls.stats)
+        return cls(frequency, arrays['labels'], arrays, arrays['block_starts'], keys)
+
+    def locate(self, cell_id, pi, first_label, last_label):
+        """
+        Find the buckets of one (cell_id, pi) series between two labels, inclusive.
+
+        Args:
+            cell_id (str): Cell ID.
+            pi (str): Performance Indicator.
+            first_label (np.datetime64): First bucket label.
+            last_label (np.datetime64): Last bucket label.
+
+        Returns:
+            slice: Slice into the rollup's arrays.
+
+        """
+        start, stop = self.blocks.get((cell_id, pi), (0, 0))
+        labels = self.labels[start:stop]
+        lo = np.searchsorted(labels, first_label, side='left')
+        hi = np.searchsorted(labels, last_label, side='right')
+        return slice(start + lo, start + hi)
+
+
+class QuantileSketches:
+    """
+    Mergeable quantile sketches of a KPIStore's values, one per (cell_id, pi, day).
+
+    Each sketch holds at most `size` weighted values (see `sketch_ranges`), laid
+    out in the same (cell_id, pi) blocks as the store. Merging the sketches of
+    any set of days gives quantiles whose rank is off by at most 1 / size of the
+    merged samples, and exact ones when no day has more than `size` samples.
+
+    Args:
+        labels (np.ndarray): Day of each sketch, time-sorted within each block.
+        values (np.ndarray): Values of all sketches.
+        weights (np.ndarray): Weight of each value.
+        offsets (np.ndarray): Offset of each sketch's first value, followed by the total.
+        block_starts (np.ndarray): Offset of each store block's first sketch, followed
+            by the number of sketches.
+        keys (list): (cell_id, pi) of each store block.
+        size (int): Maximum number of values per sketch.
+
+    """
+
+    def __init__(self, labels, values, weights, offsets, block_starts, keys, size=SKETCH_SIZE):
+        self.labels = labels
+        self.values = values
+        self.weights = weights
+        self.offsets = offsets
+        self.block_starts = block_starts
+        self.size = size
+        self.blocks = {key: (int(start), int(stop)) for key, start, stop in zip(keys, block_starts[:-1], block_starts[1:])}
+
+    @classmethod
+    def from_store(cls, store, size=SKETCH_SIZE):
+        """
+        Sketch every day of every series of a store.
+
+        Args:
+            store (KPIStore): Store to sketch.
+            size (int): Maximum number of values per sketch.
+
+        Returns:
+            QuantileSketches: The sketches of the store.
+
+        """
+        labels = bucket_labels(store.times, 'D')
+        # A new sketch starts wherever the series or the day changes
+        is_start = np.ones(len(labels), dtype=bool)
+        is_start[1:] = labels[1:] != labels[:-1]
+        is_start[store.block_starts[:-1]] = True
+        starts = np.flatnonzero(is_start)
+        values, weights, offsets = sketch_ranges(store.values, starts, np.append(starts[1:], len(labels)), size)
+        block_starts = np.searchsorted(starts, store.block_starts)
+        return cls(labels[starts], values, weights, offsets, block_starts, store.keys, size)
+
+    def append(self, store, blocks, labels):
+        """
+        Return new sketches after rows were appended to the store.
+
+        Only the days that received rows are sketched again, from the store's rows.
+
+        Args:
+            store (KPIStore): Store after the append.
+            blocks (np.ndarray): Store block index of every new row.
+            labels (np.ndarray): Day of every new row.
+
+        Returns:
+            QuantileSketches: The updated sketches.
+
+        """
+        touched = pd.MultiIndex.from_arrays([blocks, labels]).unique().sort_values()
+        touched_blocks, touched_labels = touched.get_level_values(0).to_numpy(), touched.get_level_values(1).to_numpy()
+        # Rows of each touched day in the new store
+        starts, stops = np.empty(len(touched), dtype=np.int64), np.empty(len(touched), dtype=np.int64)
+        for i, (block, label) in enumerate(zip(touched_blocks, touched_labels)):
+            lo, hi = store.block_starts[block], store.block_starts[block + 1]
+            starts[i], stops[i] = lo + np.searchsorted(store.times[lo:hi], [label, label + np.timedelta64(1, 'D')])
+        values, weights, offsets = sketch_ranges(store.values, starts, stops, self.size)
+        # Keep the untouched sketches and merge in the new ones, in block and day order
+        sketch_blocks = np.repeat(np.arange(len(self.block_starts) - 1), np.diff(self.block_starts))
+        keep = ~pd.MultiIndex.from_arrays([sketch_blocks, self.labels]).isin(touched)
+        all_blocks = np.concatenate((sketch_blocks[keep], touched_blocks))
+        all_labels = np.concatenate((self.labels[keep], touched_labels))
+        firsts = np.concatenate((self.offsets[:-1][keep], offsets[:-1] + len(self.values)))
+        lasts = np.concatenate((self.offsets[1:][keep], offsets[1:] + len(self.values)))
+        order = np.lexsort((all_labels, all_blocks))
+        gathered = concat_ranges(firsts[order], lasts[order])
+        lengths = lasts[order] - firsts[order]
+        return QuantileSketches(
+            all_labels[order],
+            np.concatenate((self.values, values))[gathered],
+            np.concatenate((self.weights, weights))[gathered],
+            np.append(np.cumsum(lengths) - lengths, lengths.sum()),
+            np.searchsorted(all_blocks[order], np.arange(len(store.block_starts))),
+            store.keys,
+            self.size,
+        )
+
+    def locate(self, cell_id, pi, first_label, last_label):
+        """
+        Find the sketches of one (cell_id, pi) series between two days, inclusive.
+
+        Args:
+            cell_id (str): Cell ID.
+            pi (str): Performance Indicator.
+            first_label (np.datetime64): First day.
+            last_label (np.datetime64): Last day.
+
+        Returns:
+            slice: Slice of sketch indices.
+
+        """
+        start, stop = self.blocks.get((cell_id, pi), (0, 0))
+        labels = self.labels[start:stop]
+        lo = np.searchsorted(labels, first_label, side='left')
+        hi = np.searchsorted(labels, last_label, side='right')
+        return slice(start + lo, start + hi)
+
+
+class KPIStore:
+    """
+    KPI table indexed by (cell_id, pi).
+
+    The table is held as column arrays sorted by cell, PI and time. Every
+    (cell_id, pi) series is thus a contiguous, time-sorted block, and a lookup
+    for a cell, a list of PIs and a date range is a dictionary hit per PI plus a
+    binary search over the block's timestamps, instead of a scan over the table.
+
+    No strings are stored per row. The cell and PI of a row are those of its
+    block, kept once per block as integer codes into the cell and PI names; the
+    KPI category is dictionary-encoded per row, in the smallest integer type
+    that holds its codes. Timestamps are int64-backed datetime64[ns] values and
+    the KPI values keep the compact dtype they were loaded with.
+
+    The arrays can be saved to a directory and memory-mapped back with `open`,
+    so several worker processes share one physical copy of the data. Stores
+    grown by `append` are saved next to it as its next generation with
+    `save_generation`, and the other processes switch to it with `refresh`.
+
+    Args:
+        times (np.ndarray): datetime64[ns] timestamps.
+        category_codes (np.ndarray): Index of each row's KPI category in `category_names`.
+        values (np.ndarray): KPI values.
+        cell_names (list): Cell IDs.
+        category_names (list): KPI categories.
+        pi_names (list): Performance Indicators.
+        block_starts (np.ndarray): Offset of each (cell_id, pi) block followed by the number of rows.
+        block_cells (np.ndarray): Index of each block's cell in `cell_names`.
+        block_pis (np.ndarray): Index of each block's PI in `pi_names`.
+        rollups (dict, optional): Rollups by frequency; built from the rows if omitted.
+        meta (dict, optional): JSON-serializable extras saved alongside the arrays.
+
+    """
+
+    columns = ['date_time', 'cell_id', 'kpi_category', 'pi', 'value']
+    arrays = ['times', 'category_codes', 'values', 'block_starts', 'block_cells', 'block_pis']
+    # Layout of the saved arrays; part of the shared store's cache name so older layouts are rebuilt
+    format_version = 2
+
+    def __init__(self, times, category_codes, values, cell_names, category_names, pi_names,
+                 block_starts, block_cells, block_pis, rollups=None, meta=None):
+        self.times = times
+        self.category_codes = category_codes
+        self.values = values
+        self.cell_names = np.asarray(cell_names, dtype=object)
+        self.category_names = np.asarray(category_names, dtype=object)
+        self.pi_names = np.asarray(pi_names, dtype=object)
+        self.block_starts = block_starts
+        self.block_cells = block_cells
+        self.block_pis = block_pis
+        self.keys = list(zip(self.cell_names[block_cells], self.pi_names[block_pis]))
+        self.blocks = {key: (int(start), int(stop)) for key, start, stop in zip(self.keys, self.block_starts[:-1], self.block_starts[1:])}
+        if rollups is None:
+            rollups = {frequency: Rollup.from_store(self, frequency) for frequency in ROLLUP_FREQUENCIES}
+        self.rollups = rollups
+        # Quantile sketches, built on first use
+        self._sketches = None
+        self.meta = meta or {}
+        # Identifies the data held by the store, for invalidating derived caches
+        self.version = next(_versions)
+        # Directory and generation of the saved store, set by `open`
+        self.root = None
+        self.generation = None
+
+    @classmethod
+    def from_frame(cls, df, meta=None):
+        """
+        Build a store from a long-format KPI DataFrame.
+
+        Args:
+            df (pd.DataFrame): KPI data with 'date_time', 'cell_id', 'kpi_category',
+                'pi' and 'value' columns.
+            meta (dict, optional): JSON-serializable extras saved alongside the arrays.
+
+        Returns:
+            KPIStore: The indexed store.
+
+        """
+        encoded = {column: pd.Categorical(df[column]) for column in ['cell_id', 'kpi_category', 'pi']}
+        order = np.lexsort((df['date_time'].to_numpy(), encoded['pi'].codes, encoded['cell_id'].codes))
+        cell_codes, pi_codes = encoded['cell_id'].codes[order], encoded['pi'].codes[order]
+        # A new block starts wherever the cell or the PI changes
+        change = (np.diff(cell_codes) != 0) | (np.diff(pi_codes) != 0)
+        starts = np.concatenate(([0] if len(order) else [], np.flatnonzero(change) + 1)).astype(np.int64)
+        names = {column: list(encoded[column].categories) for column in encoded}
+        return cls(
+            times=df['date_time'].to_numpy(dtype='datetime64[ns]')[order],
+            category_codes=encoded['kpi_category'].codes[order].astype(code_dtype(len(names['kpi_category']))),
+            values=df['value'].to_numpy()[order],
+            cell_names=names['cell_id'],
+            category_names=names['kpi_category'],
+            pi_names=names['pi'],
+            block_starts=np.append(starts, len(order)),
+            block_cells=cell_codes[starts].astype(code_dtype(len(names['cell_id']))),
+            block_pis=pi_codes[starts].astype(code_dtype(len(names['pi']))),
+            meta=meta,
+        )
+
+    def append(self, df):
+        """
+        Return a new store with extra rows, leaving this one untouched.
+
+        The new rows are merged into their (cell_id, pi) blocks and into the
+        rollups' buckets; unseen cells, categories, PIs and series are added.
+        Besides copying the column arrays once, the work grows with the number
+        of new rows rather than with the size of the store. Readers holding the
+        old store keep a consistent view while the new one is built.
+
+        The copied arrays are private to the process, even when this store is
+        memory-mapped; `save_generation` makes them shared again.
+
+        Args:
+            df (pd.DataFrame): New rows with 'date_time', 'cell_id', 'kpi_category',
+                'pi' and 'value' columns.
+
+        Returns:
+            KPIStore: Store holding the old and new rows.
+
+        """
+        if not len(df):
+            return self
+        cell_names, cell_codes = encode(self.cell_names, df['cell_id'])
+        category_names, category_codes = encode(self.category_names, df['kpi_category'])
+        pi_names, pi_codes = encode(self.pi_names, df['pi'])
+        times = df['date_time'].to_numpy(dtype='datetime64[ns]')
+        values = df['value'].to_numpy().astype(self.values.dtype)
+        # Assign each row to its series block; unseen series get new blocks at the end
+        n_old = len(self.block_starts) - 1
+        series = cell_codes.astype(np.int64) * len(pi_names) + pi_codes
+        block_series = self.block_cells.astype(np.int64) * len(pi_names) + self.block_pis
+        blocks = pd.Index(block_series).get_indexer(series)
+        unseen, unseen_blocks = np.unique(series[blocks < 0], return_inverse=True)
+        blocks[blocks < 0] = n_old + unseen_blocks
+        n_blocks = n_old + len(unseen)
+        # Codes are widened if the dictionaries outgrew their dtype
+        block_cells = np.concatenate((self.block_cells, unseen // len(pi_names))).astype(code_dtype(len(cell_names)))
+        block_pis = np.concatenate((self.block_pis, unseen % len(pi_names))).astype(code_dtype(len(pi_names)))
+        keys = list(zip(cell_names[block_cells], pi_names[block_pis]))
+        # Sort the new rows by block and time, and find where each goes in the arrays
+        order = np.lexsort((times, blocks))
+        blocks, times, values = blocks[order], times[order], values[order]
+        category_codes = category_codes[order]
+        positions = np.full(len(blocks), len(self.times), dtype=np.int64)
+        block_ids, firsts = np.unique(blocks, return_index=True)
+        for block, lo, hi in zip(block_ids, firsts, np.append(firsts[1:], len(blocks))):
+            if block < n_old:
+                start, stop = self.block_starts[block], self.block_starts[block + 1]
+                positions[lo:hi] = start + np.searchsorted(self.times[start:stop], times[lo:hi], side='right')
+        block_starts = insert_segments(self.block_starts, blocks, n_blocks)
+        rollups = {frequency: rollup.append(blocks, bucket_labels(times, frequency), values, n_blocks, keys)
+                   for frequency, rollup in self.rollups.items()}
+        store = KPIStore(
+            times=np.insert(self.times, positions, times),
+            category_codes=np.insert(self.category_codes.astype(code_dtype(len(category_names))), positions,
+                                     category_codes),
+            values=np.insert(self.values, positions, values),
+            cell_names=cell_names,
+            category_names=category_names,
+            pi_names=pi_names,
+            block_starts=block_starts,
+            block_cells=block_cells,
+            block_pis=block_pis,
+            rollups=rollups,
+            meta=self.meta,
+        )
+        if self._sketches is not None:
+            store._sketches = self._sketches.append(store, blocks, bucket_labels(times, 'D'))
+        return store
+
+    @property
+    def sketches(self):
+        """
+        QuantileSketches: Per-day quantile sketches of the store, built on first use.
+
+        """
+        if self._sketches is None:
+            self._sketches = QuantileSketches.from_store(self)
+        return self._sketches
+
+    def save(self, path, meta=None):
+        """
+        Save the store and its rollups to a directory for memory-mapping with `open`.
+
+        The directory is written under a temporary name and renamed into place, so
+        processes racing to build the same store never see a partial copy.
+
+        Args:
+            path (str): Directory to write to. Left untouched if it already exists.
+            meta (dict, optional): JSON-serializable extras saved instead of the store's `meta`.
+
+        """
+        meta = self.meta if meta is None else meta
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        save_arrays(tmp_path, {name: getattr(self, name) for name in self.arrays})
+        for frequency, rollup in self.rollups.items():
+            rollup.save(os.path.join(tmp_path, f'rollup-{frequency}'))
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump({
+                'cell_names': list(self.cell_names),
+                'category_names': list(self.category_names),
+                'pi_names': list(self.pi_names),
+                'rollups': list(self.rollups),
+                **meta,
+            }, f)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another process saved the same store first
+            shutil.rmtree(tmp_path)
+
+    def save_generation(self, root, meta=None):
+        """
+        Save the store as the next generation of a saved store, and memory-map it back.
+
+        A store grown by `append` from a memory-mapped one holds its arrays in
+        private memory; once saved, every process maps the same copy again.
+        Generations before the previous one are removed: processes still mapping
+        them keep their pages until they switch to a newer one.
+
+        Args:
+            root (str): Directory of the saved store.
+            meta (dict, optional): JSON-serializable extras saved instead of the store's `meta`.
+
+        Returns:
+            KPIStore: The memory-mapped new generation.
+
+        """
+        generation = latest_generation(root) + 1
+        self.save(generation_path(root, generation), meta)
+        for old in range(1, generation - 1):
+            shutil.rmtree(generation_path(root, old), ignore_errors=True)
+        return KPIStore.open(root, generation)
+
+    @classmethod
+    def open(cls, path, generation=None):
+        """
+        Open a store saved with `save`, memory-mapping its arrays read-only.
+
+        Args:
+            path (str): Directory holding the store.
+            generation (int, optional): Generation to open; the newest if omitted.
+
+        Returns:
+            KPIStore: The memory-mapped store.
+
+        """
+        if generation is None:
+            generation = latest_generation(path)
+        directory = generation_path(path, generation)
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = load_arrays(directory, cls.arrays)
+        names = {name: meta.pop(name) for name in ['cell_names', 'category_names', 'pi_names']}
+        keys = list(zip(np.asarray(names['cell_names'], dtype=object)[arrays['block_cells']],
+                        np.asarray(names['pi_names'], dtype=object)[arrays['block_pis']]))
+        rollups = {frequency: Rollup.open(os.path.join(directory, f'rollup-{frequency}'), frequency, keys)
+                   for frequency in meta.pop('rollups')}
+        store = cls(**arrays, **names, rollups=rollups, meta=meta)
+        store.root, store.generation = path, generation
+        return store
+
+    def refresh(self):
+        """
+        Return the newest generation of the saved store this one was opened from.
+
+        Returns:
+            KPIStore: The newest generation, or this store if it is the newest or was not opened with `open`.
+
+        """
+        if self.root is None or latest_generation(self.root) == self.generation:
+            return self
+        return KPIStore.open(self.root)
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def min_date(self):
+        """pd.Timestamp: Earliest timestamp in the store."""
+        return pd.Timestamp(self.times[self.block_starts[:-1]].min())
+
+    @property
+    def max_date(self):
+        """pd.Timestamp: Latest timestamp in the store."""
+        return pd.Timestamp(self.times[self.block_starts[1:] - 1].max())
+
+    def locate(self, cell_id, pi, start_date=None, end_date=None):
+        """
+        Find the rows of one (cell_id, pi) series that fall within a date range.
+
+        Args:
+            cell_id (str): Cell ID.
+            pi (str): Performance Indicator.
+            start_date (datetime, optional): Inclusive start of the range.
+            end_date (datetime, optional): Inclusive end of the range.
+
+        Returns:
+            slice: Row slice into the store's column arrays (empty if the series is unknown).
+
+        """
+        start, stop = self.blocks.get((cell_id, pi), (0, 0))
+        times = self.times[start:stop]
+        lo = 0 if start_date is None else np.searchsorted(times, pd.Timestamp(start_date).to_datetime64(), side='left')
+        hi = len(times) if end_date is None else np.searchsorted(times, pd.Timestamp(end_date).to_datetime64(), side='right')
+        return slice(start + lo, start + hi)
+
+    def count_rows(self, cell_id, pis, start_date=None, end_date=None):
+        """
+        Count the samples of a cell's series within a date range.
+
+        Args:
+            cell_id (str): Cell ID.
+            pis (str or list): Performance Indicator(s).
+            start_date (datetime, optional): Inclusive start of the range.
+            end_date (datetime, optional): Inclusive end of the range.
+
+        Returns:
+            np.ndarray: Number of rows of each PI, in the given order.
+
+        """
+        pis = pis if isinstance(pis, list) else [pis]
+        rows = [self.locate(cell_id, pi, start_date, end_date) for pi in pis]
+        return np.array([found.stop - found.start for found in rows], dtype=np.int64)
+
+    def query(self, cell_ids, pis, start_date=None, end_date=None):
+        """
+        Return the raw rows for a list of cells, a list of PIs and a date range.
+
+        Args:
+            cell_ids (str or list): Cell ID(s).
+            pis (str or list): Performance Indicator(s).
+            start_date (datetime, optional): Inclusive start of the range.
+            end_date (datetime, optional): Inclusive end of the range.
+
+        Returns:
+            pd.DataFrame: Matching rows, grouped by cell and PI in the requested order and sorted by time.
+            The cell, KPI category and PI columns are categoricals, so filtering them compares codes.
+
+        """
+        if not isinstance(cell_ids, list):
+            cell_ids = [cell_ids]
+        if not isinstance(pis, list):
+            pis = [pis]
+        # Drop repeated cells and PIs so each series is returned once, as with `isin`
+        cell_ids, pis = list(dict.fromkeys(cell_ids)), list(dict.fromkeys(pis))
+        slices = [self.locate(cell_id, pi, start_date, end_date) for cell_id in cell_ids for pi in pis]
+        starts = np.array([s.start for s in slices], dtype=np.int64)
+        stops = np.array([s.stop for s in slices], dtype=np.int64)
+        rows = concat_ranges(starts, stops)
+        # Each row takes the cell and PI of its series
+        series_cells = np.repeat(np.arange(len(cell_ids)), len(pis))
+        series_pis = np.tile(np.arange(len(pis)), len(cell_ids))
+        return pd.DataFrame({
+            'date_time': self.times[rows],
+            'cell_id': pd.Categorical.from_codes(np.repeat(series_cells, stops - starts), categories=cell_ids),
+            'kpi_category': pd.Categorical.from_codes(self.category_codes[rows], categories=self.category_names),
+            'pi': pd.Categorical.from_codes(np.repeat(series_pis, stops - starts), categories=pis),
+            'value': self.values[rows],
+        }, columns=self.columns)
+
+    def _rollup_arrays(self, cell_ids, pis, start_date, end_date, frequency):
+        """
+        Compute the per-bucket statistics behind `rollup` as arrays.
+
+        Args:
+            cell_ids (str or list): Cell ID(s).
+            pis (str or list): Performance Indicator(s).
+            start_date (datetime): Inclusive start of the range.
+            end_date (datetime): Inclusive end of the range.
+            frequency (str): One of ROLLUP_FREQUENCIES.
+
+        Returns:
+            tuple: ((cell_id, pi) of each series with data, series index of each bucket,
+            bucket labels, dict of per-bucket statistic arrays).
+
+        """
+        if not isinstance(cell_ids, list):
+            cell_ids = [cell_ids]
+        if not isinstance(pis, list):
+            pis = [pis]
+        rollup = self.rollups[frequency]
+        start_date = pd.Timestamp(start_date).to_datetime64()
+        end_date = pd.Timestamp(end_date).to_datetime64()
+        # Binary-search the raw rows of every requested series, keeping those with data
+        keys, rows = [], []
+        for key in ((cell_id, pi) for cell_id in sorted(set(cell_ids)) for pi in sorted(set(pis))):
+            found = self.locate(*key, start_date, end_date)
+            if found.stop > found.start:
+                keys.append(key)
+                rows.append((found.start, found.stop))
+        rows = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        first_label = bucket_labels(self.times[rows[:, 0]], frequency)
+        last_label = bucket_labels(self.times[rows[:, 1] - 1], frequency)
+        # Gather the rollup buckets of every series
+        buckets = np.array([(found.start, found.stop) for found in (
+            rollup.locate(*key, first, last) for key, first, last in zip(keys, first_label, last_label)
+        )], dtype=np.int64).reshape(-1, 2)
+        gathered = concat_ranges(buckets[:, 0], buckets[:, 1])
+        stats = {stat: getattr(rollup, stat)[gathered].astype(np.float64) for stat in Rollup.stats}
+        series = np.repeat(np.arange(len(keys)), buckets[:, 1] - buckets[:, 0])
+        positions = np.cumsum(buckets[:, 1] - buckets[:, 0]) - (buckets[:, 1] - buckets[:, 0])
+        # Re-aggregate the buckets cut by the range boundaries from the raw rows
+        first_start, first_stop = bucket_bounds(first_label, frequency)
+        last_start, last_stop = bucket_bounds(last_label, frequency)
+        single = first_label == last_label
+        cut_first = (first_start < start_date) | single
+        cut_last = (last_stop - np.timedelta64(1, 'ns') > end_date) & ~single
+        edges = [(lo, lo + np.searchsorted(self.times[lo:hi], stop), position)
+                 for (lo, hi), stop, position in zip(rows[cut_first], first_stop[cut_first], positions[cut_first])]
+        edges += [(lo + np.searchsorted(self.times[lo:hi], start), hi, position + count - 1)
+                  for (lo, hi), start, position, count in zip(rows[cut_last], last_start[cut_last], positions[cut_last],
+                                                              (buckets[:, 1] - buckets[:, 0])[cut_last])]
+        if edges:
+            edges = np.array(edges, dtype=np.int64)
+            lengths = edges[:, 1] - edges[:, 0]
+            edge_stats = aggregate(self.values[concat_ranges(edges[:, 0], edges[:, 1])], np.cumsum(lengths) - lengths)
+            for stat in Rollup.stats:
+                stats[stat][edges[:, 2]] = edge_stats[stat]
+        # Spread the buckets over the full label range of each series, leaving gaps empty
+        width = _BUCKET_WIDTHS[frequency]
+        lengths = (last_label - first_label) // width + 1
+        offsets = np.cumsum(lengths) - lengths
+        full_series = np.repeat(np.arange(len(keys)), lengths)
+        labels = first_label[full_series] + (np.arange(lengths.sum()) - offsets[full_series]) * width
+        slots = offsets[series] + (rollup.labels[gathered] - first_label[series]) // width
+        columns = {}
+        for stat in Rollup.stats:
+            column = np.full(len(labels), np.nan if stat in ('min', 'max') else 0.0)
+            column[slots] = stats[stat]
+            columns[stat] = column
+        return keys, full_series, labels, columns
+
+    def rollup(self, cell_ids, pis, start_date, end_date, frequency):
+        """
+        Return per-bucket statistics for a list of cells, a list of PIs and a date range.
+
+        All requested series are answered in one vectorized pass. Buckets that lie
+        entirely inside the range are read from the pre-computed rollup; the (at
+        most two per series) buckets cut by the range boundaries are aggregated
+        from the raw rows, so the result matches resampling the filtered rows
+        exactly. Empty buckets between a series' first and last sample are
+        included with a zero count, as `resample` does.
+
+        Args:
+            cell_ids (str or list): Cell ID(s).
+            pis (str or list): Performance Indicator(s).
+            start_date (datetime): Inclusive start of the range.
+            end_date (datetime): Inclusive end of the range.
+            frequency (str): One of ROLLUP_FREQUENCIES.
+
+        Returns:
+            pd.DataFrame: 'cell_id', 'pi', 'date_time', 'count', 'sum', 'min', 'max',
+            'sumsq', 'mean' and 'std' columns, ordered by cell, PI and bucket. The cell
+            and PI columns are categoricals.
+
+        """
+        keys, full_series, labels, columns = self._rollup_arrays(cell_ids, pis, start_date, end_date, frequency)
+        result = pd.DataFrame({
+            'cell_id': pd.Categorical([key[0] for key in keys])[full_series],
+            'pi': pd.Categorical([key[1] for key in keys])[full_series],
+            'date_time': labels,
+        })
+        for stat in Rollup.stats:
+            result[stat] = columns[stat]
+        count = result['count'].where(result['count'] > 0)
+        result['mean'] = result['sum'] / count
+        # Sample standard deviation of the raw values within each bucket
+        result['std'] = np.sqrt(((result['sumsq'] - result['sum'] * result['mean']) / (count - 1)).clip(lower=0))
+        return result
+
+    def rollup_matrix(self, cell_ids, pi, start_date, end_date, frequency):
+        """
+        Return the per-bucket statistics of one PI as cells x buckets matrices.
+
+        The statistics come from the same vectorized pass as `rollup` and are laid
+        out on one grid of buckets shared by all cells, without building a
+        long-format table on the way.
+
+        Args:
+            cell_ids (str or list): Cell ID(s).
+            pi (str): Performance Indicator.
+            start_date (datetime): Inclusive start of the range.
+            end_date (datetime): Inclusive end of the range.
+            frequency (str): One of ROLLUP_FREQUENCIES.
+
+        Returns:
+            tuple: (IDs of the cells with data, bucket labels, dict mapping each name
+            in `Rollup.stats` to a (cells, buckets) matrix). Empty buckets have a zero count.
+
+        """
+        keys, series, labels, columns = self._rollup_arrays(cell_ids, [pi], start_date, end_date, frequency)
+        cells = np.array([key[0] for key in keys], dtype=object)
+        if not len(labels):
+            return cells, labels, {stat: np.empty((0, 0)) for stat in Rollup.stats}
+        width = _BUCKET_WIDTHS[frequency]
+        first = labels.min()
+        slots = (labels - first) // width
+        n_buckets = int(slots.max()) + 1
+        positions = series * n_buckets + slots
+        matrices = {}
+        for stat in Rollup.stats:
+            matrix = np.full(len(cells) * n_buckets, np.nan if stat in ('min', 'max') else 0.0)
+            matrix[positions] = columns[stat]
+            matrices[stat] = matrix.reshape(len(cells), n_buckets)
+        return cells, first + np.arange(n_buckets) * width, matrices
+
+    def describe(self, cell_ids, pis, start_date, end_date, exact=False, by_cell=True):
+        """
+        Summarize the samples of each series in a date range, like `describe()`.
+
+        The count, mean, standard deviation, minimum and maximum are exact and come
+        from the daily rollup. The quartiles merge the quantile sketches of the
+        days inside the range with the raw samples of the (at most two) days cut
+        by its boundaries, so their rank is off by at most 1 / SKETCH_SIZE of the
+        samples; with `exact` they are computed from all the raw samples instead.
+
+        Args:
+            cell_ids (str or list): Cell ID(s).
+            pis (str or list): Performance Indicator(s).
+            start_date (datetime): Inclusive start of the range.
+            end_date (datetime): Inclusive end of the range.
+            exact (bool): Compute the quartiles from the raw samples.
+            by_cell (bool): Summarize each (cell_id, pi) series; otherwise merge
+                the selected cells and summarize each PI across them.
+
+        Returns:
+            pd.DataFrame: 'cell_id' (if by_cell), 'pi', 'count', 'mean', 'std', 'min',
+            '25%', '50%', '75%' and 'max' columns, for the series with samples in the range.
+
+        """
+        keys, series, _, columns = self._rollup_arrays(cell_ids, pis, start_date, end_date, 'D')
+        start_date = pd.Timestamp(start_date).to_datetime64()
+        end_date = pd.Timestamp(end_date).to_datetime64()
+        # Series are summarized on their own or grouped by PI
+        if by_cell:
+            group_keys, groups = keys, np.arange(len(keys))
+        else:
+            group_keys = sorted({(pi,) for _, pi in keys})
+            groups = np.array([group_keys.index((pi,)) for _, pi in keys], dtype=np.int64)
+        n_groups = len(group_keys)
+        bucket_groups = groups[series]
+        count = np.bincount(bucket_groups, weights=columns['count'], minlength=n_groups)
+        total = np.bincount(bucket_groups, weights=columns['sum'], minlength=n_groups)
+        sumsq = np.bincount(bucket_groups, weights=columns['sumsq'], minlength=n_groups)
+        minimum, maximum = np.full(n_groups, np.nan), np.full(n_groups, np.nan)
+        np.fmin.at(minimum, bucket_groups, columns['min'])
+        np.fmax.at(maximum, bucket_groups, columns['max'])
+        # Raw rows for the days cut by the range (or all rows if exact), sketches for whole days
+        rows, row_groups, sketch_spans, sketch_groups = [], [], [], []
+        for key, group in zip(keys, groups):
+            found = self.locate(*key, start_date, end_date)
+            if exact:
+                rows.append((found.start, found.stop))
+                row_groups.append(group)
+                continue
+            first_day, last_day = bucket_labels(self.times[[found.start, found.stop - 1]], 'D')
+            whole_first = first_day if first_day >= start_date else first_day + np.timedelta64(1, 'D')
+            whole_last = last_day if last_day + np.timedelta64(1, 'D') - np.timedelta64(1, 'ns') <= end_date \
+                else last_day - np.timedelta64(1, 'D')
+            if whole_first > whole_last:
+                rows.append((found.start, found.stop))
+                row_groups.append(group)
+                continue
+            times = self.times[found]
+            head = found.start + np.searchsorted(times, whole_first)
+            tail = found.start + np.searchsorted(times, whole_last + np.timedelta64(1, 'D'))
+            rows += [(found.start, head), (tail, found.stop)]
+            row_groups += [group, group]
+            sketches = self.sketches.locate(*key, whole_first, whole_last)
+            sketch_spans.append((self.sketches.offsets[sketches.start], self.sketches.offsets[sketches.stop]))
+            sketch_groups.append(group)
+        rows = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        sketch_spans = np.array(sketch_spans, dtype=np.int64).reshape(-1, 2)
+        raw = self.values[concat_ranges(rows[:, 0], rows[:, 1])].astype(np.float64)
+        raw_groups = np.repeat(np.array(row_groups, dtype=np.int64), rows[:, 1] - rows[:, 0])
+        valid = ~np.isnan(raw)
+        gathered = concat_ranges(sketch_spans[:, 0], sketch_spans[:, 1])
+        quartiles = weighted_quantiles(
+            np.concatenate((raw[valid], self.sketches.values[gathered] if len(gathered) else [])),
+            np.concatenate((np.ones(valid.sum()), self.sketches.weights[gathered] if len(gathered) else [])),
+            np.concatenate((raw_groups[valid], np.repeat(np.array(sketch_groups, dtype=np.int64),
+                                                         sketch_spans[:, 1] - sketch_spans[:, 0]))),
+            n_groups, [0.25, 0.5, 0.75])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+            std = np.sqrt(np.clip((sumsq - total * mean) / (count - 1), 0, None))
+        result = pd.DataFrame(
+            [key for key in group_keys] if group_keys else None,
+            columns=['cell_id', 'pi'] if by_cell else ['pi'],
+        )
+        result['count'] = count
+        result['mean'] = mean
+        result['std'] = std
+        result['min'] = minimum
+        result['25%'], result['50%'], result['75%'] = quartiles.T
+        result['max'] = maximum
+        return result[result['count'] > 0].reset_index(drop=True)
+
+    def baselines(self, window, method='zscore', keys=None, since=None, frequency='H'):
+        """
+        Compare the latest bucket of each series with the buckets before it.
+
+        The last `window` + 1 buckets of each series are gathered from the rollup
+        into a (series, buckets) matrix aligned on the series' latest bucket, and
+        the buckets before the latest are reduced with `window_stats`. Series are
+        processed BASELINE_CHUNK_SIZE at a time, without a Python-level loop over
+        them, so a scan of every series takes one pass over their recent buckets.
+
+        Args:
+            window (int): Number of buckets before the latest one that form its baseline.
+            method (str): 'zscore' or 'mad', see `window_stats`.
+            keys (list, optional): (cell_id, pi) of the series to compare; all series if omitted.
+            since (datetime, optional): Skip the series whose latest bucket is older.
+            frequency (str): One of ROLLUP_FREQUENCIES.
+
+        Returns:
+            pd.DataFrame: 'cell_id', 'pi', 'date_time' (label of the latest bucket),
+            'value' (its mean), 'baseline', 'scale' and 'periods' (non-empty buckets in
+            the baseline) columns, one row per series with data. The cell and PI
+            columns are categoricals.
+
+        """
+        rollup = self.rollups[frequency]
+        if keys is None:
+            keys = self.keys
+            bounds = np.column_stack((rollup.block_starts[:-1], rollup.block_starts[1:]))
+        else:
+            bounds = np.array([rollup.blocks.get(key, (0, 0)) for key in keys], dtype=np.int64).reshape(-1, 2)
+        keep = bounds[:, 1] > bounds[:, 0]
+        if since is not None:
+            keep[keep] = rollup.labels[bounds[keep, 1] - 1] >= pd.Timestamp(since).to_datetime64()
+        keys = list(itertools.compress(keys, keep))
+        bounds = bounds[keep]
+        latest = rollup.labels[bounds[:, 1] - 1]
+        width = _BUCKET_WIDTHS[frequency]
+        columns = {name: np.full(len(keys), np.nan) for name in ['value', 'baseline', 'scale']}
+        columns['periods'] = np.zeros(len(keys), dtype=np.int64)
+        for lo in range(0, len(keys), BASELINE_CHUNK_SIZE):
+            starts, stops = bounds[lo:lo + BASELINE_CHUNK_SIZE].T
+            # The last window + 1 buckets of each series; a series' buckets are unique and sorted by label
+            positions = stops[:, None] - 1 + np.arange(-window, 1)
+            valid = positions >= starts[:, None]
+            positions = np.where(valid, positions, stops[:, None] - 1)
+            # Place each bucket by its distance to the latest one, dropping those older than the window
+            slots = window - (latest[lo:lo + BASELINE_CHUNK_SIZE, None] - rollup.labels[positions]) // width
+            valid &= (slots >= 0) & (rollup.count[positions] > 0)
+            rows = np.broadcast_to(np.arange(len(starts))[:, None], positions.shape)
+            matrix = np.full(positions.shape, np.nan)
+            matrix[rows[valid], slots[valid]] = rollup.sum[positions[valid]] / rollup.count[positions[valid]]
+            center, scale, periods = window_stats(matrix[:, :-1], method)
+            chunk = slice(lo, lo + len(starts))
+            columns['value'][chunk] = matrix[:, -1]
+            columns['baseline'][chunk] = center
+            columns['scale'][chunk] = scale
+            columns['periods'][chunk] = periods
+        return pd.DataFrame({
+            'cell_id': pd.Categorical([key[0] for key in keys]),
+            'pi': pd.Categorical([key[1] for key in keys]),
+            'date_time': latest,
+            **columns,
+        })
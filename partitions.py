@@ -0,0 +1,398 @@
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+
+import duckdb
+import pandas as pd
+
+# Number of cell hash buckets of a new dataset
+default_cell_buckets = 16
+
+# Files smaller than this are merged by compaction, in megabytes
+default_small_file_mb = 32
+
+# Files replaced by compaction are deleted this many seconds later, once readers have moved on to the new ones
+default_grace_seconds = 15 * 60
+
+# Column types of the KPI table
+column_types = [('date_time', 'TIMESTAMP'), ('cell_id', 'VARCHAR'), ('kpi_category', 'VARCHAR'), ('pi', 'VARCHAR'),
+                ('value', 'FLOAT')]
+
+# Connection of each process by configuration, opened on first use; forked processes open their own
+_connections = {}
+
+
+def connect(config):
+    """
+    Get this process's DuckDB connection for a configuration.
+
+    Args:
+        config (tuple): (name, value) pairs of DuckDB settings.
+
+    Returns:
+        duckdb.DuckDBPyConnection: An in-memory database; use a cursor of it per query.
+
+    """
+    key = (os.getpid(), config)
+    connection = _connections.get(key)
+    if connection is None:
+        connection = _connections[key] = duckdb.connect(config=dict(config))
+    return connection
+
+
+def sql_string(value):
+    """
+    Quote a string as an SQL literal.
+
+    Args:
+        value (str): String to quote.
+
+    Returns:
+        str: The literal.
+
+    """
+    return "'" + value.replace("'", "''") + "'"
+
+
+def sql_files(paths):
+    """
+    Build the SQL list of a set of file paths, for `read_parquet`.
+
+    Args:
+        paths (list): File paths.
+
+    Returns:
+        str: The list literal.
+
+    """
+    return '[' + ', '.join(sql_string(path) for path in paths) + ']'
+
+
+def read_source(path):
+    """
+    Build the SQL reading the KPI rows of a CSV or Parquet file.
+
+    Args:
+        path (str): Path of the file; files ending in '.parquet' are read as Parquet.
+
+    Returns:
+        str: A SELECT statement with the KPI table's columns and types.
+
+    """
+    columns = ', '.join(f'CAST({name} AS {sql_type}) AS {name}' for name, sql_type in column_types)
+    if path.endswith('.parquet'):
+        return f'SELECT {columns} FROM read_parquet({sql_string(path)}, hive_partitioning = false)'
+    types = ', '.join(f'{sql_string(name)}: {sql_string(sql_type)}' for name, sql_type in column_types)
+    return f'SELECT {columns} FROM read_csv({sql_string(path)}, header = true, types = {{{types}}})'
+
+
+def cell_bucket(cell_id, n_buckets):
+    """
+    Hash a cell ID to its bucket, the same way in every process.
+
+    Args:
+        cell_id (str): Cell ID.
+        n_buckets (int): Number of buckets.
+
+    Returns:
+        int: The bucket, between 0 and n_buckets - 1.
+
+    """
+    return int(hashlib.md5(str(cell_id).encode()).hexdigest()[:8], 16) % n_buckets
+
+
+def parse_partition(key):
+    """
+    Split a partition directory into its month and cell bucket.
+
+    Args:
+        key (str): Partition directory, e.g. 'month=2023-01/cell_bucket=3'.
+
+    Returns:
+        tuple: (month as 'YYYY-MM', cell bucket).
+
+    """
+    month, bucket = key.split('/')
+    return month.split('=', 1)[1], int(bucket.split('=', 1)[1])
+
+
+class PartitionedDataset:
+    """
+    KPI rows in Parquet files partitioned by month and by a hash of the cell ID.
+
+    The files of a partition live in a 'month=YYYY-MM/cell_bucket=N' directory
+    and are sorted by cell, PI and time, so that a query for a few cells and a
+    date range only opens the files of the partitions it overlaps, and skips
+    most of their row groups.
+
+    A manifest lists the live files of every partition. Appends and compactions
+    write their files first and then replace the manifest atomically, under a
+    lock, so readers always see a complete and consistent set of files. Files
+    replaced by a compaction are retired, and deleted only after a grace period
+    so that readers holding the previous manifest can finish.
+
+    Args:
+        path (str): Directory of the dataset.
+        config (tuple): (name, value) pairs of DuckDB settings.
+
+    """
+
+    # Layout of the files; part of the cache name of datasets converted from CSV so older layouts are rebuilt
+    format_version = 1
+    manifest_name = '_manifest.json'
+
+    def __init__(self, path, config=()):
+        self.path = path
+        self.config = config
+
+    @classmethod
+    def create(cls, path, cell_buckets=default_cell_buckets, config=()):
+        """
+        Create an empty dataset, unless one exists.
+
+        Args:
+            path (str): Directory of the dataset.
+            cell_buckets (int): Number of cell hash buckets.
+            config (tuple): (name, value) pairs of DuckDB settings.
+
+        Returns:
+            PartitionedDataset: The dataset.
+
+        """
+        dataset = cls(path, config)
+        os.makedirs(path, exist_ok=True)
+        with dataset._locked():
+            if not os.path.exists(os.path.join(path, cls.manifest_name)):
+                dataset._write_manifest({'version': 0, 'cell_buckets': cell_buckets, 'partitions': {}, 'retired': {}})
+        return dataset
+
+    def read_manifest(self):
+        """
+        Read the current manifest.
+
+        Returns:
+            dict: 'version', 'cell_buckets', 'partitions' (the live files of each
+            partition directory, relative to the dataset) and 'retired' (the time
+            each replaced file was retired at).
+
+        """
+        with open(os.path.join(self.path, self.manifest_name)) as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        manifest['version'] += 1
+        tmp_path = os.path.join(self.path, f'{self.manifest_name}.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(self.path, self.manifest_name))
+
+    @contextmanager
+    def _locked(self):
+        """
+        Hold the dataset's lock, which serializes changes to the manifest across processes.
+
+        """
+        with open(os.path.join(self.path, '_manifest.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def files(self, manifest, cell_ids=None, start_date=None, end_date=None):
+        """
+        List the live files of the partitions that may hold some cells' rows within a date range.
+
+        Args:
+            manifest (dict): Manifest, as returned by `read_manifest`.
+            cell_ids (list, optional): Cell IDs; all cells if omitted.
+            start_date (datetime, optional): Inclusive start of the range.
+            end_date (datetime, optional): Inclusive end of the range.
+
+        Returns:
+            list: Full paths of the files.
+
+        """
+        buckets = None if cell_ids is None else {cell_bucket(cell_id, manifest['cell_buckets']) for cell_id in cell_ids}
+        first = None if start_date is None else pd.Timestamp(start_date).strftime('%Y-%m')
+        last = None if end_date is None else pd.Timestamp(end_date).strftime('%Y-%m')
+        paths = []
+        for key, files in manifest['partitions'].items():
+            month, bucket = parse_partition(key)
+            if (first is None or month >= first) and (last is None or month <= last) \
+                    and (buckets is None or bucket in buckets):
+                paths += [os.path.join(self.path, file) for file in files]
+        return paths
+
+    def write(self, source):
+        """
+        Append rows to the dataset, as new files in their partitions.
+
+        Args:
+            source (str): SELECT statement with the KPI table's columns, e.g. from `read_source`.
+
+        Returns:
+            int: Number of files added.
+
+        """
+        n_buckets = self.read_manifest()['cell_buckets']
+        staging = os.path.join(self.path, f'_staging-{uuid.uuid4().hex}')
+        with connect(self.config).cursor() as cursor:
+            cells = cursor.execute(f'SELECT DISTINCT cell_id FROM ({source}) WHERE cell_id IS NOT NULL').df()['cell_id']
+            cursor.register('cell_buckets', pd.DataFrame({
+                'cell_id': cells, 'cell_bucket': [cell_bucket(cell_id, n_buckets) for cell_id in cells]}))
+            cursor.execute(f"""
+                COPY (
+                    SELECT s.*, strftime(s.date_time, '%Y-%m') AS month, coalesce(b.cell_bucket, 0) AS cell_bucket
+                    FROM ({source}) s LEFT JOIN cell_buckets b ON s.cell_id = b.cell_id
+                    WHERE s.date_time IS NOT NULL
+                    ORDER BY s.cell_id, s.pi, s.date_time
+                ) TO {sql_string(staging)} (FORMAT PARQUET, PARTITION_BY (month, cell_bucket), COMPRESSION ZSTD)
+            """)
+        # Move the files into their partitions under unique names, then publish them
+        added = {}
+        for directory, _, names in os.walk(staging):
+            key = os.path.relpath(directory, staging)
+            for name in names:
+                os.makedirs(os.path.join(self.path, key), exist_ok=True)
+                file = f'{key}/part-{uuid.uuid4().hex}.parquet'
+                os.rename(os.path.join(directory, name), os.path.join(self.path, file))
+                added.setdefault(key, []).append(file)
+        shutil.rmtree(staging, ignore_errors=True)
+        with self._locked():
+            manifest = self.read_manifest()
+            for key, files in added.items():
+                manifest['partitions'].setdefault(key, []).extend(files)
+            self._write_manifest(manifest)
+        return sum(len(files) for files in added.values())
+
+    def compact(self, small_file_mb=default_small_file_mb, grace_seconds=default_grace_seconds):
+        """
+        Merge the small files of every partition, such as those left by appends, into one file each.
+
+        Args:
+            small_file_mb (float): Files smaller than this many megabytes are merged.
+            grace_seconds (float): Delay before the merged files are deleted.
+
+        Returns:
+            int: Number of files merged.
+
+        """
+        merged = 0
+        for key, files in self.read_manifest()['partitions'].items():
+            small = [file for file in files if os.path.getsize(os.path.join(self.path, file)) < small_file_mb * 1024 ** 2]
+            if len(small) < 2:
+                continue
+            file = f'{key}/part-{uuid.uuid4().hex}.parquet'
+            # Written under a name no manifest lists, then renamed into place
+            tmp_path = os.path.join(self.path, f'{file}.tmp')
+            with connect(self.config).cursor() as cursor:
+                cursor.execute(f"""
+                    COPY (
+                        SELECT * FROM read_parquet({sql_files([os.path.join(self.path, f) for f in small])},
+                                                   hive_partitioning = false, union_by_name = true)
+                        ORDER BY cell_id, pi, date_time
+                    ) TO {sql_string(tmp_path)} (FORMAT PARQUET, COMPRESSION ZSTD)
+                """)
+            os.rename(tmp_path, os.path.join(self.path, file))
+            with self._locked():
+                manifest = self.read_manifest()
+                live = manifest['partitions'].get(key, [])
+                if not set(small) <= set(live):
+                    # Another compaction merged some of the files first
+                    os.remove(os.path.join(self.path, file))
+                    continue
+                manifest['partitions'][key] = [f for f in live if f not in small] + [file]
+                manifest['retired'].update({f: time.time() for f in small})
+                self._write_manifest(manifest)
+            merged += len(small)
+        self.remove_retired(grace_seconds)
+        return merged
+
+    def remove_retired(self, grace_seconds=default_grace_seconds):
+        """
+        Delete the files retired more than a grace period ago, and files left behind by interrupted writes.
+
+        Args:
+            grace_seconds (float): Minimum age of the files to delete, in seconds.
+
+        """
+        now = time.time()
+        with self._locked():
+            manifest = self.read_manifest()
+            expired = [file for file, retired in manifest['retired'].items() if now - retired >= grace_seconds]
+            for file in expired:
+                if os.path.exists(os.path.join(self.path, file)):
+                    os.remove(os.path.join(self.path, file))
+                del manifest['retired'][file]
+            if expired:
+                self._write_manifest(manifest)
+            known = {file for files in manifest['partitions'].values() for file in files} | set(manifest['retired'])
+            for directory, _, names in os.walk(self.path):
+                for name in names:
+                    full_path = os.path.join(directory, name)
+                    file = os.path.relpath(full_path, self.path)
+                    if directory != self.path and file not in known and now - os.path.getmtime(full_path) >= grace_seconds:
+                        os.remove(full_path)
+
+
+def create_dataset(source_path, path, cell_buckets=default_cell_buckets, config=()):
+    """
+    Convert a KPI CSV or Parquet file to a partitioned dataset, without loading it into memory.
+
+    The dataset is written under a temporary name and renamed into place.
+
+    Args:
+        source_path (str): Path of the file to convert.
+        path (str): Directory of the dataset. Left untouched if it already exists.
+        cell_buckets (int): Number of cell hash buckets.
+        config (tuple): (name, value) pairs of DuckDB settings.
+
+    """
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    PartitionedDataset.create(tmp_path, cell_buckets, config).write(read_source(source_path))
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # Another process converted the same file first
+        shutil.rmtree(tmp_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain a KPI dataset partitioned by month and cell hash.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    convert = commands.add_parser('convert', help='convert a CSV or Parquet file to a new dataset')
+    convert.add_argument('source', help='CSV or Parquet file with the columns of data/5G_NR_data.csv')
+    convert.add_argument('dataset', help='directory of the dataset to create')
+    convert.add_argument('--cell-buckets', type=int, default=default_cell_buckets, help='number of cell hash buckets')
+    append = commands.add_parser('append', help='append CSV or Parquet files to a dataset')
+    append.add_argument('dataset', help='directory of the dataset')
+    append.add_argument('sources', nargs='+', help='CSV or Parquet files to append')
+    compact = commands.add_parser('compact', help='merge the small files of every partition')
+    compact.add_argument('dataset', help='directory of the dataset')
+    compact.add_argument('--small-file-mb', type=float, default=default_small_file_mb,
+                         help='files smaller than this are merged')
+    compact.add_argument('--grace-minutes', type=float, default=default_grace_seconds / 60,
+                         help='delay before merged files are deleted')
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        create_dataset(args.source, args.dataset, args.cell_buckets)
+        print(f'Wrote {args.dataset}')
+    elif args.command == 'append':
+        dataset = PartitionedDataset(args.dataset)
+        for source in args.sources:
+            print(f'Appended {source} as {dataset.write(read_source(source))} files')
+    else:
+        merged = PartitionedDataset(args.dataset).compact(args.small_file_mb, args.grace_minutes * 60)
+        print(f'Merged {merged} files')
+
+
+if __name__ == '__main__':
+    main()
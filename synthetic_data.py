@@ -0,0 +1,185 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# PI templates: (name, KPI category, kind, typical value at zero load, change at full load)
+pi_templates = [
+    ('DL_Throughput_Mbps', 'Throughput', 'volume', 5.0, 900.0),
+    ('UL_Throughput_Mbps', 'Throughput', 'volume', 1.0, 120.0),
+    ('PRB_Utilization_DL', 'Utilization', 'percent', 2.0, 85.0),
+    ('PRB_Utilization_UL', 'Utilization', 'percent', 1.0, 60.0),
+    ('RRC_Setup_Success_Rate', 'Accessibility', 'percent', 99.9, -1.5),
+    ('ERAB_Setup_Success_Rate', 'Accessibility', 'percent', 99.8, -2.0),
+    ('Call_Drop_Rate', 'Retainability', 'percent', 0.05, 1.2),
+    ('Intra_Freq_HO_Success_Rate', 'Mobility', 'percent', 99.5, -3.0),
+    ('Avg_Active_Users', 'Traffic', 'volume', 0.5, 150.0),
+    ('DL_Latency_ms', 'Integrity', 'volume', 8.0, 25.0),
+]
+
+
+def kpi_catalog(n_pis):
+    """
+    Build the list of PIs of a synthetic dataset.
+
+    The PI templates are used in turn; beyond the first round, their names get
+    a numeric suffix.
+
+    Args:
+        n_pis (int): Number of PIs.
+
+    Returns:
+        list: (name, KPI category, kind, value at zero load, change at full load) per PI.
+
+    """
+    catalog = []
+    for i in range(n_pis):
+        name, category, kind, base, span = pi_templates[i % len(pi_templates)]
+        suffix = i // len(pi_templates)
+        catalog.append((f'{name}_{suffix}' if suffix else name, category, kind, base, span))
+    return catalog
+
+
+def cell_load(times, n_cells, rng):
+    """
+    Model the traffic load of cells over time, between 0 and 1.
+
+    Load follows a daily profile peaking in the evening and a quieter weekend,
+    scaled by a per-cell busyness and shifted by a per-cell phase, with noise.
+
+    Args:
+        times (pd.DatetimeIndex): Timestamps of the samples.
+        n_cells (int): Number of cells.
+        rng (np.random.Generator): Random number generator.
+
+    Returns:
+        np.ndarray: Load of shape (n_cells, len(times)).
+
+    """
+    hours = np.asarray(times.hour + times.minute / 60, dtype=np.float64)
+    weekend = np.asarray(times.dayofweek >= 5)
+    busyness = rng.uniform(0.3, 1.0, (n_cells, 1))
+    phase = rng.normal(0, 1.5, (n_cells, 1))
+    # Busiest around 20:00 and quietest twelve hours earlier
+    daily = 0.55 + 0.45 * np.cos(2 * np.pi * (hours - 20 - phase) / 24)
+    daily = daily * np.where(weekend, 0.8, 1.0)
+    noise = rng.normal(0, 0.05, (n_cells, len(times)))
+    return np.clip(busyness * daily + noise, 0, 1)
+
+
+def generate_kpi_frame(cell_ids, catalog, times, rng, missing=0.01, anomalies=0.001):
+    """
+    Generate long-format KPI rows for a group of cells.
+
+    Every PI is derived from the cells' load: volumes and utilization grow with
+    it and success rates degrade with it. A small share of samples is missing
+    and a smaller one is an anomaly far off the expected value.
+
+    Args:
+        cell_ids (list): Cell IDs to generate rows for.
+        catalog (list): PIs, as returned by `kpi_catalog`.
+        times (pd.DatetimeIndex): Timestamps of the samples.
+        rng (np.random.Generator): Random number generator.
+        missing (float): Share of samples left out.
+        anomalies (float): Share of samples replaced by anomalies.
+
+    Returns:
+        pd.DataFrame: Rows with 'date_time', 'cell_id', 'kpi_category', 'pi' and 'value' columns.
+
+    """
+    n_cells, n_times = len(cell_ids), len(times)
+    load = cell_load(times, n_cells, rng)
+    values = np.empty((n_cells, len(catalog), n_times), dtype=np.float32)
+    for j, (_, _, kind, base, span) in enumerate(catalog):
+        scale = rng.uniform(0.7, 1.3, (n_cells, 1))
+        value = base + span * scale * load
+        value = value + rng.normal(0, 0.03 * abs(span), (n_cells, n_times))
+        # Anomalies are three times as far from the zero-load value as at full load
+        value[rng.random((n_cells, n_times)) < anomalies] = base + 3 * span
+        value = np.clip(value, 0, 100) if kind == 'percent' else np.maximum(value, 0)
+        values[:, j] = value
+    names = pd.Categorical([name for name, *_ in catalog])
+    categories = pd.Categorical([category for _, category, *_ in catalog])
+    df = pd.DataFrame({
+        'date_time': np.tile(times.to_numpy(), n_cells * len(catalog)),
+        'cell_id': pd.Categorical(cell_ids).repeat(len(catalog) * n_times),
+        'kpi_category': np.tile(categories.repeat(n_times), n_cells),
+        'pi': np.tile(names.repeat(n_times), n_cells),
+        'value': values.ravel().round(3),
+    })
+    if missing:
+        df = df[rng.random(len(df)) >= missing]
+    return df
+
+
+def generate_kpi_data(n_cells=100, n_pis=10, start='2023-01-01', periods=24 * 90, freq='H', seed=0,
+                      missing=0.01, chunk_cells=20):
+    """
+    Generate a synthetic 5G NR KPI dataset, a group of cells at a time.
+
+    Args:
+        n_cells (int): Number of cells.
+        n_pis (int): Number of PIs per cell.
+        start (str): First timestamp.
+        periods (int): Number of samples per cell and PI.
+        freq (str): Sampling frequency.
+        seed (int): Seed of the random number generator.
+        missing (float): Share of samples left out.
+        chunk_cells (int): Number of cells generated at once, which bounds memory use.
+
+    Yields:
+        pd.DataFrame: Rows of the next group of cells.
+
+    """
+    rng = np.random.default_rng(seed)
+    catalog = kpi_catalog(n_pis)
+    times = pd.date_range(start, periods=periods, freq=freq)
+    cell_ids = [f'CELL_{i:0{max(4, len(str(n_cells - 1)))}d}' for i in range(n_cells)]
+    for i in range(0, n_cells, chunk_cells):
+        yield generate_kpi_frame(cell_ids[i:i + chunk_cells], catalog, times, rng, missing=missing)
+
+
+def write_kpi_csv(path, **kwargs):
+    """
+    Write a synthetic KPI dataset to a CSV file in the dashboard's format.
+
+    Args:
+        path (str): Path of the CSV file.
+        **kwargs: Options passed to `generate_kpi_data`.
+
+    Returns:
+        int: Number of rows written.
+
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    rows = 0
+    with open(tmp_path, 'w', newline='') as f:
+        for df in generate_kpi_data(**kwargs):
+            df.to_csv(f, index=False, header=not rows, date_format='%Y-%m-%d %H:%M:%S')
+            rows += len(df)
+    # Readers never see a partly written file
+    os.replace(tmp_path, path)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic 5G NR KPI dataset.')
+    parser.add_argument('output', help='path of the CSV file to write')
+    parser.add_argument('--cells', type=int, default=100, help='number of cells')
+    parser.add_argument('--pis', type=int, default=10, help='number of PIs per cell')
+    parser.add_argument('--days', type=float, default=90, help='number of days covered')
+    parser.add_argument('--freq', default='H', help='sampling frequency')
+    parser.add_argument('--start', default='2023-01-01', help='first timestamp')
+    parser.add_argument('--missing', type=float, default=0.01, help='share of samples left out')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+    periods = int(pd.Timedelta(days=args.days) / pd.Timedelta(pd.tseries.frequencies.to_offset(args.freq)))
+    rows = write_kpi_csv(args.output, n_cells=args.cells, n_pis=args.pis, start=args.start, periods=periods,
+                         freq=args.freq, seed=args.seed, missing=args.missing)
+    print(f'Wrote {rows} rows to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
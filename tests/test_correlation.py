@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from correlation import correlation_matrix, pairwise_correlation
+
+
+def correlated_matrix(n_rows=500, seed=0):
+    """
+    Build a matrix of partly correlated columns, with missing values and a constant column.
+
+    Args:
+        n_rows (int): Number of rows.
+        seed (int): Seed of the random number generator.
+
+    Returns:
+        np.ndarray: (n_rows, 6) matrix with NaN for missing values.
+
+    """
+    rng = np.random.default_rng(seed)
+    base = rng.normal(size=(n_rows, 1))
+    matrix = base * rng.uniform(-2, 2, 5) + rng.normal(size=(n_rows, 5))
+    matrix[rng.random(matrix.shape) < 0.2] = np.nan
+    # Shifted far from zero, where sums of squares lose precision unless the columns are centered
+    matrix[:, 0] += 1e6
+    return np.column_stack((matrix, np.full(n_rows, 3.0)))
+
+
+def test_pearson_matches_pandas():
+    matrix = correlated_matrix()
+    correlation, count = correlation_matrix(matrix)
+    frame = pd.DataFrame(matrix)
+    np.testing.assert_allclose(correlation, frame.corr(min_periods=3).to_numpy(), rtol=1e-9, atol=1e-12)
+    present = frame.notna().to_numpy().astype(np.int64)
+    np.testing.assert_array_equal(count, present.T @ present)
+
+
+def test_min_periods_matches_pandas():
+    matrix = correlated_matrix(n_rows=12, seed=1)
+    correlation, _ = correlation_matrix(matrix, min_periods=9)
+    np.testing.assert_allclose(correlation, pd.DataFrame(matrix).corr(min_periods=9).to_numpy(), rtol=1e-9, atol=1e-12)
+
+
+def test_pairwise_matches_pandas():
+    matrix = correlated_matrix(seed=2)
+    correlation, _ = pairwise_correlation(matrix[:, :2], matrix[:, 2:])
+    expected = pd.DataFrame(matrix).corr(min_periods=3).to_numpy()[:2, 2:]
+    np.testing.assert_allclose(correlation, expected, rtol=1e-9, atol=1e-12)
+
+
+def test_spearman_matches_pandas_without_missing_values():
+    rng = np.random.default_rng(3)
+    # Rounded, so that the ranks have ties
+    matrix = np.round(rng.normal(size=(300, 1)) + rng.normal(size=(300, 4)), 1)
+    correlation, _ = correlation_matrix(matrix, method='spearman')
+    np.testing.assert_allclose(correlation, pd.DataFrame(matrix).corr(method='spearman').to_numpy(), rtol=1e-9)
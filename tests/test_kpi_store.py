@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from kpi_store import ROLLUP_FREQUENCIES, KPIStore
+
+# Every statistic `KPIStore.rollup` shares with pandas' resampling
+RESAMPLE_STATS = ['count', 'sum', 'min', 'max', 'mean', 'std']
+
+
+def kpi_frame(cells, pis, start='2023-01-02', periods=6 * 24 * 30, seed=0):
+    """
+    Build a long-format KPI DataFrame sampled every 10 minutes, with missing rows and NaN values.
+
+    Args:
+        cells (list): Cell IDs.
+        pis (list): Performance Indicators, each in a KPI category named after it.
+        start (str): First timestamp.
+        periods (int): Number of samples per cell and PI before rows are dropped.
+        seed (int): Seed of the random number generator.
+
+    Returns:
+        pd.DataFrame: Rows in random order.
+
+    """
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(start, periods=periods, freq='10min')
+    index = pd.MultiIndex.from_product([cells, pis, times], names=['cell_id', 'pi', 'date_time'])
+    df = index.to_frame(index=False)
+    df['kpi_category'] = 'cat_' + df['pi']
+    df['value'] = rng.normal(50, 10, len(df)).round(3)
+    df.loc[rng.random(len(df)) < 0.01, 'value'] = np.nan
+    df = df[rng.random(len(df)) > 0.05]
+    return df.sample(frac=1, random_state=seed)[KPIStore.columns].reset_index(drop=True)
+
+
+def as_plain(df):
+    """
+    Turn a store's categorical columns into strings, so stores with different dictionaries compare equal.
+
+    Args:
+        df (pd.DataFrame): Output of `KPIStore.query` or `KPIStore.rollup`.
+
+    Returns:
+        pd.DataFrame: The same rows with object columns.
+
+    """
+    return df.astype({column: object for column in ['cell_id', 'kpi_category', 'pi'] if column in df})
+
+
+def sketch_of(sketches, key):
+    """
+    Return the days, values and weights of every sketch of one series.
+
+    Args:
+        sketches (kpi_store.QuantileSketches): Sketches to read.
+        key (tuple): (cell_id, pi) of the series.
+
+    Returns:
+        list: (day, values, weights) of each sketch, in day order.
+
+    """
+    start, stop = sketches.blocks[key]
+    return [(sketches.labels[i],
+             sketches.values[sketches.offsets[i]:sketches.offsets[i + 1]],
+             sketches.weights[sketches.offsets[i]:sketches.offsets[i + 1]]) for i in range(start, stop)]
+
+
+@pytest.fixture(scope='module')
+def frame():
+    return kpi_frame(['CELL_0000', 'CELL_0001', 'CELL_0002'], ['PI_A', 'PI_B'])
+
+
+@pytest.fixture(scope='module')
+def appended(frame):
+    """
+    Split the rows of a dataset between a base store and the rows appended to it.
+
+    The appended rows hold a new cell, a new PI (with a new KPI category) and a
+    random tenth of the base series' rows, which are backfilled into their blocks.
+
+    """
+    extra = kpi_frame(['CELL_0000', 'CELL_0001', 'CELL_0002', 'CELL_0003'], ['PI_A', 'PI_B', 'PI_C'], seed=1)
+    extra = extra[(extra['cell_id'] == 'CELL_0003') | (extra['pi'] == 'PI_C')]
+    backfill = np.random.default_rng(2).random(len(frame)) < 0.1
+    base = KPIStore.from_frame(frame[~backfill])
+    # Build the sketches first, so the append updates them rather than building them anew
+    base.sketches
+    full = pd.concat([frame, extra], ignore_index=True)
+    return base.append(pd.concat([frame[backfill], extra], ignore_index=True)), KPIStore.from_frame(full), full
+
+
+def test_append_matches_rebuild(appended):
+    store, rebuilt, full = appended
+    cells, pis = sorted(full['cell_id'].unique()), sorted(full['pi'].unique())
+    assert len(store) == len(rebuilt) == len(full)
+    assert sorted(store.keys) == sorted(rebuilt.keys)
+    pd.testing.assert_frame_equal(as_plain(store.query(cells, pis)), as_plain(rebuilt.query(cells, pis)))
+
+
+@pytest.mark.parametrize('frequency', ROLLUP_FREQUENCIES)
+def test_append_matches_rebuild_rollups(appended, frequency):
+    store, rebuilt, full = appended
+    cells, pis = sorted(full['cell_id'].unique()), sorted(full['pi'].unique())
+    start, end = full['date_time'].min(), full['date_time'].max()
+    pd.testing.assert_frame_equal(as_plain(store.rollup(cells, pis, start, end, frequency)),
+                                  as_plain(rebuilt.rollup(cells, pis, start, end, frequency)))
+
+
+def test_append_matches_rebuild_sketches(appended):
+    store, rebuilt, _ = appended
+    for key in rebuilt.keys:
+        expected, actual = sketch_of(rebuilt.sketches, key), sketch_of(store.sketches, key)
+        assert [day for day, _, _ in actual] == [day for day, _, _ in expected]
+        for (_, values, weights), (_, expected_values, expected_weights) in zip(actual, expected):
+            np.testing.assert_array_equal(values, expected_values)
+            np.testing.assert_array_equal(weights, expected_weights)
+
+
+@pytest.mark.parametrize('frequency', ROLLUP_FREQUENCIES)
+def test_rollup_matches_resample(frame, frequency):
+    store = KPIStore.from_frame(frame)
+    # A range that cuts the first and last buckets of every frequency
+    start, end = pd.Timestamp('2023-01-04 05:30'), pd.Timestamp('2023-01-25 17:15')
+    cells, pis = ['CELL_0000', 'CELL_0002'], ['PI_A', 'PI_B']
+    result = store.rollup(cells, pis, start, end, frequency)
+    rows = frame[frame['cell_id'].isin(cells) & frame['pi'].isin(pis) & frame['date_time'].between(start, end)]
+    expected = (rows.set_index('date_time').sort_index().groupby(['cell_id', 'pi'])
+                .resample(frequency)['value'].agg(RESAMPLE_STATS).reset_index())
+    expected['count'] = expected['count'].astype(np.float64)
+    pd.testing.assert_frame_equal(as_plain(result)[['cell_id', 'pi', 'date_time'] + RESAMPLE_STATS], expected,
+                                  check_exact=False, rtol=1e-9)